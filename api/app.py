@@ -0,0 +1,127 @@
+"""
+RAG查询服务（FastAPI）
+启动时加载一次Embedding模型、向量库和索引目录，之后所有请求共享；
+向量化和检索放在有界线程池中执行，事件循环只负责收发请求，不会被模型推理阻塞；
+问答用异步LLM客户端等待回答，单个进程可以同时为大量请求等待生成。
+
+用法：
+    python -m api.app                                  # 监听 127.0.0.1:8000
+    python -m api.app --host 0.0.0.0 --port 9000
+    uvicorn api.app:app --workers 4                    # 多进程（numpy后端总是只读映射，各进程共享同一份向量）
+
+接口：
+    POST /retrieve   {"query": "...", "top_k": 5}       混合检索
+    POST /answer     {"query": "...", "use_llm": true}  RAG问答
+    POST /answer/stream                                 流式RAG问答（SSE，回答逐段推送）
+    GET  /stats                                         请求与缓存统计
+    GET  /health
+"""
+
+import sys
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# 处理 rag-system 目录的导入（目录名包含连字符，不能直接导入）
+import importlib.util
+rag_system_path = project_root / "rag-system"
+rag_system_init = rag_system_path / "__init__.py"
+if rag_system_init.exists():
+    spec = importlib.util.spec_from_file_location("rag_system", rag_system_init)
+    rag_system_module = importlib.util.module_from_spec(spec)
+    sys.modules["rag_system"] = rag_system_module
+    spec.loader.exec_module(rag_system_module)
+    # 导入子模块
+    for module_file in ["config", "embedding_cache", "lru_cache", "onnx_backend", "micro_batcher", "embedding_server", "m3_vectors", "embedding", "bm25_index", "numpy_store", "vector_store", "pattern_matcher", "index_catalog", "reranker", "result_cache", "semantic_cache", "retriever", "rag_chain"]:
+        module_path = rag_system_path / f"{module_file}.py"
+        if module_path.exists():
+            spec = importlib.util.spec_from_file_location(f"rag_system.{module_file}", module_path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[f"rag_system.{module_file}"] = module
+            spec.loader.exec_module(module)
+
+from fastapi import FastAPI
+
+from rag_system.config import (
+    EMBEDDING_MODEL, EMBEDDING_DEVICE, VECTOR_DB_DIR, VECTOR_DB_TYPE, COLLECTION_NAME, INDEX_DIR, QUERY_BATCH_ENABLED,
+    API_HOST, API_PORT, API_WORKER_THREADS, API_LLM_THREADS, API_MAX_CONCURRENCY
+)
+from rag_system.embedding import create_embedding_model
+from rag_system.vector_store import VectorStore
+from rag_system.retriever import HybridRetriever
+from rag_system.reranker import create_reranker
+from rag_system.result_cache import create_result_cache
+from rag_system.semantic_cache import create_semantic_cache
+from rag_system.rag_chain import RAGChain
+from api.routes import router, RequestStats
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动时加载模型与向量库，关闭时释放线程池"""
+    logger.info("正在加载模型与向量库...")
+    # 各检索线程同时到达的查询由合批线程合成一次前向
+    embedding_model = create_embedding_model(EMBEDDING_MODEL, EMBEDDING_DEVICE, query_batching=QUERY_BATCH_ENABLED)
+    # 服务只读不写：numpy后端mmap映射磁盘上的当前一代，工作进程共享页缓存，并自动切换到写入进程新写出的一代
+    vector_store = VectorStore(VECTOR_DB_DIR, COLLECTION_NAME, read_only=VECTOR_DB_TYPE == "numpy")
+    result_cache = create_result_cache()
+    retriever = HybridRetriever(
+        vector_store, embedding_model, INDEX_DIR,
+        reranker=create_reranker(),
+        result_cache=result_cache
+    )
+    app.state.retriever = retriever
+    app.state.rag_chain = RAGChain(retriever, result_cache=result_cache, semantic_cache=create_semantic_cache())
+
+    app.state.cpu_executor = ThreadPoolExecutor(max_workers=API_WORKER_THREADS, thread_name_prefix="rag-cpu")
+    app.state.llm_executor = ThreadPoolExecutor(max_workers=API_LLM_THREADS, thread_name_prefix="rag-llm")
+    app.state.limiter = asyncio.Semaphore(API_MAX_CONCURRENCY)
+    app.state.request_stats = RequestStats()
+
+    # 预热：第一次请求不必等待模型初始化
+    embedding_model.encode_query("预热")
+    logger.info(
+        f"服务就绪（文档块 {vector_store.collection.count()}，检索线程 {API_WORKER_THREADS}，"
+        f"LLM线程 {API_LLM_THREADS}，并发上限 {API_MAX_CONCURRENCY}）"
+    )
+    try:
+        yield
+    finally:
+        app.state.cpu_executor.shutdown(wait=True)
+        app.state.llm_executor.shutdown(wait=True)
+        logger.info("服务已停止")
+
+def create_app() -> FastAPI:
+    """创建FastAPI应用"""
+    app = FastAPI(title="三湘问道知识库查询服务", lifespan=lifespan)
+    app.include_router(router)
+    return app
+
+app = create_app()
+
+def main():
+    """主函数"""
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="启动RAG查询服务")
+    parser.add_argument("--host", default=API_HOST, help=f"监听地址（默认 {API_HOST}）")
+    parser.add_argument("--port", type=int, default=API_PORT, help=f"监听端口（默认 {API_PORT}）")
+    args = parser.parse_args()
+
+    uvicorn.run(app, host=args.host, port=args.port, log_config=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+API路由
+检索与问答接口：请求在事件循环中只做参数校验和排队，向量化/检索在线程池中执行；
+/answer 在事件循环中异步等待LLM回答，/answer/stream 的逐段生成在LLM线程池中执行
+"""
+
+import asyncio
+import functools
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import logging
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from rag_system.config import TOP_K, API_MAX_QUERY_CHARS, API_QUEUE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+class RetrieveRequest(BaseModel):
+    """检索请求"""
+    query: str = Field(..., min_length=1, max_length=API_MAX_QUERY_CHARS, description="查询文本")
+    top_k: int = Field(TOP_K, ge=1, le=50, description="返回结果数量")
+    layer: Optional[str] = Field(None, description="层级过滤（dao | shu）")
+    doc_type: Optional[str] = Field(None, description="文档类型过滤")
+    expand_related: bool = Field(True, description="是否扩展关联文档")
+
+class AnswerRequest(BaseModel):
+    """问答请求"""
+    query: str = Field(..., min_length=1, max_length=API_MAX_QUERY_CHARS, description="用户问题")
+    top_k: int = Field(TOP_K, ge=1, le=50, description="检索文档数量")
+    use_llm: bool = Field(True, description="是否调用LLM生成回答（否则只返回检索结果）")
+    include_docs: bool = Field(False, description="是否返回完整的检索结果")
+
+class RequestStats:
+    """请求计数（只在事件循环线程中修改，不需要加锁）"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0  # 流式请求中途被客户端断开
+        self.rejected = 0
+        self.total_ms = 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'failed': self.failed,
+            'cancelled': self.cancelled,
+            'rejected': self.rejected,
+            'avg_ms': round(self.total_ms / self.completed, 2) if self.completed else 0.0
+        }
+
+async def acquire_slot(request: Request):
+    """
+    占用一个并发名额（调用方负责 state.limiter.release()）
+
+    Raises:
+        HTTPException: 排队超过 API_QUEUE_TIMEOUT 秒时返回503
+    """
+    state = request.app.state
+    try:
+        await asyncio.wait_for(state.limiter.acquire(), timeout=API_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        state.request_stats.rejected += 1
+        raise HTTPException(status_code=503, detail="服务繁忙，请稍后重试")
+
+async def _limited(request: Request, name: str, start_call: Callable[[], Awaitable]) -> Any:
+    """在并发上限内等待 start_call() 返回的可等待对象，统一计数与错误处理"""
+    state = request.app.state
+    await acquire_slot(request)
+
+    state.request_stats.in_flight += 1
+    start = time.perf_counter()
+    try:
+        result = await start_call()
+    except Exception:
+        state.request_stats.failed += 1
+        logger.exception(f"请求处理失败: {name}")
+        raise HTTPException(status_code=500, detail="内部错误")
+    finally:
+        state.request_stats.in_flight -= 1
+        state.limiter.release()
+
+    state.request_stats.completed += 1
+    state.request_stats.total_ms += (time.perf_counter() - start) * 1000
+    return result
+
+async def run_limited(request: Request, executor, func: Callable, *args, **kwargs) -> Any:
+    """
+    在并发上限内把同步调用放到线程池执行
+
+    Args:
+        request: 当前请求（从 app.state 取得并发限制和线程池）
+        executor: 执行func的线程池
+        func: 同步函数
+
+    Raises:
+        HTTPException: 排队超过 API_QUEUE_TIMEOUT 秒时返回503
+    """
+    loop = asyncio.get_running_loop()
+    return await _limited(
+        request, func.__name__,
+        lambda: loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+    )
+
+async def await_limited(request: Request, func: Callable[..., Awaitable], *args, **kwargs) -> Any:
+    """
+    在并发上限内执行协程函数（等待IO时不占用线程）
+
+    Args:
+        request: 当前请求
+        func: 协程函数
+
+    Raises:
+        HTTPException: 排队超过 API_QUEUE_TIMEOUT 秒时返回503
+    """
+    return await _limited(request, func.__name__, lambda: func(*args, **kwargs))
+
+@router.get("/health")
+async def health(request: Request) -> Dict:
+    """存活检查"""
+    return {'status': 'ok', 'document_count': request.app.state.retriever.vector_store.collection.count()}
+
+@router.post("/retrieve")
+async def retrieve(body: RetrieveRequest, request: Request) -> Dict:
+    """混合检索"""
+    state = request.app.state
+    results: List[Dict] = await run_limited(
+        request, state.cpu_executor, state.retriever.retrieve,
+        body.query,
+        top_k=body.top_k,
+        layer=body.layer,
+        doc_type=body.doc_type,
+        expand_related=body.expand_related
+    )
+    return {'query': body.query, 'results': results}
+
+@router.post("/answer")
+async def answer(body: AnswerRequest, request: Request) -> Dict:
+    """RAG问答（检索在线程池中执行，等待LLM回答时不占用线程）"""
+    state = request.app.state
+    chain = state.rag_chain
+    result = await await_limited(
+        request, chain.aquery,
+        body.query,
+        top_k=body.top_k,
+        use_llm=body.use_llm,
+        executor=state.cpu_executor
+    )
+    response = {
+        'query': body.query,
+        'answer': result['answer'],
+        'sources': result['sources'],
+        'processed_query': result['processed_query']
+    }
+    if 'semantic_match' in result:
+        response['semantic_match'] = result['semantic_match']
+    if body.include_docs:
+        response['retrieved_docs'] = result['retrieved_docs']
+    return response
+
+class _StreamSlot:
+    """流式请求占用的并发名额与 in_flight 计数，无论响应体是否开始发送都只释放一次"""
+
+    def __init__(self, state):
+        self.state = state
+        self.start = time.perf_counter()
+        self.released = False
+        state.request_stats.in_flight += 1
+
+    def release(self, outcome: str):
+        """
+        释放名额并记录结果（重复调用为空操作）
+
+        Args:
+            outcome: completed / failed / cancelled
+        """
+        if self.released:
+            return
+        self.released = True
+        stats = self.state.request_stats
+        stats.in_flight -= 1
+        self.state.limiter.release()
+        if outcome == 'completed':
+            stats.completed += 1
+            stats.total_ms += (time.perf_counter() - self.start) * 1000
+        elif outcome == 'failed':
+            stats.failed += 1
+        else:
+            stats.cancelled += 1
+
+class _SlotStreamingResponse(StreamingResponse):
+    """响应结束（含客户端在响应体开始前断开、发送出错）时一定释放名额；未正常结束的计为 cancelled"""
+
+    def __init__(self, content, slot: _StreamSlot, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.slot.release('cancelled')
+
+def _answer_event(event: Dict, include_docs: bool) -> Dict:
+    """把 query_stream 的事件裁剪成与 /answer 一致的字段"""
+    if event['type'] == 'retrieval':
+        payload = {'type': 'retrieval', 'sources': event['sources'], 'processed_query': event['processed_query']}
+        if include_docs:
+            payload['retrieved_docs'] = event['retrieved_docs']
+        return payload
+    if event['type'] == 'done':
+        result = event['result']
+        payload = {'type': 'done', 'answer': result['answer']}
+        if 'semantic_match' in result:
+            payload['semantic_match'] = result['semantic_match']
+        return payload
+    return event
+
+@router.post("/answer/stream")
+async def answer_stream(body: AnswerRequest, request: Request) -> StreamingResponse:
+    """
+    流式RAG问答（Server-Sent Events）
+
+    依次推送 retrieval（来源与处理后的查询）、若干 token（回答片段）、done（完整回答）事件；
+    整个流期间占用一个并发名额，生成器的每一步在线程池中执行
+    """
+    state = request.app.state
+    chain = state.rag_chain
+    use_llm = body.use_llm and chain.llm is not None
+    executor = state.llm_executor if use_llm else state.cpu_executor
+    await acquire_slot(request)
+    slot = _StreamSlot(state)
+
+    try:
+        events = chain.query_stream(body.query, top_k=body.top_k, use_llm=use_llm)
+    except Exception:
+        slot.release('failed')
+        logger.exception("流式问答失败")
+        raise HTTPException(status_code=500, detail="内部错误")
+
+    async def event_source():
+        loop = asyncio.get_running_loop()
+        pending = None
+        try:
+            while True:
+                pending = loop.run_in_executor(executor, next, events, None)
+                event = await pending
+                if event is None:
+                    break
+                payload = jsonable_encoder(_answer_event(event, body.include_docs))
+                yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            slot.release('completed')
+        except Exception:
+            slot.release('failed')
+            logger.exception("流式问答失败")
+            yield f"data: {json.dumps({'type': 'error', 'detail': '内部错误'}, ensure_ascii=False)}\n\n"
+        finally:
+            # 客户端断开时关闭生成器（释放LLM连接）；不在这里等待，正在执行的一步结束后再关闭
+            if pending is not None and not pending.done():
+                pending.add_done_callback(lambda _: executor.submit(events.close))
+            else:
+                executor.submit(events.close)
+
+    # 名额由响应对象兜底释放：生成器从未被迭代（客户端在响应体开始前断开）时也不会泄漏
+    return _SlotStreamingResponse(
+        event_source(),
+        slot,
+        media_type="text/event-stream",
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@router.get("/stats")
+async def stats(request: Request) -> Dict:
+    """运行统计（请求、缓存、重排序）"""
+    state = request.app.state
+    return {
+        'requests': state.request_stats.as_dict(),
+        'query_cache': state.retriever.embedding_model.get_query_cache_stats(),
+        'query_batching': state.retriever.embedding_model.get_query_batch_stats(),
+        'rerank': state.retriever.get_rerank_stats(),
+        'answer_cache': state.rag_chain.get_cache_stats()
+    }
@@ -0,0 +1,340 @@
+"""
+BM25稀疏索引
+对向量数据库中的同一批文档块建立词法索引：中文按字符二元组、英文/数字按整词切分，
+以CSR稀疏矩阵（块 × 词项）保存为单个 .npz 文件，随向量库的写入/删除增量更新，
+检索时由 HybridRetriever 与向量结果做RRF融合
+"""
+
+import os
+import re
+import math
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+
+import numpy as np
+
+from .config import BM25_K1, BM25_B
+
+logger = logging.getLogger(__name__)
+
+# 格式变化时递增，旧文件会被丢弃并从向量库重建
+_INDEX_FORMAT = 1
+
+# 参与过滤的元数据字段（与 HybridRetriever._build_filter 一致）
+FILTER_FIELDS = ('layer', 'doc_type')
+
+_TOKEN_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff]+|[a-z0-9]+')
+_MAX_TF = np.iinfo(np.uint16).max
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：连续汉字切成字符二元组（单字保留为一元组），英文和数字按整词
+
+    Args:
+        text: 文本
+
+    Returns:
+        词项列表（含重复）
+    """
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text.lower()):
+        if not run.isascii() and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+class BM25Index:
+    """
+    可增量更新的BM25索引
+
+    按块保存词频（CSR：行=块，列=词项），检索时按需生成倒排表；
+    覆盖写入或删除的块先打删除标记，保存时再压缩
+    """
+
+    def __init__(self, index_path: Path, k1: float = BM25_K1, b: float = BM25_B):
+        """
+        Args:
+            index_path: 索引文件路径（.npz）
+            k1: BM25词频饱和参数
+            b: BM25文档长度归一化参数
+        """
+        self.index_path = index_path
+        self.dirty_marker = index_path.with_suffix('.dirty')
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.vocab: Dict[str, int] = {}
+        self.chunk_ids: List[str] = []
+        self.row_of: Dict[str, int] = {}
+        self.field_values: Dict[str, List[str]] = {field: [] for field in FILTER_FIELDS}
+        self._field_lookup: Dict[str, Dict[str, int]] = {field: {} for field in FILTER_FIELDS}
+
+        # CSR：已合并部分 + 尚未合并的新行
+        self._row_ptr = np.zeros(1, dtype=np.int64)
+        self._terms = np.zeros(0, dtype=np.int32)
+        self._tfs = np.zeros(0, dtype=np.uint16)
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []
+
+        # 每行的长度、过滤字段编码、是否有效
+        self._lengths: List[int] = []
+        self._field_codes: Dict[str, List[int]] = {field: [] for field in FILTER_FIELDS}
+        self._alive = bytearray()
+        self._alive_count = 0
+
+        self._postings = None  # (term_ptr, rows, tfs)，写入后失效
+        self.dirty = False
+        self.file_signature: Optional[Tuple[int, int]] = None  # 读取时索引文件的 (mtime, 大小)
+
+    def __len__(self) -> int:
+        return self._alive_count
+
+    def _stat_signature(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def file_changed(self) -> bool:
+        """索引文件在上次读取后是否被（其他进程）重新保存"""
+        return self._stat_signature() != self.file_signature
+
+    @property
+    def needs_rebuild(self) -> bool:
+        """上次修改后没有正常保存（进程中断），磁盘上的索引可能与向量库不一致"""
+        return self.dirty_marker.exists()
+
+    def load(self) -> bool:
+        """
+        读取索引文件
+
+        Returns:
+            是否成功读取（文件不存在或格式不符时返回False，索引保持为空）
+        """
+        with self._lock:
+            self._reset()
+            self.file_signature = self._stat_signature()
+            if self.file_signature is None:
+                return False
+            try:
+                with np.load(self.index_path, allow_pickle=False) as data:
+                    if int(data['format']) != _INDEX_FORMAT:
+                        return False
+                    self.vocab = {term: i for i, term in enumerate(data['vocab'].tolist())}
+                    self.chunk_ids = data['chunk_ids'].tolist()
+                    self._row_ptr = data['row_ptr']
+                    self._terms = data['terms']
+                    self._tfs = data['tfs']
+                    self._lengths = data['lengths'].tolist()
+                    for field in FILTER_FIELDS:
+                        self.field_values[field] = data[f'{field}_values'].tolist()
+                        self._field_codes[field] = data[f'{field}_codes'].tolist()
+            except Exception as e:
+                logger.warning(f"BM25索引读取失败 {self.index_path}: {e}")
+                self._reset()
+                return False
+
+            self.row_of = {chunk_id: row for row, chunk_id in enumerate(self.chunk_ids)}
+            for field in FILTER_FIELDS:
+                self._field_lookup[field] = {value: i for i, value in enumerate(self.field_values[field])}
+            self._alive = bytearray(b'\x01') * len(self.chunk_ids)
+            self._alive_count = len(self.chunk_ids)
+            return True
+
+    def _mark_dirty(self):
+        self._postings = None
+        if not self.dirty:
+            self.dirty = True
+            self.dirty_marker.parent.mkdir(parents=True, exist_ok=True)
+            self.dirty_marker.touch()
+
+    def _field_code(self, field: str, value: str) -> int:
+        lookup = self._field_lookup[field]
+        code = lookup.get(value)
+        if code is None:
+            code = len(self.field_values[field])
+            self.field_values[field].append(value)
+            lookup[value] = code
+        return code
+
+    def upsert(self, ids: Sequence[str], documents: Sequence[str], metadatas: Sequence[Dict]):
+        """
+        写入或覆盖块
+
+        Args:
+            ids: 块ID列表
+            documents: 块文本列表
+            metadatas: 块元数据列表（用于 layer/doc_type 过滤）
+        """
+        with self._lock:
+            self._mark_dirty()
+            for chunk_id, document, metadata in zip(ids, documents, metadatas):
+                self._delete_row(chunk_id)
+
+                counts: Dict[int, int] = {}
+                tokens = tokenize(document or "")
+                for token in tokens:
+                    term = self.vocab.get(token)
+                    if term is None:
+                        term = len(self.vocab)
+                        self.vocab[token] = term
+                    counts[term] = counts.get(term, 0) + 1
+
+                terms = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+                tfs = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+                self._pending.append((terms, np.minimum(tfs, _MAX_TF).astype(np.uint16)))
+
+                self.row_of[chunk_id] = len(self.chunk_ids)
+                self.chunk_ids.append(chunk_id)
+                self._lengths.append(len(tokens))
+                for field in FILTER_FIELDS:
+                    self._field_codes[field].append(self._field_code(field, str(metadata.get(field, ""))))
+                self._alive.append(1)
+                self._alive_count += 1
+
+    def delete(self, ids: Sequence[str]):
+        """
+        删除块
+
+        Args:
+            ids: 块ID列表
+        """
+        with self._lock:
+            self._mark_dirty()
+            for chunk_id in ids:
+                self._delete_row(chunk_id)
+
+    def _delete_row(self, chunk_id: str):
+        row = self.row_of.pop(chunk_id, None)
+        if row is not None and self._alive[row]:
+            self._alive[row] = 0
+            self._alive_count -= 1
+
+    def clear(self):
+        """清空索引"""
+        with self._lock:
+            self._reset()
+            self._mark_dirty()
+
+    def _consolidate(self):
+        """把新行合并进CSR数组"""
+        if not self._pending:
+            return
+        lengths = np.fromiter((len(terms) for terms, _ in self._pending), dtype=np.int64, count=len(self._pending))
+        self._row_ptr = np.concatenate([self._row_ptr, self._row_ptr[-1] + np.cumsum(lengths)])
+        self._terms = np.concatenate([self._terms] + [terms for terms, _ in self._pending])
+        self._tfs = np.concatenate([self._tfs] + [tfs for _, tfs in self._pending])
+        self._pending = []
+
+    def _get_postings(self):
+        """按词项排序的倒排表（CSC）：term_ptr[t]:term_ptr[t+1] 为词项t出现的行及词频"""
+        if self._postings is None:
+            self._consolidate()
+            rows = np.repeat(np.arange(len(self.chunk_ids), dtype=np.int32), np.diff(self._row_ptr))
+            order = np.argsort(self._terms, kind='stable')
+            term_ptr = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self._terms, minlength=len(self.vocab)), out=term_ptr[1:])
+            self._postings = (term_ptr, rows[order], self._tfs[order].astype(np.float32))
+        return self._postings
+
+    def _alive_mask(self) -> np.ndarray:
+        return np.frombuffer(bytes(self._alive), dtype=np.uint8).astype(bool)
+
+    def _filter_mask(self, where: Optional[Dict]) -> np.ndarray:
+        mask = np.ones(len(self.chunk_ids), dtype=bool)
+        if not where:
+            return mask
+        conditions = where['$and'] if '$and' in where else [{key: value} for key, value in where.items()]
+        for condition in conditions:
+            for field, value in condition.items():
+                if field not in FILTER_FIELDS:
+                    raise ValueError(f"BM25索引不支持按 {field} 过滤")
+                code = self._field_lookup[field].get(str(value))
+                if code is None:
+                    return np.zeros(len(mask), dtype=bool)
+                mask &= np.asarray(self._field_codes[field], dtype=np.int32) == code
+        return mask
+
+    def search(self, query: str, n_results: int = 10, where: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        """
+        BM25检索
+
+        Args:
+            query: 查询文本
+            n_results: 返回数量
+            where: 元数据过滤条件（只支持 layer/doc_type 等值）
+
+        Returns:
+            [(块ID, BM25分数)]，按分数从高到低，只包含分数大于0的块
+        """
+        with self._lock:
+            terms = {self.vocab[token] for token in tokenize(query) if token in self.vocab}
+            if not terms or not self._alive_count:
+                return []
+
+            term_ptr, post_rows, post_tfs = self._get_postings()
+            alive = self._alive_mask()
+            lengths = np.asarray(self._lengths, dtype=np.float32)
+            avgdl = max(float(lengths[alive].mean()), 1.0)
+            norm = self.k1 * (1 - self.b + self.b * lengths / avgdl)
+
+            scores = np.zeros(len(self.chunk_ids), dtype=np.float32)
+            for term in terms:
+                rows = post_rows[term_ptr[term]:term_ptr[term + 1]]
+                tfs = post_tfs[term_ptr[term]:term_ptr[term + 1]]
+                live = alive[rows]
+                df = int(live.sum())
+                if not df:
+                    continue
+                # idf只按有效块统计，已删除/被覆盖的旧行不参与
+                idf = math.log(1 + (self._alive_count - df + 0.5) / (df + 0.5))
+                rows, tfs = rows[live], tfs[live]
+                scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + norm[rows])
+
+            scores[~self._filter_mask(where)] = 0
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > n_results:
+                candidates = candidates[np.argpartition(-scores[candidates], n_results - 1)[:n_results]]
+            candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+            return [(self.chunk_ids[row], float(scores[row])) for row in candidates]
+
+    def save(self):
+        """压缩（去掉已删除的行和不再使用的词项）后原子写入索引文件"""
+        with self._lock:
+            self._consolidate()
+            alive = self._alive_mask()
+            alive_rows = np.flatnonzero(alive)
+            keep = np.repeat(alive, np.diff(self._row_ptr))
+            used_terms, terms = np.unique(self._terms[keep], return_inverse=True)
+            id_to_term = [None] * len(self.vocab)
+            for term, i in self.vocab.items():
+                id_to_term[i] = term
+
+            arrays = {
+                'format': np.array(_INDEX_FORMAT),
+                'vocab': np.array([id_to_term[i] for i in used_terms.tolist()], dtype=str),
+                'chunk_ids': np.array([self.chunk_ids[row] for row in alive_rows.tolist()], dtype=str),
+                'row_ptr': np.concatenate([[0], np.cumsum(np.diff(self._row_ptr)[alive_rows])]).astype(np.int64),
+                'terms': terms.astype(np.int32),
+                'tfs': self._tfs[keep],
+                'lengths': np.asarray(self._lengths, dtype=np.int32)[alive_rows],
+            }
+            for field in FILTER_FIELDS:
+                arrays[f'{field}_values'] = np.array(self.field_values[field], dtype=str)
+                arrays[f'{field}_codes'] = np.asarray(self._field_codes[field], dtype=np.int32)[alive_rows]
+
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.index_path.with_suffix(f'.{os.getpid()}.tmp.npz')
+            np.savez(tmp_path, **arrays)
+            os.replace(tmp_path, self.index_path)
+
+            self.load()
+            if self.dirty_marker.exists():
+                self.dirty_marker.unlink()
+            logger.info(f"BM25索引已保存: {self._alive_count} 个块，{len(self.vocab)} 个词项")
@@ -18,27 +18,156 @@ PROJECT_ROOT = Path(__file__).parent.parent
 DOCS_DIR = PROJECT_ROOT  # 文档在根目录
 INDEX_DIR = PROJECT_ROOT / "rag-index" / "indexes"
 VECTOR_DB_DIR = PROJECT_ROOT / "vector_db"
+CACHE_DIR = PROJECT_ROOT / "cache"  # 本地缓存（Embedding缓存等，可随时删除）
+MODELS_DIR = PROJECT_ROOT / "models"  # 本地导出的模型（ONNX等）
 
 # 确保目录存在
 VECTOR_DB_DIR.mkdir(exist_ok=True)
+CACHE_DIR.mkdir(exist_ok=True)
 
 # Embedding配置
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "BAAI/bge-m3")
 EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")  # 或 "cuda"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")  # torch | onnx（ONNX Runtime，仅CPU）
+
+# ONNX后端配置（先运行 scripts/export_onnx_model.py 导出，切换前用 scripts/check_embedding_parity.py 核对）
+ONNX_MODEL_DIR = Path(os.getenv("ONNX_MODEL_DIR", str(MODELS_DIR / "onnx" / EMBEDDING_MODEL.replace("/", "--"))))
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "true").lower() == "true"  # 使用动态int8量化版本
+ONNX_NUM_THREADS = int(os.getenv("ONNX_NUM_THREADS", "0"))  # 推理线程数，0表示自动
+
+# Embedding缓存配置（按 模型+归一化+文本哈希 持久化向量，构建/更新脚本共享）
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = Path(os.getenv("EMBEDDING_CACHE_PATH", str(CACHE_DIR / "embedding_cache.sqlite3")))
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "2048"))
+
+# 查询向量内存缓存（encode_query 的LRU，重复的查询不再经过模型）
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))  # 最大条目数，0表示关闭
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "0"))  # 过期时间（秒），0表示不过期
+
+# 并发查询合批（查询服务中把同时到达的查询合成一次前向，单线程脚本不启用）
+QUERY_BATCH_ENABLED = os.getenv("QUERY_BATCH_ENABLED", "true").lower() == "true"
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "2"))  # 凑批窗口（毫秒），0表示只合并模型忙时已排队的查询
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", "32"))  # 每批最多查询数
+
+# Embedding常驻服务（scripts/embedding_server.py），其他脚本自动以客户端模式连接，不再各自加载模型
+EMBEDDING_SERVER_HOST = os.getenv("EMBEDDING_SERVER_HOST", "127.0.0.1")
+EMBEDDING_SERVER_PORT = int(os.getenv("EMBEDDING_SERVER_PORT", "8765"))
+EMBEDDING_SERVER_URL = os.getenv("EMBEDDING_SERVER_URL", "auto")  # auto：检测本机服务 | off：不使用 | 完整URL
+EMBEDDING_SERVER_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_SERVER_BATCH_WAIT_MS", "5"))  # 合批等待时间（毫秒）
+EMBEDDING_SERVER_MAX_BATCH = int(os.getenv("EMBEDDING_SERVER_MAX_BATCH", "256"))  # 每批最多文本数
 
 # 向量数据库配置
-VECTOR_DB_TYPE = os.getenv("VECTOR_DB_TYPE", "chroma")  # chroma | qdrant | milvus
+VECTOR_DB_TYPE = os.getenv("VECTOR_DB_TYPE", "chroma")  # chroma（HNSW） | numpy（进程内精确检索，适合数千块规模）
 COLLECTION_NAME = os.getenv("COLLECTION_NAME", "wendao_knowledge_base")
 
+def _load_index_config() -> dict:
+    """读取 rag-index/config.yaml（不存在或无法解析时返回空字典）"""
+    try:
+        import yaml
+        with open(PROJECT_ROOT / "rag-index" / "config.yaml", 'r', encoding='utf-8') as f:
+            return yaml.safe_load(f) or {}
+    except Exception:
+        return {}
+
+# HNSW参数（Chroma后端，建立集合时生效）：rag-index/config.yaml 中的 vector_db.hnsw，默认值与Chroma一致
+_HNSW_YAML = (_load_index_config().get('vector_db') or {}).get('hnsw') or {}
+HNSW_PARAMS = {
+    'M': int(_HNSW_YAML.get('M', 16)),
+    'construction_ef': int(_HNSW_YAML.get('construction_ef', 100)),
+    'search_ef': int(_HNSW_YAML.get('search_ef', 10)),
+}
+# 环境变量（HNSW_M / HNSW_CONSTRUCTION_EF / HNSW_SEARCH_EF）优先于调优记录和配置文件
+HNSW_ENV_OVERRIDES = {
+    key: int(os.environ[f"HNSW_{key.upper()}"]) for key in HNSW_PARAMS if os.environ.get(f"HNSW_{key.upper()}")
+}
+
+# NumPy后端的只读模式：API工作进程mmap映射同一份索引文件，通过页缓存共享，不能写入
+VECTOR_DB_READ_ONLY = os.getenv("VECTOR_DB_READ_ONLY", "false").lower() == "true"
+NUMPY_STORE_CHECK_INTERVAL = float(os.getenv("NUMPY_STORE_CHECK_INTERVAL", "2"))  # 只读进程检查新索引的间隔（秒），负数表示不检查
+
 # 检索配置
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
 TOP_K = int(os.getenv("TOP_K", "5"))  # 返回文档数量
 
+# BM25稀疏索引（与向量库同步增量更新，检索时与向量结果做RRF融合）
+BM25_ENABLED = os.getenv("BM25_ENABLED", "true").lower() == "true"
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+BM25_CHECK_INTERVAL = float(os.getenv("BM25_CHECK_INTERVAL", "2"))  # 检索进程检查BM25索引文件是否被更新的间隔（秒）
+RRF_K = int(os.getenv("RRF_K", "60"))  # RRF融合常数：分数 = Σ 1/(RRF_K + 名次)
+
+# YAML索引 keywords 命中的文档，其块的分数乘以该系数（query_patterns 命中为1.5，不叠加）；1表示不使用keywords
+KEYWORD_MATCH_BOOST = float(os.getenv("KEYWORD_MATCH_BOOST", "1.2"))
+
+# BGE-M3 稀疏/多向量（同一次前向得到词权重和ColBERT多向量，检索时与稠密相似度加权融合；仅torch后端）
+M3_MULTI_VECTOR = os.getenv("M3_MULTI_VECTOR", "false").lower() == "true"
+M3_VECTORS_PATH = Path(os.getenv("M3_VECTORS_PATH", str(VECTOR_DB_DIR / "m3_vectors.sqlite3")))
+M3_COLBERT_POOL = int(os.getenv("M3_COLBERT_POOL", "2"))  # 多向量相邻token池化窗口，1表示不池化
+M3_WEIGHT_DENSE = float(os.getenv("M3_WEIGHT_DENSE", "0.4"))
+M3_WEIGHT_SPARSE = float(os.getenv("M3_WEIGHT_SPARSE", "0.2"))
+M3_WEIGHT_COLBERT = float(os.getenv("M3_WEIGHT_COLBERT", "0.4"))
+
+# 交叉编码器重排序（对融合后的前N个候选块逐对打分，分数按 (查询, 块) 缓存到磁盘）
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "BAAI/bge-reranker-v2-m3")
+RERANK_DEVICE = os.getenv("RERANK_DEVICE", EMBEDDING_DEVICE)
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))  # 参与打分的候选块数上限
+RERANK_MAX_LATENCY_MS = float(os.getenv("RERANK_MAX_LATENCY_MS", "300"))  # 单次请求的重排序耗时上限（毫秒），0表示不限制
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_CACHE_ENABLED = os.getenv("RERANK_CACHE_ENABLED", "true").lower() == "true"
+RERANK_CACHE_PATH = Path(os.getenv("RERANK_CACHE_PATH", str(CACHE_DIR / "rerank_cache.sqlite3")))
+RERANK_CACHE_MAX_ENTRIES = int(os.getenv("RERANK_CACHE_MAX_ENTRIES", "1000000"))
+
+# 检索/问答结果缓存（内存LRU + 进程间共享的磁盘层，构建/更新索引时递增版本号使其失效）
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_MEMORY_SIZE = int(os.getenv("RESULT_CACHE_MEMORY_SIZE", "1024"))  # 内存层条目数
+RESULT_CACHE_PATH = Path(os.getenv("RESULT_CACHE_PATH", str(CACHE_DIR / "result_cache.sqlite3")))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "100000"))  # 磁盘层条目数上限
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "0"))  # 过期时间（秒），0表示只按索引版本失效
+INDEX_VERSION_PATH = Path(os.getenv("INDEX_VERSION_PATH", str(VECTOR_DB_DIR / "index_version.json")))
+
+# 语义近似查询缓存（换个说法的问题按查询向量相似度命中上次的检索结果和回答，进程内LRU）
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))  # 命中所需的最低余弦相似度
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))  # 保留的查询数
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "0"))  # 过期时间（秒），0表示只按索引版本失效
+
+# YAML索引目录（编译为 cache/index_catalog.pkl，按文件mtime/哈希增量失效）
+INDEX_CATALOG_CHECK_INTERVAL = float(os.getenv("INDEX_CATALOG_CHECK_INTERVAL", "2"))  # 访问时检查YAML变化的间隔（秒），负数表示只在启动和同步时检查
+
+# Embedding批处理配置（按真实token长度分桶，按token预算组批）
+EMBEDDING_TOKEN_BUDGET = int(os.getenv("EMBEDDING_TOKEN_BUDGET", "16384"))  # 每批补齐后的token总数上限，0表示按固定条数分批
+# 分块按字符数估算token（中文约1.5字≈1token），块最长约 CHUNK_SIZE+CHUNK_OVERLAP 个估算token，
+# 换算成模型token留出余量即可，不必用模型默认的8192
+EMBEDDING_MAX_SEQ_LENGTH = int(os.getenv(
+    "EMBEDDING_MAX_SEQ_LENGTH", str(int((CHUNK_SIZE + CHUNK_OVERLAP) * 1.5) + 64)
+))
+
+# 索引构建配置
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))  # 每次送入模型的块数
+BUILD_WORKERS = int(os.getenv("BUILD_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))  # 流水线构建的加载/分块进程数
+BUILD_MAX_MEMORY_MB = int(os.getenv("BUILD_MAX_MEMORY_MB", "256"))  # 构建时各阶段缓冲区（待向量化的块+待写入的向量）内存上限（MB）
+WRITE_BATCH_MB = float(os.getenv("WRITE_BATCH_MB", "8"))  # 每次写入向量数据库的批次大小（MB）
+
+# 索引监听配置（scripts/watch_index.py）
+WATCH_INTERVAL = float(os.getenv("WATCH_INTERVAL", "1.0"))  # 轮询间隔（秒）
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "2.0"))  # 文件静默多久后触发更新（秒）
+
+# 查询服务（api/app.py）
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_WORKER_THREADS = int(os.getenv("API_WORKER_THREADS", str(min(4, os.cpu_count() or 1))))  # 向量化/检索（CPU密集）线程数
+API_LLM_THREADS = int(os.getenv("API_LLM_THREADS", "16"))  # 流式问答等待LLM返回（IO密集）的线程数
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "64"))  # 同时处理的请求数上限
+API_QUEUE_TIMEOUT = float(os.getenv("API_QUEUE_TIMEOUT", "10"))  # 超过上限时排队等待的最长时间（秒），超时返回503
+API_MAX_QUERY_CHARS = int(os.getenv("API_MAX_QUERY_CHARS", "1000"))
+
 # LLM配置
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # openai | ollama | local
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")  # OpenAI兼容接口地址（如 vLLM、本地代理），为空时使用官方地址
 
 # Ollama配置（如果使用本地模型）
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
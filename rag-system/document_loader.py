@@ -3,7 +3,6 @@
 负责读取Markdown文档、解析YAML索引、文档分块
 """
 
-import yaml
 import re
 from pathlib import Path
 from typing import Dict, List, Optional
@@ -11,6 +10,7 @@ import logging
 # import tiktoken  # 暂时注释掉，因为安装有问题
 
 from .config import INDEX_DIR, DOCS_DIR, CHUNK_SIZE, CHUNK_OVERLAP, get_doc_file_path
+from .index_catalog import get_index_catalog
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +19,20 @@ logger = logging.getLogger(__name__)
 encoding = None
 logger.warning("tiktoken未安装，将使用字符数估算token数")
 
+
+def get_chunk_id(chunk: Dict) -> str:
+    """
+    生成文档块ID（格式：DOC-D001_content_0）
+    
+    Args:
+        chunk: 文档块字典
+        
+    Returns:
+        文档块ID
+    """
+    index = chunk.get('chunk_index', chunk.get('pattern_index', chunk.get('example_index', 0)))
+    return f"{chunk['doc_id']}_{chunk['chunk_type']}_{index}"
+
 class DocumentLoader:
     """文档加载器"""
     
@@ -36,7 +50,7 @@ class DocumentLoader:
         """
         self.docs_dir = docs_dir
         self.index_dir = index_dir
-        self.index_cache = {}  # 缓存索引数据
+        self.catalog = get_index_catalog(index_dir)  # 共享的编译后索引目录
     
     def load_index(self, doc_id: str) -> Dict:
         """
@@ -48,23 +62,25 @@ class DocumentLoader:
         Returns:
             索引数据字典
         """
-        if doc_id in self.index_cache:
-            return self.index_cache[doc_id]
+        index_data = self.catalog.get(doc_id)
+        if index_data is not None:
+            return index_data
         
         index_file = self.index_dir / f"{doc_id}.yaml"
         
         if not index_file.exists():
             raise FileNotFoundError(f"索引文件不存在: {index_file}")
         
-        try:
-            with open(index_file, 'r', encoding='utf-8') as f:
-                index_data = yaml.safe_load(f)
-            
-            self.index_cache[doc_id] = index_data
-            return index_data
-        except Exception as e:
-            logger.error(f"加载索引文件失败 {index_file}: {e}")
-            raise
+        # 文件存在但目录中没有：解析失败，或刚创建还未到检查间隔
+        if self.catalog.get_error(doc_id) is None:
+            self.catalog.refresh(force=True)
+            index_data = self.catalog.get(doc_id)
+            if index_data is not None:
+                return index_data
+        
+        error = self.catalog.get_error(doc_id)
+        logger.error(f"加载索引文件失败 {index_file}: {error}")
+        raise ValueError(f"索引文件解析失败 {index_file}: {error}")
     
     def load_document(self, doc_id: str) -> Dict:
         """
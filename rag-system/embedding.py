@@ -1,41 +1,156 @@
 """
 Embedding模型封装
-支持BGE-M3、text2vec等模型
+支持BGE-M3、text2vec等模型；本机运行着Embedding服务时可作为客户端使用，不必重复加载模型
 """
 
 from sentence_transformers import SentenceTransformer
-from typing import List, Union
+from typing import Dict, Hashable, List, Union, Optional
+from tqdm import tqdm
+import numpy as np
+import threading
 import torch
 import logging
 
+from .config import (
+    EMBEDDING_MODEL, EMBEDDING_DEVICE, EMBEDDING_BACKEND,
+    ONNX_MODEL_DIR, ONNX_QUANTIZED, ONNX_NUM_THREADS,
+    EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_MB,
+    QUERY_CACHE_SIZE, QUERY_CACHE_TTL,
+    QUERY_BATCH_WAIT_MS, QUERY_BATCH_MAX,
+    EMBEDDING_TOKEN_BUDGET, EMBEDDING_MAX_SEQ_LENGTH,
+    EMBEDDING_SERVER_URL,
+    M3_MULTI_VECTOR, M3_VECTORS_PATH, M3_COLBERT_POOL
+)
+from .embedding_cache import EmbeddingCache
+from .embedding_server import EmbeddingClient, resolve_server_url
+from .lru_cache import LRUCache
+from .m3_vectors import M3Heads, MultiVectorStore
+from .micro_batcher import MicroBatcher
+from .onnx_backend import OnnxSentenceEncoder
+
 logger = logging.getLogger(__name__)
 
+# 按token预算组批时单批的最大条数（避免大量极短文本凑成超大批次）
+_MAX_BATCH_ITEMS = 256
+
+# BGE-M3的query指令
+BGE_M3_QUERY_INSTRUCTION = "为这个句子生成表示以用于检索相关文章："
+
 class EmbeddingModel:
     """Embedding模型封装类"""
     
-    def __init__(self, model_name: str = "BAAI/bge-m3", device: str = "cpu"):
+    def __init__(
+        self,
+        model_name: str = "BAAI/bge-m3",
+        device: str = "cpu",
+        cache: Optional[EmbeddingCache] = None,
+        token_budget: int = EMBEDDING_TOKEN_BUDGET,
+        max_seq_length: Optional[int] = EMBEDDING_MAX_SEQ_LENGTH,
+        backend: str = EMBEDDING_BACKEND,
+        onnx_quantized: bool = ONNX_QUANTIZED,
+        query_cache_size: int = QUERY_CACHE_SIZE,
+        query_cache_ttl: float = QUERY_CACHE_TTL,
+        server_url: Optional[str] = None,
+        multi_vector_store: Optional[MultiVectorStore] = None
+    ):
         """
         初始化Embedding模型
         
         Args:
             model_name: 模型名称或路径
             device: 设备类型 ("cpu" 或 "cuda")
+            cache: Embedding磁盘缓存（可选，命中的文本不再经过模型）
+            token_budget: 每批补齐后的token总数上限，0表示按固定条数分批
+            max_seq_length: 最大序列长度上限（超出部分截断），None表示使用模型默认值
+            backend: 推理后端（"torch" 或 "onnx"，onnx 从 ONNX_MODEL_DIR 加载导出的模型）
+            onnx_quantized: ONNX后端是否使用int8量化版本
+            query_cache_size: 查询向量LRU缓存的条目数，0表示关闭
+            query_cache_ttl: 查询向量缓存的过期时间（秒），0表示不过期
+            server_url: Embedding服务地址（客户端模式：不加载本地模型，请求转发给常驻服务）
+            multi_vector_store: BGE-M3稀疏/多向量存储（可选，encode_batch 时一并计算并保存）
+        
+        Raises:
+            OSError: 客户端模式下服务不可用
+            ValueError: 客户端模式下服务加载的模型与 model_name 不一致
         """
         self.model_name = model_name
+        self.backend = backend
+        self.cache = cache
+        # 不同后端（尤其是int8量化）的向量不完全相同，缓存按后端区分
+        if backend == "onnx":
+            self.cache_key = f"{model_name}@onnx-{'int8' if onnx_quantized else 'fp32'}"
+        else:
+            self.cache_key = model_name
+        self.token_budget = token_budget
+        self.query_cache = LRUCache(query_cache_size, query_cache_ttl) if query_cache_size > 0 else None
+        self.query_batcher: Optional[MicroBatcher] = None
+        # 组批统计：真实token数与补齐后的token数之比反映padding浪费
+        self.batch_stats = {'batches': 0, 'texts': 0, 'tokens': 0, 'padded_tokens': 0}
+        self._dimension: Optional[int] = None
+        self.multi_vector_store = multi_vector_store
+        self._m3_heads: Optional[M3Heads] = None
+        self._m3_unavailable = False
+        
+        self.client: Optional[EmbeddingClient] = None
+        if server_url:
+            self._connect(server_url)
+            return
+        
         self.device = device if torch.cuda.is_available() and device == "cuda" else "cpu"
         
-        logger.info(f"正在加载Embedding模型: {model_name} (设备: {self.device})")
+        if backend == "onnx" and self.device != "cpu":
+            logger.warning("ONNX后端只支持CPU，忽略设备设置")
+            self.device = "cpu"
+        
+        logger.info(f"正在加载Embedding模型: {model_name} (设备: {self.device}，后端: {backend})")
         
         try:
-            self.model = SentenceTransformer(
-                model_name,
-                device=self.device,
-                trust_remote_code=True
-            )
+            if backend == "onnx":
+                self.model = OnnxSentenceEncoder(ONNX_MODEL_DIR, quantized=onnx_quantized, num_threads=ONNX_NUM_THREADS)
+                if self.model.config.get('model_name') != model_name:
+                    logger.warning(f"ONNX模型导出自 {self.model.config.get('model_name')}，与配置的 {model_name} 不一致")
+            elif backend == "torch":
+                self.model = SentenceTransformer(
+                    model_name,
+                    device=self.device,
+                    trust_remote_code=True
+                )
+            else:
+                raise ValueError(f"不支持的Embedding后端: {backend}")
             logger.info(f"模型加载成功")
         except Exception as e:
             logger.error(f"模型加载失败: {e}")
             raise
+        
+        if max_seq_length and getattr(self.model, 'max_seq_length', None):
+            if max_seq_length < self.model.max_seq_length:
+                logger.info(f"最大序列长度: {self.model.max_seq_length} → {max_seq_length}")
+                self.model.max_seq_length = max_seq_length
+                # 截断长度不同，长文本的向量也不同
+                self.cache_key = f"{self.cache_key}@seq{max_seq_length}"
+    
+    def _connect(self, server_url: str, timeout: float = 2.0):
+        """客户端模式：连接常驻的Embedding服务并确认模型一致"""
+        client = EmbeddingClient(server_url)
+        info = client.health(timeout=timeout)
+        if info.get('model_name') != self.model_name:
+            raise ValueError(f"Embedding服务加载的模型为 {info.get('model_name')}，与配置的 {self.model_name} 不一致")
+        
+        self.client = client
+        self.model = None
+        self.device = "remote"
+        self.backend = info.get('backend', self.backend)
+        self.cache_key = info['cache_key']
+        self._dimension = info.get('dimension')
+        logger.info(f"已连接Embedding服务: {server_url}（模型 {self.model_name}，后端 {self.backend}）")
+    
+    @property
+    def dimension(self) -> int:
+        """向量维度"""
+        if self._dimension is None:
+            get_dimension = getattr(self.model, 'get_sentence_embedding_dimension', None)
+            self._dimension = (get_dimension() if get_dimension else None) or len(self.encode("test"))
+        return self._dimension
     
     def encode(
         self,
@@ -51,31 +166,146 @@ class EmbeddingModel:
             texts: 文本或文本列表
             normalize_embeddings: 是否归一化向量
             show_progress_bar: 是否显示进度条
-            batch_size: 批处理大小
+            batch_size: 批处理大小（仅在 token_budget 为0时生效，否则按token预算组批）
             
         Returns:
-            向量或向量列表
+            向量或向量列表（顺序与输入一致）
         """
-        if isinstance(texts, str):
+        single = isinstance(texts, str)
+        if single:
             texts = [texts]
         
-        embeddings = self.model.encode(
-            texts,
-            normalize_embeddings=normalize_embeddings,
-            show_progress_bar=show_progress_bar,
-            batch_size=batch_size,
-            convert_to_numpy=True
-        )
+        if self.cache is None:
+            embeddings = self._encode_texts(texts, normalize_embeddings, show_progress_bar, batch_size)
+        else:
+            # 先查缓存，只对未命中的文本做向量化
+            embeddings = self.cache.get_many(self.cache_key, normalize_embeddings, texts)
+            missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            if missing:
+                missing_texts = [texts[i] for i in missing]
+                new_embeddings = self._encode_texts(
+                    missing_texts, normalize_embeddings, show_progress_bar, batch_size
+                )
+                self.cache.put_many(self.cache_key, normalize_embeddings, missing_texts, new_embeddings)
+                for i, embedding in zip(missing, new_embeddings):
+                    embeddings[i] = embedding
+        
+        # 只有传入单个字符串时才返回单个向量
+        if single:
+            return embeddings[0]
+        return embeddings
+    
+    def _encode_texts(
+        self,
+        texts: List[str],
+        normalize_embeddings: bool,
+        show_progress_bar: bool,
+        batch_size: int
+    ) -> List[List[float]]:
+        """调用模型向量化（不经过缓存）"""
+        if self.client is not None:
+            return self.client.encode(texts, normalize_embeddings)
+        
+        if self.token_budget <= 0 or len(texts) <= 1:
+            embeddings = self.model.encode(
+                texts,
+                normalize_embeddings=normalize_embeddings,
+                show_progress_bar=show_progress_bar,
+                batch_size=batch_size,
+                convert_to_numpy=True
+            )
+            return embeddings.tolist()
+        
+        lengths = self._token_lengths(texts)
+        batches = self._plan_batches(lengths)
+        
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        for batch in tqdm(batches, desc="向量化", disable=not show_progress_bar):
+            embeddings = self.model.encode(
+                [texts[i] for i in batch],
+                normalize_embeddings=normalize_embeddings,
+                show_progress_bar=False,
+                batch_size=len(batch),
+                convert_to_numpy=True
+            )
+            # 按原始下标放回，保证输出顺序与输入一致
+            for i, embedding in zip(batch, embeddings.tolist()):
+                results[i] = embedding
+            
+            self.batch_stats['batches'] += 1
+            self.batch_stats['texts'] += len(batch)
+            self.batch_stats['tokens'] += sum(lengths[i] for i in batch)
+            self.batch_stats['padded_tokens'] += lengths[batch[0]] * len(batch)
+        
+        return results
+    
+    def _token_lengths(self, texts: List[str]) -> List[int]:
+        """
+        计算文本截断后的真实token数（含特殊token）
+        
+        Args:
+            texts: 文本列表
+            
+        Returns:
+            与texts一一对应的token数
+        """
+        max_length = getattr(self.model, 'max_seq_length', None)
+        tokenizer = getattr(self.model, 'tokenizer', None)
+        if tokenizer is not None:
+            try:
+                input_ids = tokenizer(
+                    texts,
+                    add_special_tokens=True,
+                    truncation=max_length is not None,
+                    max_length=max_length,
+                    return_attention_mask=False,
+                    return_token_type_ids=False
+                )['input_ids']
+                return [len(ids) for ids in input_ids]
+            except Exception as e:
+                logger.debug(f"tokenizer计算长度失败，改用字符数估算: {e}")
         
-        # 转换为列表格式
-        if len(texts) == 1:
-            return embeddings[0].tolist()
-        return embeddings.tolist()
+        # 没有可用的tokenizer时按字符数估算（CJK字符基本一字一token）
+        return [min(len(text) + 2, max_length or len(text) + 2) for text in texts]
+    
+    def _plan_batches(self, lengths: List[int]) -> List[List[int]]:
+        """
+        按token长度分桶组批
+        
+        按长度从长到短排序后依次装批，使每批补齐后的token总数（批内最长长度×条数）
+        不超过 token_budget，长度相近的文本落在同一批，padding最少。
+        
+        Args:
+            lengths: 每条文本的token数
+            
+        Returns:
+            批次列表，每个批次是原始下标列表（批内第一个最长）
+        """
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        
+        batches: List[List[int]] = []
+        current: List[int] = []
+        for i in order:
+            longest = lengths[current[0]] if current else lengths[i]
+            if current and (longest * (len(current) + 1) > self.token_budget or len(current) >= _MAX_BATCH_ITEMS):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+    
+    @property
+    def query_instruction(self) -> str:
+        """查询前缀指令（BGE-M3支持query指令，可以提高检索效果）"""
+        if "bge-m3" in self.model_name.lower():
+            return BGE_M3_QUERY_INSTRUCTION
+        return ""
     
     def encode_query(self, query: str) -> List[float]:
         """
         对查询进行向量化
-        BGE-M3支持query指令，可以提高检索效果
+        BGE-M3支持query指令，可以提高检索效果；重复的查询直接从LRU缓存返回
         
         Args:
             query: 查询文本
@@ -83,19 +313,115 @@ class EmbeddingModel:
         Returns:
             查询向量
         """
-        # BGE-M3支持query指令
-        if "bge-m3" in self.model_name.lower():
-            query_text = f"为这个句子生成表示以用于检索相关文章：{query}"
+        return self.encode_queries([query])[0]
+    
+    def encode_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        批量对查询进行向量化（未命中缓存的查询合成一批推理）
+        
+        Args:
+            queries: 查询文本列表
+            
+        Returns:
+            与queries一一对应的查询向量列表
+        """
+        instruction = self.query_instruction
+        # 缓存键包含模型（含后端/精度）和指令前缀，换模型或指令后不会命中旧向量
+        results: List[Optional[List[float]]] = [None] * len(queries)
+        if self.query_cache is not None:
+            for i, query in enumerate(queries):
+                cached = self.query_cache.get((self.cache_key, instruction, query))
+                if cached is not None:
+                    results[i] = list(cached)
+        
+        missing = list(dict.fromkeys(query for query, result in zip(queries, results) if result is None))
+        if not missing:
+            return results
+        
+        if self.query_batcher is not None and threading.current_thread() is not self.query_batcher:
+            # 与其他线程同时到达的查询合成一批推理
+            embeddings = self.query_batcher.submit(missing).result()
         else:
-            query_text = query
+            embeddings = self._encode_query_texts(missing)
         
-        embedding = self.model.encode(
-            [query_text],
+        encoded = dict(zip(missing, embeddings))
+        if self.query_cache is not None:
+            for query, embedding in encoded.items():
+                self.query_cache.put((self.cache_key, instruction, query), tuple(embedding))
+        return [result if result is not None else list(encoded[query]) for query, result in zip(queries, results)]
+    
+    def _encode_query_texts(self, queries: List[str]) -> List[List[float]]:
+        """查询向量化（不经过缓存）"""
+        if self.client is not None:
+            # 服务端负责添加query指令
+            return self.client.encode_queries(queries)
+        instruction = self.query_instruction
+        if len(queries) == 1:
+            return self.model.encode(
+                [f"{instruction}{queries[0]}"],
+                normalize_embeddings=True,
+                show_progress_bar=False
+            ).tolist()
+        return self._encode_texts(
+            [f"{instruction}{query}" for query in queries],
             normalize_embeddings=True,
-            show_progress_bar=False
+            show_progress_bar=False,
+            batch_size=32
         )
+    
+    def _encode_query_batch(self, key: Hashable, queries: List[str]) -> List[List[float]]:
+        """合批线程的处理函数（不同调用方的重复查询只计算一次）"""
+        unique = list(dict.fromkeys(queries))
+        encoded = dict(zip(unique, self._encode_query_texts(unique)))
+        return [encoded[query] for query in queries]
+    
+    def enable_query_batching(
+        self,
+        max_wait_ms: float = QUERY_BATCH_WAIT_MS,
+        max_batch: int = QUERY_BATCH_MAX
+    ) -> bool:
+        """
+        启用并发查询合批（多线程服务中使用）
+        
+        之后各线程调用 encode_query/encode_queries 时，未命中缓存的查询交给合批线程，
+        在 max_wait_ms 窗口内与其他线程的查询合成一次前向，单个查询最多多等待一个窗口
+        
+        Args:
+            max_wait_ms: 凑批窗口（毫秒），0表示不等待，只合并模型忙时已排队的查询
+            max_batch: 每批最多查询数
+            
+        Returns:
+            是否启用（客户端模式下由Embedding服务合批，不在本进程启用）
+        """
+        if self.client is not None:
+            logger.info("客户端模式下由Embedding服务合批，不启用本地查询合批")
+            return False
+        if self.query_batcher is None:
+            self.query_batcher = MicroBatcher(self._encode_query_batch, max_wait_ms, max_batch, name="query-batcher")
+            self.query_batcher.start()
+            logger.info(f"查询合批已启用（窗口 {max_wait_ms} ms，每批最多 {max_batch} 条）")
+        return True
+    
+    def get_query_batch_stats(self) -> Optional[dict]:
+        """获取查询合批统计（未启用时返回None）"""
+        return self.query_batcher.get_stats() if self.query_batcher is not None else None
+    
+    def warm_query_cache(self, queries: List[str]) -> int:
+        """
+        预热查询向量缓存（如常见问题、YAML中的query_patterns）
         
-        return embedding[0].tolist()
+        Args:
+            queries: 查询文本列表
+            
+        Returns:
+            预热的查询条数
+        """
+        if self.query_cache is None or not queries:
+            return 0
+        unique_queries = list(dict.fromkeys(queries))
+        self.encode_queries(unique_queries)
+        logger.info(f"查询向量缓存预热完成: {len(unique_queries)} 条")
+        return len(unique_queries)
     
     def encode_batch(
         self,
@@ -106,6 +432,9 @@ class EmbeddingModel:
         """
         批量向量化（用于大量文本）
         
+        配置了多向量存储时，存储中还没有的文本通过 encode_multi 一次前向同时得到稠密向量、
+        词权重和多向量，后两者写入存储；其余文本照常走 encode（磁盘缓存）。
+        
         Args:
             texts: 文本列表
             batch_size: 批处理大小
@@ -114,14 +443,255 @@ class EmbeddingModel:
         Returns:
             向量列表
         """
-        return self.encode(
+        if self.multi_vector_store is None or not self.supports_multi_vector:
+            return self.encode(
+                texts,
+                show_progress_bar=show_progress_bar,
+                batch_size=batch_size
+            )
+        
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        missing = self.multi_vector_store.missing(texts)
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            outputs = self.encode_multi(missing_texts, show_progress_bar=show_progress_bar)
+            self.multi_vector_store.put_many(missing_texts, outputs)
+            for i, output in zip(missing, outputs):
+                embeddings[i] = output['dense']
+        
+        rest = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if rest:
+            rest_embeddings = self.encode(
+                [texts[i] for i in rest],
+                show_progress_bar=show_progress_bar and not missing,
+                batch_size=batch_size
+            )
+            for i, embedding in zip(rest, rest_embeddings):
+                embeddings[i] = embedding
+        return embeddings
+    
+    @property
+    def supports_multi_vector(self) -> bool:
+        """是否能输出BGE-M3的词权重和多向量（本地torch后端的BGE-M3模型，且输出层权重可用）"""
+        return self._get_m3_heads() is not None
+    
+    def _get_m3_heads(self) -> Optional[M3Heads]:
+        """首次使用时加载BGE-M3的sparse/colbert输出层（不可用时只警告一次）"""
+        if self._m3_heads is not None or self._m3_unavailable:
+            return self._m3_heads
+        
+        reason = None
+        if self.client is not None:
+            reason = "客户端模式不支持"
+        elif self.backend != "torch":
+            reason = f"{self.backend}后端不支持"
+        elif "bge-m3" not in self.model_name.lower():
+            reason = f"{self.model_name} 不是BGE-M3模型"
+        else:
+            try:
+                self._m3_heads = M3Heads.from_pretrained(self.model_name, self.model.tokenizer)
+            except Exception as e:
+                reason = f"输出层权重加载失败: {e}"
+        
+        if reason:
+            self._m3_unavailable = True
+            logger.warning(f"BGE-M3稀疏/多向量不可用（{reason}），只使用稠密向量")
+        return self._m3_heads
+    
+    def _forward_multi(self, texts: List[str]) -> List[Dict]:
+        """一次前向取出每条文本的稠密向量和去掉padding后的 token_embeddings / input_ids"""
+        rows = self.model.encode(
             texts,
-            show_progress_bar=show_progress_bar,
-            batch_size=batch_size
+            output_value=None,
+            show_progress_bar=False,
+            batch_size=len(texts)
         )
+        outputs = []
+        for row in rows:
+            length = int(row['attention_mask'].sum())
+            dense = row['sentence_embedding'].float().cpu().numpy()
+            outputs.append({
+                'dense': dense / max(float(np.linalg.norm(dense)), 1e-12),
+                'token_embeddings': row['token_embeddings'][:length].float().cpu().numpy(),
+                'input_ids': row['input_ids'][:length].cpu().numpy()
+            })
+        return outputs
+    
+    def encode_multi(self, texts: List[str], show_progress_bar: bool = True) -> List[Dict]:
+        """
+        BGE-M3 一次前向同时输出稠密向量、词权重和ColBERT多向量（文档侧）
+        
+        稠密向量与 encode 的结果相同，并写入磁盘缓存。
+        
+        Args:
+            texts: 文本列表
+            show_progress_bar: 是否显示进度条
+            
+        Returns:
+            与texts对应的 {'dense': 归一化稠密向量, 'sparse': {token_id: 权重}, 'colbert': 多向量数组}
+            
+        Raises:
+            RuntimeError: 当前模型不支持（见 supports_multi_vector）
+        """
+        heads = self._get_m3_heads()
+        if heads is None:
+            raise RuntimeError("当前Embedding模型不支持BGE-M3稀疏/多向量输出")
+        
+        if self.token_budget > 0:
+            lengths = self._token_lengths(texts)
+            batches = self._plan_batches(lengths)
+        else:
+            lengths = None
+            batches = [list(range(start, min(start + 32, len(texts)))) for start in range(0, len(texts), 32)]
+        
+        results: List[Optional[Dict]] = [None] * len(texts)
+        for batch in tqdm(batches, desc="向量化(M3)", disable=not show_progress_bar):
+            for i, row in zip(batch, self._forward_multi([texts[i] for i in batch])):
+                results[i] = {
+                    'dense': row['dense'].tolist(),
+                    'sparse': heads.sparse(row['token_embeddings'], row['input_ids']),
+                    'colbert': heads.colbert(row['token_embeddings'])
+                }
+            if lengths is not None:
+                self.batch_stats['batches'] += 1
+                self.batch_stats['texts'] += len(batch)
+                self.batch_stats['tokens'] += sum(lengths[i] for i in batch)
+                self.batch_stats['padded_tokens'] += lengths[batch[0]] * len(batch)
+        
+        if self.cache is not None:
+            self.cache.put_many(self.cache_key, True, texts, [result['dense'] for result in results])
+        return results
+    
+    def encode_query_multi(self, query: str) -> Dict:
+        """
+        查询侧的 encode_multi：稠密向量与 encode_query 相同（带query指令），
+        词权重和多向量去掉指令前缀对应的token；结果进入查询LRU缓存
+        
+        Args:
+            query: 查询文本
+            
+        Returns:
+            {'dense': 查询向量, 'sparse': {token_id: 权重}, 'colbert': 多向量数组（只读）}
+            
+        Raises:
+            RuntimeError: 当前模型不支持（见 supports_multi_vector）
+        """
+        return self.encode_queries_multi([query])[0]
+    
+    def encode_queries_multi(self, queries: List[str], batch_size: int = 64) -> List[Dict]:
+        """
+        批量的 encode_query_multi（未命中缓存的查询每 batch_size 条一次前向）
+        
+        Args:
+            queries: 查询文本列表
+            batch_size: 每次前向的查询数
+            
+        Returns:
+            与queries一一对应的 {'dense', 'sparse', 'colbert'}；每次返回新的字典和列表，
+            多向量数组为只读（与缓存共享）
+            
+        Raises:
+            RuntimeError: 当前模型不支持（见 supports_multi_vector）
+        """
+        heads = self._get_m3_heads()
+        if heads is None:
+            raise RuntimeError("当前Embedding模型不支持BGE-M3稀疏/多向量输出")
+        
+        instruction = self.query_instruction
+        results: List[Optional[Dict]] = [None] * len(queries)
+        if self.query_cache is not None:
+            for i, query in enumerate(queries):
+                results[i] = self.query_cache.get((self.cache_key, "m3", instruction, query))
+        
+        missing = list(dict.fromkeys(query for query, result in zip(queries, results) if result is None))
+        encoded: Dict[str, Dict] = {}
+        if missing:
+            # [CLS] + 指令token 之后才是查询本身
+            skip = 1
+            if instruction:
+                skip += len(self.model.tokenizer(instruction, add_special_tokens=False)['input_ids'])
+            for start in range(0, len(missing), batch_size):
+                batch = missing[start:start + batch_size]
+                for query, row in zip(batch, self._forward_multi([f"{instruction}{query}" for query in batch])):
+                    colbert = heads.colbert(row['token_embeddings'], skip=skip)
+                    colbert.setflags(write=False)
+                    result = {
+                        'dense': row['dense'].tolist(),
+                        'sparse': heads.sparse(row['token_embeddings'][skip:], row['input_ids'][skip:]),
+                        'colbert': colbert
+                    }
+                    encoded[query] = result
+                    if self.query_cache is not None:
+                        self.query_cache.put((self.cache_key, "m3", instruction, query), result)
+        
+        # 缓存中的字典在多个线程间共享，返回副本
+        return [
+            {'dense': list(result['dense']), 'sparse': dict(result['sparse']), 'colbert': result['colbert']}
+            for result in (result if result is not None else encoded[query] for query, result in zip(queries, results))
+        ]
     
     def get_embedding_dimension(self) -> int:
         """获取向量维度"""
-        # 测试向量化一个短文本
-        test_embedding = self.encode("test")
-        return len(test_embedding)
+        return self.dimension
+    
+    def get_batch_stats(self) -> dict:
+        """获取组批统计（padding_efficiency 为补齐后的token中真实token的占比，越接近1越好）"""
+        stats = dict(self.batch_stats)
+        stats['padding_efficiency'] = stats['tokens'] / stats['padded_tokens'] if stats['padded_tokens'] else 1.0
+        return stats
+    
+    def get_query_cache_stats(self) -> Optional[dict]:
+        """获取查询向量缓存统计（未启用时返回None）"""
+        return self.query_cache.get_stats() if self.query_cache else None
+    
+    def get_cache_stats(self) -> Optional[dict]:
+        """获取Embedding缓存统计（未启用缓存时返回None，客户端模式下为服务端的缓存统计）"""
+        if self.client is not None:
+            return self.client.health().get('cache')
+        return self.cache.get_stats() if self.cache else None
+
+def create_embedding_model(
+    model_name: str = EMBEDDING_MODEL,
+    device: str = EMBEDDING_DEVICE,
+    use_cache: bool = EMBEDDING_CACHE_ENABLED,
+    backend: str = EMBEDDING_BACKEND,
+    use_server: bool = True,
+    use_multi_vector: bool = M3_MULTI_VECTOR,
+    query_batching: bool = False
+) -> EmbeddingModel:
+    """
+    按配置创建Embedding模型（构建、更新脚本共用同一个磁盘缓存）
+    
+    本机运行着 scripts/embedding_server.py 时直接以客户端模式连接（模型常驻在服务中），
+    否则加载本地模型。
+    
+    Args:
+        model_name: 模型名称或路径
+        device: 设备类型
+        use_cache: 是否启用Embedding磁盘缓存（客户端模式下由服务端缓存）
+        backend: 推理后端（torch 或 onnx）
+        use_server: 是否尝试连接Embedding服务（EMBEDDING_SERVER_URL）
+        use_multi_vector: 是否计算并保存BGE-M3词权重和多向量（M3_MULTI_VECTOR，仅本地torch后端）
+        query_batching: 是否启用并发查询合批（多线程服务传入 QUERY_BATCH_ENABLED）
+        
+    Returns:
+        Embedding模型实例
+    """
+    server_url = resolve_server_url(EMBEDDING_SERVER_URL) if use_server else None
+    if server_url:
+        try:
+            return EmbeddingModel(model_name, device, backend=backend, server_url=server_url)
+        except (OSError, ValueError) as e:
+            # auto 模式下服务没启动是常态，只有显式配置了地址时才警告
+            log = logger.info if EMBEDDING_SERVER_URL.strip().lower() == "auto" else logger.warning
+            log(f"未使用Embedding服务（{e}），加载本地模型")
+    
+    cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_MB) if use_cache else None
+    multi_vector_store = (
+        MultiVectorStore(M3_VECTORS_PATH, model_name, M3_COLBERT_POOL)
+        if use_multi_vector and backend == "torch" else None
+    )
+    model = EmbeddingModel(model_name, device, cache=cache, backend=backend, multi_vector_store=multi_vector_store)
+    if query_batching:
+        model.enable_query_batching()
+    return model
@@ -0,0 +1,224 @@
+"""
+Embedding持久化缓存
+按 (模型名称, 是否归一化, 文本哈希) 内容寻址存储向量，
+由 build_index.py 和 update_index.py 共享，重建索引时只需为新增或变更的块付出向量化成本
+"""
+
+import sqlite3
+import hashlib
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 单条SQL中IN子句的最大参数个数（SQLite默认上限为999）
+_SQL_BATCH = 500
+
+class EmbeddingCache:
+    """基于SQLite的Embedding磁盘缓存（按体积上限做LRU淘汰）"""
+    
+    def __init__(self, db_path: Path, max_size_mb: int = 2048):
+        """
+        初始化Embedding缓存
+        
+        Args:
+            db_path: 缓存数据库文件路径
+            max_size_mb: 缓存体积上限（MB），超过后按最久未使用淘汰
+        """
+        self.db_path = db_path
+        self.max_bytes = max_size_mb * 1024 * 1024
+        
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # REPLACE 覆盖已有条目时也触发删除触发器，保证统计准确
+        self._conn.execute("PRAGMA recursive_triggers=ON")
+        # 总字节数和条目数由触发器维护在 cache_stats 中，写入时不必扫描全表；
+        # 旧版本建立的缓存库在这里一次性补齐统计
+        self._conn.executescript(
+            """
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                normalized INTEGER NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, normalized, text_hash)
+            );
+            CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access);
+            CREATE TABLE IF NOT EXISTS cache_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                total_bytes INTEGER NOT NULL,
+                entries INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO cache_stats (id, total_bytes, entries)
+                SELECT 0, COALESCE(SUM(LENGTH(vector)), 0), COUNT(*) FROM embeddings;
+            CREATE TRIGGER IF NOT EXISTS embeddings_stats_insert AFTER INSERT ON embeddings BEGIN
+                UPDATE cache_stats SET total_bytes = total_bytes + LENGTH(NEW.vector), entries = entries + 1 WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS embeddings_stats_delete AFTER DELETE ON embeddings BEGIN
+                UPDATE cache_stats SET total_bytes = total_bytes - LENGTH(OLD.vector), entries = entries - 1 WHERE id = 0;
+            END;
+            CREATE TRIGGER IF NOT EXISTS embeddings_stats_update AFTER UPDATE OF vector ON embeddings BEGIN
+                UPDATE cache_stats SET total_bytes = total_bytes + LENGTH(NEW.vector) - LENGTH(OLD.vector) WHERE id = 0;
+            END;
+            COMMIT;
+            """
+        )
+        
+        # 命中统计（仅统计当前进程）
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        logger.info(f"Embedding缓存已启用: {db_path}（上限 {max_size_mb} MB）")
+    
+    @staticmethod
+    def hash_text(text: str) -> str:
+        """计算文本哈希"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    
+    def get_many(
+        self,
+        model_name: str,
+        normalized: bool,
+        texts: List[str]
+    ) -> List[Optional[List[float]]]:
+        """
+        批量查询缓存
+        
+        Args:
+            model_name: 模型名称
+            normalized: 是否归一化
+            texts: 文本列表
+        
+        Returns:
+            与texts一一对应的向量列表，未命中的位置为None
+        """
+        hashes = [self.hash_text(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        
+        with self._lock:
+            unique_hashes = list(dict.fromkeys(hashes))
+            for i in range(0, len(unique_hashes), _SQL_BATCH):
+                batch = unique_hashes[i:i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND normalized = ? AND text_hash IN ({placeholders})",
+                    [model_name, int(normalized), *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array('f', blob).tolist()
+            
+            # 刷新命中条目的访问时间（用于LRU淘汰）
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? "
+                    "WHERE model = ? AND normalized = ? AND text_hash = ?",
+                    [(now, model_name, int(normalized), h) for h in found]
+                )
+                self._conn.commit()
+            
+            results = [found.get(h) for h in hashes]
+            hit_count = sum(1 for r in results if r is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        
+        return results
+    
+    def put_many(
+        self,
+        model_name: str,
+        normalized: bool,
+        texts: List[str],
+        embeddings: List[List[float]]
+    ):
+        """
+        批量写入缓存
+        
+        Args:
+            model_name: 模型名称
+            normalized: 是否归一化
+            texts: 文本列表
+            embeddings: 对应的向量列表
+        """
+        if len(texts) != len(embeddings):
+            raise ValueError("texts和embeddings数量不匹配")
+        if not texts:
+            return
+        
+        now = time.time()
+        rows = [
+            (model_name, int(normalized), self.hash_text(text), array('f', embedding).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings "
+                "(model, normalized, text_hash, vector, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            self._evict_if_needed()
+    
+    def _size_and_count(self) -> Tuple[int, int]:
+        """当前缓存向量占用的字节数与条目数"""
+        row = self._conn.execute("SELECT total_bytes, entries FROM cache_stats WHERE id = 0").fetchone()
+        return (row[0], row[1]) if row else (0, 0)
+    
+    def _evict_if_needed(self):
+        """超过体积上限时淘汰最久未使用的条目（淘汰到上限的90%）"""
+        total_bytes, count = self._size_and_count()
+        if total_bytes <= self.max_bytes or count == 0:
+            return
+        
+        target_bytes = int(self.max_bytes * 0.9)
+        avg_bytes = total_bytes / count
+        n_evict = min(count, int((total_bytes - target_bytes) / avg_bytes) + 1)
+        
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+            (n_evict,)
+        )
+        self._conn.commit()
+        self.evictions += n_evict
+        logger.info(f"Embedding缓存超过上限，已淘汰 {n_evict} 条")
+    
+    def get_stats(self) -> Dict:
+        """获取缓存统计信息"""
+        with self._lock:
+            total_bytes, count = self._size_and_count()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': count,
+            'size_mb': round(total_bytes / 1024 / 1024, 2),
+            'max_size_mb': round(self.max_bytes / 1024 / 1024, 2)
+        }
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+        logger.warning(f"已清空Embedding缓存: {self.db_path}")
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,239 @@
+"""
+Embedding常驻服务
+在本机HTTP端口上常驻一个Embedding模型，把多个客户端（test_query.py、build_index.py、
+update_index.py等）的请求合并成批次推理；EmbeddingModel 的客户端模式通过 EmbeddingClient 访问
+"""
+
+import json
+import base64
+import time
+import urllib.request
+import urllib.error
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from .micro_batcher import MicroBatcher
+from .config import (
+    EMBEDDING_SERVER_HOST, EMBEDDING_SERVER_PORT, EMBEDDING_SERVER_URL,
+    EMBEDDING_SERVER_BATCH_WAIT_MS, EMBEDDING_SERVER_MAX_BATCH
+)
+
+logger = logging.getLogger(__name__)
+
+# 请求类型：文档向量化 / 查询向量化（带query指令和查询缓存）
+KIND_DOCUMENTS = "documents"
+KIND_QUERIES = "queries"
+
+def resolve_server_url(server_url: str = EMBEDDING_SERVER_URL) -> Optional[str]:
+    """
+    解析 EMBEDDING_SERVER_URL 配置
+
+    Returns:
+        服务地址；配置为 off 或空时返回None，auto 时返回本机默认地址
+    """
+    value = (server_url or "").strip()
+    if value.lower() in ("", "off", "false", "none"):
+        return None
+    if value.lower() == "auto":
+        return f"http://{EMBEDDING_SERVER_HOST}:{EMBEDDING_SERVER_PORT}"
+    return value.rstrip("/")
+
+def _pack_embeddings(embeddings: List[List[float]]) -> Dict:
+    """向量列表 → 紧凑的base64 float32编码（比JSON浮点数小得多、解析快得多）"""
+    dimension = len(embeddings[0]) if embeddings else 0
+    flat = array('f')
+    for embedding in embeddings:
+        flat.extend(embedding)
+    return {
+        'count': len(embeddings),
+        'dimension': dimension,
+        'data': base64.b64encode(flat.tobytes()).decode('ascii')
+    }
+
+def _unpack_embeddings(payload: Dict) -> List[List[float]]:
+    """_pack_embeddings 的逆操作"""
+    flat = array('f', base64.b64decode(payload['data']))
+    dimension = payload['dimension']
+    return [flat[i * dimension:(i + 1) * dimension].tolist() for i in range(payload['count'])]
+
+class RequestBatcher(MicroBatcher):
+    """
+    合批线程
+
+    收到第一个请求后最多再等待 max_wait_ms，把期间到达的其他请求（同类型）拼成一批，
+    一次送入模型推理后再按请求拆分结果；模型只在这一个线程里调用
+    """
+
+    def __init__(self, embedding_model, max_wait_ms: float = EMBEDDING_SERVER_BATCH_WAIT_MS,
+                 max_batch: int = EMBEDDING_SERVER_MAX_BATCH):
+        """
+        Args:
+            embedding_model: 本地加载的 EmbeddingModel
+            max_wait_ms: 凑批等待时间（毫秒）
+            max_batch: 每批最多的文本数（超过后立即推理）
+        """
+        super().__init__(self._encode, max_wait_ms, max_batch, name="embedding-batcher")
+        self.embedding_model = embedding_model
+
+    def encode(self, kind: str, texts: List[str], normalize: bool = True) -> List[List[float]]:
+        """提交请求并等待结果（由HTTP处理线程调用）"""
+        # 按 (类型, 是否归一化) 分组，每组一次推理
+        return self.submit(texts, key=(kind, normalize)).result()
+
+    def _encode(self, key: Tuple[str, bool], texts: List[str]) -> List[List[float]]:
+        kind, normalize = key
+        if kind == KIND_QUERIES:
+            return self.embedding_model.encode_queries(texts)
+        return self.embedding_model.encode(
+            texts,
+            normalize_embeddings=normalize,
+            show_progress_bar=False
+        )
+
+    def get_stats(self) -> Dict:
+        """合批统计"""
+        stats = super().get_stats()
+        stats['texts'] = stats['items']
+        stats['avg_batch_texts'] = stats['avg_batch']
+        return stats
+
+class EmbeddingServer:
+    """Embedding HTTP服务（仅监听本机地址）"""
+
+    def __init__(self, embedding_model, host: str = EMBEDDING_SERVER_HOST, port: int = EMBEDDING_SERVER_PORT,
+                 max_wait_ms: float = EMBEDDING_SERVER_BATCH_WAIT_MS, max_batch: int = EMBEDDING_SERVER_MAX_BATCH):
+        """
+        初始化服务
+
+        Args:
+            embedding_model: 本地加载的 EmbeddingModel
+            host: 监听地址
+            port: 监听端口
+            max_wait_ms: 凑批等待时间（毫秒）
+            max_batch: 每批最多的文本数
+        """
+        self.embedding_model = embedding_model
+        self.batcher = RequestBatcher(embedding_model, max_wait_ms, max_batch)
+        self.started_at = time.time()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+
+    def health(self) -> Dict:
+        """服务状态（客户端据此确认模型一致）"""
+        model = self.embedding_model
+        return {
+            'status': 'ok',
+            'model_name': model.model_name,
+            'cache_key': model.cache_key,
+            'backend': model.backend,
+            'dimension': model.dimension,
+            'uptime': round(time.time() - self.started_at, 1),
+            'batching': self.batcher.get_stats(),
+            'query_cache': model.get_query_cache_stats(),
+            'cache': model.get_cache_stats()
+        }
+
+    def serve_forever(self):
+        """启动服务（阻塞，Ctrl+C退出）"""
+        self.batcher.start()
+        host, port = self.httpd.server_address[:2]
+        logger.info(f"Embedding服务已启动: http://{host}:{port}（模型 {self.embedding_model.model_name}）")
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+
+    def shutdown(self):
+        """停止服务（从其他线程调用）"""
+        self.httpd.shutdown()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def _send_json(self, status: int, payload: Dict):
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == '/health':
+                    self._send_json(200, server.health())
+                else:
+                    self._send_json(404, {'error': f'unknown path {self.path}'})
+
+            def do_POST(self):
+                kinds = {'/encode': KIND_DOCUMENTS, '/encode_queries': KIND_QUERIES}
+                kind = kinds.get(self.path)
+                if kind is None:
+                    self._send_json(404, {'error': f'unknown path {self.path}'})
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    request = json.loads(self.rfile.read(length).decode('utf-8'))
+                    texts = request['texts']
+                    if not isinstance(texts, list):
+                        raise ValueError("texts必须是列表")
+                except Exception as e:
+                    self._send_json(400, {'error': str(e)})
+                    return
+                try:
+                    embeddings = server.batcher.encode(kind, texts, bool(request.get('normalize', True))) if texts else []
+                except Exception as e:
+                    self._send_json(500, {'error': str(e)})
+                    return
+                self._send_json(200, _pack_embeddings(embeddings))
+
+        return Handler
+
+class EmbeddingClient:
+    """Embedding服务客户端"""
+
+    def __init__(self, server_url: str, timeout: float = 600.0):
+        """
+        Args:
+            server_url: 服务地址（如 http://127.0.0.1:8765）
+            timeout: 请求超时（秒），构建索引时单个请求可能较慢
+        """
+        self.server_url = server_url.rstrip('/')
+        self.timeout = timeout
+
+    def health(self, timeout: Optional[float] = None) -> Dict:
+        """
+        查询服务状态
+
+        Raises:
+            OSError: 服务不可用
+        """
+        with urllib.request.urlopen(f"{self.server_url}/health", timeout=timeout or self.timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+    def encode(self, texts: List[str], normalize: bool = True) -> List[List[float]]:
+        """文档向量化（服务端使用其Embedding磁盘缓存和token分桶组批）"""
+        return self._post('/encode', {'texts': texts, 'normalize': normalize})
+
+    def encode_queries(self, queries: List[str]) -> List[List[float]]:
+        """查询向量化（服务端添加query指令并使用其查询缓存）"""
+        return self._post('/encode_queries', {'texts': queries})
+
+    def _post(self, path: str, payload: Dict) -> List[List[float]]:
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        request = urllib.request.Request(
+            f"{self.server_url}{path}",
+            data=data,
+            headers={'Content-Type': 'application/json; charset=utf-8'}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return _unpack_embeddings(json.loads(response.read().decode('utf-8')))
+        except urllib.error.HTTPError as e:
+            detail = e.read().decode('utf-8', errors='replace')
+            raise RuntimeError(f"Embedding服务返回错误 {e.code}: {detail}") from e
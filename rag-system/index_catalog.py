@@ -0,0 +1,272 @@
+"""
+YAML索引目录（catalog）
+把 rag-index/indexes/*.yaml 解析后编译成一个pickle文件，按文件 mtime/大小/哈希 增量失效，
+由 DocumentLoader、HybridRetriever、RAGChain 共享同一份内存数据，
+冷启动只读一个文件，查询时不再遍历目录或解析YAML
+"""
+
+import os
+import pickle
+import hashlib
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import yaml
+
+from .config import INDEX_DIR, CACHE_DIR, INDEX_CATALOG_CHECK_INTERVAL
+from .pattern_matcher import PatternMatcher
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE = CACHE_DIR / "index_catalog.pkl"
+
+# 格式变化时递增，旧文件会被整体重建
+_CATALOG_FORMAT = 1
+
+# 文件签名：(mtime_ns, size, sha256)
+FileSignature = Tuple[int, int, str]
+
+def _hash_file(path: Path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def _content_version(sources: Dict[str, FileSignature]) -> str:
+    """由各YAML文件名和内容哈希得出的目录版本（同样的内容在任何进程、任何机器上都相同）"""
+    digest = hashlib.sha256()
+    for name in sorted(sources):
+        digest.update(f"{name}\0{sources[name][2]}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+class IndexCatalog:
+    """编译后的YAML索引目录"""
+
+    def __init__(
+        self,
+        index_dir: Path = INDEX_DIR,
+        catalog_path: Path = CATALOG_FILE,
+        check_interval: float = INDEX_CATALOG_CHECK_INTERVAL
+    ):
+        """
+        初始化索引目录（读取pickle并校验，有变化的YAML会被重新解析）
+
+        Args:
+            index_dir: YAML索引文件目录
+            catalog_path: 编译后的目录文件路径
+            check_interval: 访问时自动检查YAML变化的最小间隔（秒），0表示每次访问都检查，负数表示不自动检查
+        """
+        self.index_dir = index_dir
+        self.catalog_path = catalog_path
+        self.check_interval = check_interval
+
+        self._lock = threading.RLock()
+        self._last_check = 0.0
+        self.entries: Dict[str, Dict] = {}
+        self.errors: Dict[str, str] = {}
+        self.sources: Dict[str, FileSignature] = {}
+        # 内容版本，参与共享结果缓存/语义缓存的键，不能用进程内计数器
+        self.version = _content_version(self.sources)
+        # query_patterns/keywords 的自动机（首次匹配时建立，目录变化后重建）
+        self._matcher: Optional[PatternMatcher] = None
+        # 文档ID -> 标题（首次使用时建立，目录变化后重建）
+        self._titles: Optional[Dict[str, str]] = None
+
+        self._load()
+        self.refresh(force=True)
+
+    def _load(self):
+        """读取编译后的目录文件（不存在或格式不符时视为空）"""
+        if not self.catalog_path.exists():
+            return
+        try:
+            with open(self.catalog_path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('format') != _CATALOG_FORMAT or data.get('index_dir') != str(self.index_dir):
+                return
+            self.entries = data['entries']
+            self.errors = data['errors']
+            self.sources = data['sources']
+            self.version = _content_version(self.sources)
+        except Exception as e:
+            logger.warning(f"索引目录文件读取失败，将重新编译 {self.catalog_path}: {e}")
+
+    def _save(self):
+        """原子写入目录文件（多进程同时写时互不破坏）"""
+        data = {
+            'format': _CATALOG_FORMAT,
+            'index_dir': str(self.index_dir),
+            'entries': self.entries,
+            'errors': self.errors,
+            'sources': self.sources
+        }
+        self.catalog_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.catalog_path.with_suffix(f'.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.catalog_path)
+        except OSError as e:
+            logger.warning(f"索引目录文件写入失败 {self.catalog_path}: {e}")
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        检查YAML文件变化，只重新解析 mtime/大小变化且内容哈希也变化的文件
+
+        Args:
+            force: 忽略 check_interval 立即检查
+
+        Returns:
+            目录内容是否发生变化
+        """
+        with self._lock:
+            now = time.monotonic()
+            if not force and (self.check_interval < 0 or now - self._last_check < self.check_interval):
+                return False
+            self._last_check = now
+
+            current: Dict[str, Tuple[int, int]] = {}
+            if self.index_dir.exists():
+                for entry in os.scandir(self.index_dir):
+                    if entry.is_file() and entry.name.endswith('.yaml'):
+                        stat = entry.stat()
+                        current[entry.name] = (stat.st_mtime_ns, stat.st_size)
+
+            changed = False
+            stamps_changed = False
+            for name, (mtime_ns, size) in current.items():
+                old = self.sources.get(name)
+                if old is not None and old[:2] == (mtime_ns, size):
+                    continue
+
+                path = self.index_dir / name
+                try:
+                    digest = _hash_file(path)
+                except OSError:
+                    continue
+                if old is not None and old[2] == digest:
+                    # 只是mtime变化（如touch、git checkout），内容未变
+                    self.sources[name] = (mtime_ns, size, digest)
+                    stamps_changed = True
+                    continue
+
+                self._parse(path)
+                self.sources[name] = (mtime_ns, size, digest)
+                changed = True
+
+            for name in [name for name in self.sources if name not in current]:
+                doc_id = name[:-len('.yaml')]
+                self.entries.pop(doc_id, None)
+                self.errors.pop(doc_id, None)
+                del self.sources[name]
+                changed = True
+
+            if changed:
+                self.version = _content_version(self.sources)
+                self._matcher = None
+                self._titles = None
+                logger.info(f"索引目录已更新: {len(self.entries)} 个索引（版本 {self.version}）")
+            if changed or stamps_changed:
+                self._save()
+            return changed
+
+    def _parse(self, path: Path):
+        doc_id = path.stem
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = yaml.safe_load(f)
+            if not isinstance(data, dict):
+                raise ValueError("索引文件内容不是字典")
+            self.entries[doc_id] = data
+            self.errors.pop(doc_id, None)
+        except Exception as e:
+            logger.warning(f"加载索引文件失败 {path}: {e}")
+            self.entries.pop(doc_id, None)
+            self.errors[doc_id] = str(e)
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        """
+        获取文档的索引数据
+
+        Args:
+            doc_id: 文档ID
+
+        Returns:
+            索引数据字典，不存在或解析失败时返回None
+        """
+        self.refresh()
+        return self.entries.get(doc_id)
+
+    def get_matcher(self) -> PatternMatcher:
+        """
+        获取基于当前目录内容的模式匹配器
+
+        Returns:
+            PatternMatcher（文档按ID排序）
+        """
+        self.refresh()
+        matcher = self._matcher
+        if matcher is None:
+            with self._lock:
+                if self._matcher is None:
+                    self._matcher = PatternMatcher(sorted(self.entries.items()))
+                matcher = self._matcher
+        return matcher
+
+    def get_titles(self) -> Dict[str, str]:
+        """
+        获取文档标题表（只读，目录不变时返回同一个字典）
+
+        Returns:
+            文档ID -> 标题（索引中没有title字段时为文档ID）
+        """
+        self.refresh()
+        titles = self._titles
+        if titles is None:
+            with self._lock:
+                if self._titles is None:
+                    self._titles = {doc_id: data.get('title', doc_id) for doc_id, data in self.entries.items()}
+                titles = self._titles
+        return titles
+
+    def get_error(self, doc_id: str) -> Optional[str]:
+        """获取索引文件的解析错误（没有错误时返回None）"""
+        return self.errors.get(doc_id)
+
+    def doc_ids(self) -> List[str]:
+        """所有解析成功的文档ID（按文件名排序）"""
+        self.refresh()
+        return sorted(self.entries)
+
+    def items(self) -> List[Tuple[str, Dict]]:
+        """所有 (文档ID, 索引数据)（按文件名排序）"""
+        self.refresh()
+        return sorted(self.entries.items())
+
+# 每个索引目录在进程内只保留一个实例
+_catalogs: Dict[str, IndexCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+def get_index_catalog(index_dir: Path = INDEX_DIR) -> IndexCatalog:
+    """
+    获取共享的索引目录实例
+
+    Args:
+        index_dir: YAML索引文件目录
+
+    Returns:
+        该目录对应的 IndexCatalog（同一进程内共享）
+    """
+    key = str(Path(index_dir).resolve())
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            # 默认目录使用默认的目录文件，其他目录按路径哈希区分
+            if Path(index_dir).resolve() == INDEX_DIR.resolve():
+                catalog_path = CATALOG_FILE
+            else:
+                catalog_path = CACHE_DIR / f"index_catalog_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}.pkl"
+            catalog = IndexCatalog(Path(index_dir), catalog_path)
+            _catalogs[key] = catalog
+        return catalog
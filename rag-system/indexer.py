@@ -0,0 +1,397 @@
+"""
+增量索引模块
+维护文档文件哈希清单（manifest），按块对比新旧内容，只删除/写入/跳过需要变动的块
+"""
+
+import json
+import hashlib
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+import logging
+
+from .config import INDEX_DIR, VECTOR_DB_DIR, DOC_MAPPING, get_doc_file_path
+from .document_loader import DocumentLoader, get_chunk_id
+from .embedding import EmbeddingModel
+from .vector_store import VectorStore
+from .result_cache import bump_index_version
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = VECTOR_DB_DIR / "index_manifest.json"
+JOURNAL_FILE = VECTOR_DB_DIR / "build_journal.jsonl"
+
+def hash_file(path: Path) -> str:
+    """计算文件内容的sha256"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+class IndexManifest:
+    """
+    索引清单
+    
+    记录每个文档入库时Markdown文件和YAML索引文件的哈希，
+    用于判断哪些文档在上次索引后发生了变化
+    """
+    
+    def __init__(self, manifest_path: Path = MANIFEST_FILE, index_dir: Path = INDEX_DIR):
+        """
+        初始化索引清单
+        
+        Args:
+            manifest_path: 清单文件路径
+            index_dir: YAML索引文件目录
+        """
+        self.manifest_path = manifest_path
+        self.index_dir = index_dir
+        self.documents: Dict[str, Dict] = {}
+        self.load()
+    
+    def load(self):
+        """从磁盘加载清单"""
+        if not self.manifest_path.exists():
+            self.documents = {}
+            return
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.documents = data.get('documents', {})
+        except Exception as e:
+            logger.warning(f"索引清单读取失败，将视为空清单 {self.manifest_path}: {e}")
+            self.documents = {}
+    
+    def save(self):
+        """保存清单（先写临时文件再替换，避免写一半损坏）"""
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'documents': self.documents}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+    
+    def clear(self):
+        """清空清单（重建索引时使用）"""
+        self.documents = {}
+        self.save()
+    
+    def current_state(self, doc_id: str) -> Dict:
+        """
+        计算文档当前的文件状态
+        
+        Args:
+            doc_id: 文档ID
+        
+        Returns:
+            包含 doc_path、doc_hash、index_hash 的字典（文件不存在时对应哈希为None）
+        """
+        try:
+            doc_path = get_doc_file_path(doc_id)
+            doc_hash = hash_file(doc_path)
+        except (ValueError, FileNotFoundError):
+            doc_path = None
+            doc_hash = None
+        
+        index_file = self.index_dir / f"{doc_id}.yaml"
+        index_hash = hash_file(index_file) if index_file.exists() else None
+        
+        return {
+            'doc_path': str(doc_path) if doc_path else None,
+            'doc_hash': doc_hash,
+            'index_hash': index_hash
+        }
+    
+    def is_changed(self, doc_id: str, state: Optional[Dict] = None) -> bool:
+        """判断文档自上次入库后是否发生变化"""
+        entry = self.documents.get(doc_id)
+        if entry is None:
+            return True
+        state = state or self.current_state(doc_id)
+        return (
+            entry.get('doc_hash') != state['doc_hash']
+            or entry.get('index_hash') != state['index_hash']
+        )
+    
+    def record(self, doc_id: str, chunk_ids: List[str], state: Optional[Dict] = None):
+        """
+        记录文档已入库
+        
+        Args:
+            doc_id: 文档ID
+            chunk_ids: 文档当前的全部块ID
+            state: 入库前计算的文件状态（可选，默认重新计算）
+        """
+        state = state or self.current_state(doc_id)
+        self.documents[doc_id] = {
+            **state,
+            'chunk_count': len(chunk_ids),
+            'updated_at': datetime.now().isoformat(timespec='seconds')
+        }
+    
+    def remove(self, doc_id: str):
+        """从清单中移除文档"""
+        self.documents.pop(doc_id, None)
+    
+    def find_changed(self, doc_ids: Optional[List[str]] = None) -> Tuple[List[str], List[str]]:
+        """
+        找出需要更新的文档
+        
+        Args:
+            doc_ids: 待检查的文档ID列表（默认为DOC_MAPPING中的全部文档）
+        
+        Returns:
+            (changed, removed)：内容有变化或尚未入库的文档，以及已从DOC_MAPPING移除的文档
+        """
+        if doc_ids is None:
+            doc_ids = list(DOC_MAPPING.keys())
+        
+        changed = [doc_id for doc_id in doc_ids if self.is_changed(doc_id)]
+        removed = [doc_id for doc_id in self.documents if doc_id not in DOC_MAPPING]
+        return changed, removed
+
+class BuildJournal:
+    """
+    构建日志
+    
+    追加写入的JSONL文件，记录一次完整构建中已提交到向量数据库的批次和文档，
+    构建中断后可据此从最后提交的位置继续（build_index.py --resume）
+    """
+    
+    def __init__(self, journal_path: Path = JOURNAL_FILE):
+        """
+        初始化构建日志
+        
+        Args:
+            journal_path: 日志文件路径
+        """
+        self.journal_path = journal_path
+        self.build: Optional[Dict] = None
+        self.finished = False
+        self.batches = 0
+        self.committed_chunks: Set[str] = set()
+        self.committed_docs: Set[str] = set()
+        self.doc_states: Dict[str, str] = {}
+        self.load()
+    
+    def load(self):
+        """从磁盘读取日志（中断时写了一半的最后一行会被忽略）"""
+        self.build = None
+        self.finished = False
+        self.batches = 0
+        self.committed_chunks = set()
+        self.committed_docs = set()
+        self.doc_states = {}
+        if not self.journal_path.exists():
+            return
+        
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"构建日志中有不完整的记录，已忽略: {line[:80]!r}")
+                    continue
+                kind = entry.get('type')
+                if kind == 'start':
+                    self.build = entry
+                elif kind == 'batch':
+                    self.batches += 1
+                    self.committed_chunks.update(entry['chunk_ids'])
+                    self.doc_states.update(entry.get('doc_states', {}))
+                elif kind == 'document':
+                    self.committed_docs.add(entry['doc_id'])
+                elif kind == 'finish':
+                    self.finished = True
+    
+    @property
+    def is_unfinished(self) -> bool:
+        """是否存在一次已开始但未完成的构建"""
+        return self.build is not None and not self.finished
+    
+    def start(self, options: Dict):
+        """
+        开始新的构建（覆盖旧日志）
+        
+        Args:
+            options: 本次构建的参数，仅用于记录
+        """
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        self.journal_path.write_text('', encoding='utf-8')
+        self.load()
+        self.build = {'type': 'start', 'started_at': datetime.now().isoformat(timespec='seconds'), 'options': options}
+        self._append(self.build)
+    
+    @staticmethod
+    def state_key(state: Dict) -> str:
+        """把 IndexManifest.current_state 的结果压缩成一个字符串，用于判断文档是否被修改过"""
+        return f"{state['doc_hash']}:{state['index_hash']}"
+    
+    def commit_batch(self, chunk_ids: List[str], doc_states: Dict[str, str]):
+        """
+        记录一个已写入向量数据库的批次
+        
+        Args:
+            chunk_ids: 批次中的块ID
+            doc_states: 批次涉及的文档 → 写入时的文件状态（state_key）
+        """
+        self.batches += 1
+        self.committed_chunks.update(chunk_ids)
+        self.doc_states.update(doc_states)
+        self._append({'type': 'batch', 'seq': self.batches, 'chunk_ids': chunk_ids, 'doc_states': doc_states})
+    
+    def commit_document(self, doc_id: str):
+        """记录一个全部块都已写入的文档"""
+        self.committed_docs.add(doc_id)
+        self._append({'type': 'document', 'doc_id': doc_id})
+    
+    def finish(self):
+        """标记构建完成"""
+        self.finished = True
+        self._append({'type': 'finish', 'finished_at': datetime.now().isoformat(timespec='seconds')})
+    
+    def _append(self, entry: Dict):
+        # 每条记录落盘后才算提交，进程被杀时最多丢失正在写入的一行
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+class IncrementalIndexer:
+    """增量索引器：按块对比后只删除/写入/跳过需要变动的块"""
+    
+    def __init__(
+        self,
+        embedding_model: EmbeddingModel,
+        vector_store: VectorStore,
+        document_loader: Optional[DocumentLoader] = None,
+        manifest: Optional[IndexManifest] = None
+    ):
+        """
+        初始化增量索引器
+        
+        Args:
+            embedding_model: Embedding模型实例
+            vector_store: 向量数据库实例
+            document_loader: 文档加载器（可选）
+            manifest: 索引清单（可选）
+        """
+        self.embedding_model = embedding_model
+        self.vector_store = vector_store
+        self.document_loader = document_loader or DocumentLoader()
+        self.manifest = manifest or IndexManifest()
+    
+    def sync_document(self, doc_id: str, force: bool = False, delete_stale: bool = True) -> Dict:
+        """
+        同步单个文档的索引
+        
+        Args:
+            doc_id: 文档ID
+            force: 即使文件哈希未变化也重新对比所有块
+            delete_stale: 是否删除库中已不存在于新分块结果的旧块
+        
+        Returns:
+            同步统计，包含 status（unchanged/updated/failed）、added、updated、deleted、skipped
+        """
+        stats = {'doc_id': doc_id, 'status': 'unchanged', 'added': 0, 'updated': 0, 'deleted': 0, 'skipped': 0}
+        
+        state = self.manifest.current_state(doc_id)
+        if not force and not self.manifest.is_changed(doc_id, state):
+            logger.info(f"文档 {doc_id} 未变化，跳过")
+            return stats
+        
+        # 加载并分块（先让索引目录重新校验YAML，只重新解析变化的文件）
+        self.document_loader.catalog.refresh(force=True)
+        try:
+            doc = self.document_loader.load_document(doc_id)
+            chunks = self.document_loader.chunk_document(doc)
+        except Exception as e:
+            logger.error(f"❌ 加载文档 {doc_id} 失败: {e}")
+            stats['status'] = 'failed'
+            return stats
+        
+        new_chunks = {get_chunk_id(chunk): chunk for chunk in chunks}
+        stored_chunks = self.vector_store.get_doc_chunks(doc_id)
+        
+        # 块级对比：内容和metadata都相同的块直接跳过
+        to_write = []
+        for chunk_id, chunk in new_chunks.items():
+            stored = stored_chunks.get(chunk_id)
+            if stored is None:
+                stats['added'] += 1
+                to_write.append(chunk_id)
+            elif (
+                stored['content'] != chunk['content']
+                or stored['metadata'] != self.vector_store.build_metadata(chunk)
+            ):
+                stats['updated'] += 1
+                to_write.append(chunk_id)
+            else:
+                stats['skipped'] += 1
+        
+        stale_ids = [chunk_id for chunk_id in stored_chunks if chunk_id not in new_chunks]
+        
+        try:
+            if to_write:
+                write_chunks = [new_chunks[chunk_id] for chunk_id in to_write]
+                embeddings = self.embedding_model.encode_batch(
+                    [chunk['content'] for chunk in write_chunks],
+                    show_progress_bar=False
+                )
+                self.vector_store.upsert_documents(write_chunks, embeddings, to_write)
+            
+            if delete_stale and stale_ids:
+                self.vector_store.delete_chunks(stale_ids)
+                stats['deleted'] = len(stale_ids)
+            self.vector_store.flush()
+            if to_write or stats['deleted']:
+                bump_index_version()
+        except Exception as e:
+            logger.error(f"❌ 文档 {doc_id} 写入向量数据库失败: {e}")
+            stats['status'] = 'failed'
+            return stats
+        
+        self.manifest.record(doc_id, list(new_chunks.keys()), state)
+        self.manifest.save()
+        
+        stats['status'] = 'updated' if (to_write or stats['deleted']) else 'unchanged'
+        logger.info(
+            f"✅ {doc_id}: 新增 {stats['added']}，更新 {stats['updated']}，"
+            f"删除 {stats['deleted']}，跳过 {stats['skipped']}"
+        )
+        return stats
+    
+    def remove_document(self, doc_id: str) -> int:
+        """
+        从索引中移除文档
+        
+        Args:
+            doc_id: 文档ID
+        
+        Returns:
+            删除的块数量
+        """
+        deleted = self.vector_store.delete_document(doc_id)
+        self.vector_store.flush()
+        bump_index_version()
+        self.manifest.remove(doc_id)
+        self.manifest.save()
+        logger.info(f"已从索引中移除文档 {doc_id}（{deleted} 个块）")
+        return deleted
+    
+    def sync_changed(self) -> List[Dict]:
+        """
+        自动找出发生变化的文档并同步
+        
+        Returns:
+            每个文档的同步统计列表
+        """
+        changed, removed = self.manifest.find_changed()
+        logger.info(f"检测到 {len(changed)} 个文档有变化，{len(removed)} 个文档已移除")
+        
+        results = [self.sync_document(doc_id, force=True) for doc_id in changed]
+        for doc_id in removed:
+            deleted = self.remove_document(doc_id)
+            results.append({'doc_id': doc_id, 'status': 'removed', 'added': 0, 'updated': 0, 'deleted': deleted, 'skipped': 0})
+        return results
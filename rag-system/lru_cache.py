@@ -0,0 +1,103 @@
+"""
+内存LRU缓存
+线程安全、容量有界，可选TTL过期，带命中统计
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LRUCache:
+    """线程安全的LRU缓存（可选TTL）"""
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        """
+        初始化LRU缓存
+
+        Args:
+            max_size: 最大条目数，超过后淘汰最久未使用的条目
+            ttl: 过期时间（秒），None或0表示不过期
+        """
+        if max_size <= 0:
+            raise ValueError("max_size必须大于0")
+        self.max_size = max_size
+        self.ttl = ttl or None
+
+        self._lock = threading.Lock()
+        # key -> (value, 写入时间)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        查询缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存的值，未命中或已过期时返回None
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            value, stored_at = item
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            value: 缓存的值（不能为None）
+        """
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """清空缓存（保留统计）"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def get_stats(self) -> Dict:
+        """获取缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'ttl': self.ttl
+            }
@@ -0,0 +1,323 @@
+"""
+BGE-M3 稀疏/多向量表示
+BGE-M3 在同一次前向中除稠密向量外还能输出词权重（sparse）和 ColBERT 多向量：
+- M3Heads：在 SentenceTransformer 输出的 token_embeddings 上套用模型自带的 sparse/colbert 线性层
+- MultiVectorStore：按文本哈希内容寻址保存每个块的词权重和压缩后的多向量（SQLite）
+- sparse_score / colbert_score：检索时的打分函数（与 FlagEmbedding 的计算方式一致）
+"""
+
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SPARSE_HEAD_FILE = "sparse_linear.pt"
+COLBERT_HEAD_FILE = "colbert_linear.pt"
+
+# 单条SQL中IN子句的最大参数个数（SQLite默认上限为999）
+_SQL_BATCH = 500
+
+def _resolve_head_file(model_name: str, filename: str) -> Path:
+    """在本地模型目录或HuggingFace缓存中找到线性层权重文件"""
+    local = Path(model_name) / filename
+    if local.exists():
+        return local
+    try:
+        from huggingface_hub import hf_hub_download
+    except ImportError:
+        raise ImportError("未安装huggingface_hub，无法下载BGE-M3的sparse/colbert权重")
+    return Path(hf_hub_download(model_name, filename))
+
+class M3Heads:
+    """BGE-M3 的 sparse / colbert 输出层（numpy实现，输入为 token_embeddings）"""
+
+    def __init__(
+        self,
+        sparse_weight: np.ndarray,
+        sparse_bias: np.ndarray,
+        colbert_weight: np.ndarray,
+        colbert_bias: np.ndarray,
+        special_token_ids: Iterable[int]
+    ):
+        """
+        Args:
+            sparse_weight: sparse线性层权重 (1, hidden)
+            sparse_bias: sparse线性层偏置 (1,)
+            colbert_weight: colbert线性层权重 (dim, hidden)
+            colbert_bias: colbert线性层偏置 (dim,)
+            special_token_ids: 不计入词权重的特殊token（cls/eos/pad/unk）
+        """
+        self.sparse_weight = np.asarray(sparse_weight, dtype=np.float32)
+        self.sparse_bias = np.asarray(sparse_bias, dtype=np.float32)
+        self.colbert_weight = np.asarray(colbert_weight, dtype=np.float32)
+        self.colbert_bias = np.asarray(colbert_bias, dtype=np.float32)
+        self.special_token_ids = set(int(i) for i in special_token_ids)
+
+    @classmethod
+    def from_pretrained(cls, model_name: str, tokenizer) -> "M3Heads":
+        """
+        加载模型自带的线性层权重（BAAI/bge-m3 仓库中的 sparse_linear.pt、colbert_linear.pt）
+
+        Args:
+            model_name: 模型名称或本地路径
+            tokenizer: 模型的tokenizer（用于确定特殊token）
+        """
+        import torch
+
+        sparse = torch.load(str(_resolve_head_file(model_name, SPARSE_HEAD_FILE)), map_location="cpu")
+        colbert = torch.load(str(_resolve_head_file(model_name, COLBERT_HEAD_FILE)), map_location="cpu")
+        special = [
+            getattr(tokenizer, name) for name in
+            ('cls_token_id', 'eos_token_id', 'pad_token_id', 'unk_token_id')
+            if getattr(tokenizer, name, None) is not None
+        ]
+        logger.info(f"BGE-M3 sparse/colbert输出层加载成功（colbert维度 {colbert['weight'].shape[0]}）")
+        return cls(
+            sparse['weight'].float().numpy(), sparse['bias'].float().numpy(),
+            colbert['weight'].float().numpy(), colbert['bias'].float().numpy(),
+            special
+        )
+
+    def sparse(self, token_embeddings: np.ndarray, input_ids: Sequence[int]) -> Dict[int, float]:
+        """
+        词权重：relu(线性层)，同一token取最大值，去掉特殊token和权重为0的token
+
+        Args:
+            token_embeddings: 一条文本去掉padding后的 token_embeddings (n, hidden)
+            input_ids: 对应的token id
+
+        Returns:
+            {token_id: 权重}
+        """
+        weights = np.maximum(token_embeddings @ self.sparse_weight.T + self.sparse_bias, 0)[:, 0]
+        result: Dict[int, float] = {}
+        for token_id, weight in zip(input_ids, weights.tolist()):
+            token_id = int(token_id)
+            if token_id in self.special_token_ids or weight <= 0:
+                continue
+            if weight > result.get(token_id, 0.0):
+                result[token_id] = weight
+        return result
+
+    def colbert(self, token_embeddings: np.ndarray, skip: int = 1) -> np.ndarray:
+        """
+        ColBERT多向量：去掉开头的[CLS]后过线性层并逐个归一化
+
+        Args:
+            token_embeddings: 一条文本去掉padding后的 token_embeddings (n, hidden)
+            skip: 开头跳过的token数（查询带指令前缀时连同指令一起跳过）
+
+        Returns:
+            float32数组 (n-skip, dim)
+        """
+        vectors = token_embeddings[skip:] @ self.colbert_weight.T + self.colbert_bias
+        return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+def compress_colbert(vectors: np.ndarray, pool_factor: int = 2) -> Dict[str, np.ndarray]:
+    """
+    压缩多向量：相邻token按 pool_factor 个一组取平均（重新归一化），再做逐行int8量化
+
+    Args:
+        vectors: 已归一化的多向量 (n, dim)
+        pool_factor: 池化窗口，1表示不池化
+
+    Returns:
+        {'codes': int8 (m, dim), 'scales': float16 (m,)}
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if pool_factor > 1 and len(vectors) > 1:
+        n_groups = -(-len(vectors) // pool_factor)
+        padded = np.zeros((n_groups * pool_factor, vectors.shape[1]), dtype=np.float32)
+        padded[:len(vectors)] = vectors
+        counts = np.full(n_groups, pool_factor, dtype=np.float32)
+        counts[-1] = len(vectors) - (n_groups - 1) * pool_factor
+        vectors = padded.reshape(n_groups, pool_factor, -1).sum(axis=1) / counts[:, None]
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    scales = np.clip(np.abs(vectors).max(axis=1), 1e-12, None) / 127
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return {'codes': codes, 'scales': scales.astype(np.float16)}
+
+def decompress_colbert(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    """compress_colbert 的逆操作（近似）"""
+    return codes.astype(np.float32) * scales.astype(np.float32)[:, None]
+
+def sparse_score(query_weights: Dict[int, float], doc_weights: Dict[int, float]) -> float:
+    """词权重匹配分数：共同token的权重乘积之和"""
+    if len(query_weights) > len(doc_weights):
+        query_weights, doc_weights = doc_weights, query_weights
+    return float(sum(weight * doc_weights[token] for token, weight in query_weights.items() if token in doc_weights))
+
+def colbert_score(query_vectors: np.ndarray, doc_vectors: np.ndarray) -> float:
+    """ColBERT后期交互分数：每个查询向量与文档向量的最大内积的平均"""
+    if not len(query_vectors) or not len(doc_vectors):
+        return 0.0
+    return float((query_vectors @ doc_vectors.T).max(axis=1).mean())
+
+class MultiVectorStore:
+    """
+    按 (模型, 文本哈希) 内容寻址保存每个块的词权重和压缩多向量
+
+    与向量库中的块ID无关：内容不变的块在重建/更新时直接复用，内容变化后自然对应新条目
+    """
+
+    def __init__(self, db_path: Path, model_name: str, pool_factor: int = 2):
+        """
+        Args:
+            db_path: SQLite文件路径
+            model_name: 模型标识（不同模型的输出不能混用）
+            pool_factor: 多向量的池化窗口（见 compress_colbert）
+        """
+        self.db_path = db_path
+        self.model_name = model_name
+        self.pool_factor = pool_factor
+
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS multi_vectors (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                sparse_ids BLOB NOT NULL,
+                sparse_weights BLOB NOT NULL,
+                colbert_codes BLOB NOT NULL,
+                colbert_scales BLOB NOT NULL,
+                dim INTEGER NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        """计算文本哈希"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def missing(self, texts: List[str]) -> List[int]:
+        """
+        找出尚未保存的文本
+
+        Returns:
+            texts 中没有条目的下标
+        """
+        hashes = [self.hash_text(text) for text in texts]
+        found = set()
+        with self._lock:
+            unique_hashes = list(dict.fromkeys(hashes))
+            for i in range(0, len(unique_hashes), _SQL_BATCH):
+                batch = unique_hashes[i:i + _SQL_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT text_hash FROM multi_vectors WHERE model = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                    [self.model_name, *batch]
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return [i for i, text_hash in enumerate(hashes) if text_hash not in found]
+
+    def put_many(self, texts: List[str], outputs: List[Dict]):
+        """
+        保存 EmbeddingModel.encode_multi 的输出
+
+        Args:
+            texts: 文本列表
+            outputs: 与texts对应的 {'sparse': {token_id: 权重}, 'colbert': 多向量}
+        """
+        rows = []
+        for text, output in zip(texts, outputs):
+            sparse = output['sparse']
+            compressed = compress_colbert(output['colbert'], self.pool_factor)
+            rows.append((
+                self.model_name,
+                self.hash_text(text),
+                np.fromiter(sparse.keys(), dtype=np.int32, count=len(sparse)).tobytes(),
+                np.fromiter(sparse.values(), dtype=np.float16, count=len(sparse)).tobytes(),
+                compressed['codes'].tobytes(),
+                compressed['scales'].tobytes(),
+                compressed['codes'].shape[1]
+            ))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO multi_vectors "
+                "(model, text_hash, sparse_ids, sparse_weights, colbert_codes, colbert_scales, dim) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def get_many(self, texts: List[str]) -> List[Optional[Dict]]:
+        """
+        读取多个文本的词权重和多向量
+
+        Returns:
+            与texts对应的 {'sparse': {token_id: 权重}, 'colbert': float32多向量}，没有条目的位置为None
+        """
+        hashes = [self.hash_text(text) for text in texts]
+        found: Dict[str, Dict] = {}
+        with self._lock:
+            unique_hashes = list(dict.fromkeys(hashes))
+            for i in range(0, len(unique_hashes), _SQL_BATCH):
+                batch = unique_hashes[i:i + _SQL_BATCH]
+                rows = self._conn.execute(
+                    "SELECT text_hash, sparse_ids, sparse_weights, colbert_codes, colbert_scales, dim "
+                    f"FROM multi_vectors WHERE model = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                    [self.model_name, *batch]
+                ).fetchall()
+                for text_hash, sparse_ids, sparse_weights, codes, scales, dim in rows:
+                    found[text_hash] = {
+                        'sparse': dict(zip(
+                            np.frombuffer(sparse_ids, dtype=np.int32).tolist(),
+                            np.frombuffer(sparse_weights, dtype=np.float16).astype(np.float32).tolist()
+                        )),
+                        'colbert': decompress_colbert(
+                            np.frombuffer(codes, dtype=np.int8).reshape(-1, dim),
+                            np.frombuffer(scales, dtype=np.float16)
+                        )
+                    }
+        return [found.get(text_hash) for text_hash in hashes]
+
+    def prune(self, keep_texts: Iterable[str]) -> int:
+        """
+        删除不在 keep_texts 中的条目（全量构建后清理已不存在的旧内容）
+
+        Returns:
+            删除的条目数
+        """
+        keep = {self.hash_text(text) for text in keep_texts}
+        with self._lock:
+            stored = [row[0] for row in self._conn.execute(
+                "SELECT text_hash FROM multi_vectors WHERE model = ?", (self.model_name,)
+            )]
+            stale = [text_hash for text_hash in stored if text_hash not in keep]
+            self._conn.executemany(
+                "DELETE FROM multi_vectors WHERE model = ? AND text_hash = ?",
+                [(self.model_name, text_hash) for text_hash in stale]
+            )
+            self._conn.commit()
+        if stale:
+            logger.info(f"已清理 {len(stale)} 条不再使用的多向量")
+        return len(stale)
+
+    def get_stats(self) -> Dict:
+        """条目数与占用空间"""
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(colbert_codes) + LENGTH(sparse_ids) + LENGTH(sparse_weights)), 0) "
+                "FROM multi_vectors WHERE model = ?",
+                (self.model_name,)
+            ).fetchone()
+        return {'entries': count, 'size_mb': round(size / 1024 / 1024, 2)}
+
+    def clear(self):
+        """清空当前模型的条目"""
+        with self._lock:
+            self._conn.execute("DELETE FROM multi_vectors WHERE model = ?", (self.model_name,))
+            self._conn.commit()
@@ -0,0 +1,132 @@
+"""
+请求合批调度
+多个线程各自提交少量条目，调度线程在很短的时间窗口内把同时到达的请求拼成一批，
+一次调用处理函数（如一次模型前向）后按请求拆分结果，再通过Future返回给各自的调用方
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+class _PendingRequest:
+    """等待合批的单个请求"""
+
+    def __init__(self, items: List[Any], key: Hashable):
+        self.items = items
+        self.key = key
+        self.future: Future = Future()
+        self.submitted_at = time.monotonic()
+
+class MicroBatcher(threading.Thread):
+    """
+    合批调度线程
+
+    收到第一个请求后最多再等待 max_wait_ms，把期间到达以及已在排队的其他请求拼成一批（条目数达到 max_batch 时立即处理）；
+    不同 key 的请求分组处理，处理函数只在这一个线程里调用
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Hashable, List[Any]], List[Any]],
+        max_wait_ms: float = 2.0,
+        max_batch: int = 32,
+        name: str = "micro-batcher"
+    ):
+        """
+        Args:
+            process: 处理函数 (key, 条目列表) -> 与条目一一对应的结果列表
+            max_wait_ms: 凑批等待时间（毫秒）
+            max_batch: 每批最多的条目数
+            name: 线程名称
+        """
+        super().__init__(name=name, daemon=True)
+        self.process = process
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max_batch
+        self.queue: "queue.Queue[_PendingRequest]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'batches': 0, 'items': 0, 'queue_ms': 0.0, 'process_ms': 0.0}
+
+    def submit(self, items: List[Any], key: Hashable = None) -> Future:
+        """
+        提交请求（任意线程调用）
+
+        Args:
+            items: 条目列表（同一请求的条目总在同一批中处理）
+            key: 分组键，只有key相同的请求会合成一批
+
+        Returns:
+            结果为与items一一对应的列表的Future
+        """
+        request = _PendingRequest(items, key)
+        self.queue.put(request)
+        return request.future
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            total = len(batch[0].items)
+            deadline = time.monotonic() + self.max_wait
+            while total < self.max_batch:
+                # 窗口结束后仍取走已在排队的请求（处理上一批期间到达的），但不再等待
+                timeout = deadline - time.monotonic()
+                try:
+                    request = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(request)
+                total += len(request.items)
+
+            # 按key分组，每组一次处理
+            groups: Dict[Hashable, List[_PendingRequest]] = {}
+            for request in batch:
+                groups.setdefault(request.key, []).append(request)
+            for key, requests in groups.items():
+                self._run_group(key, requests)
+
+    def _run_group(self, key: Hashable, requests: List[_PendingRequest]):
+        items = [item for request in requests for item in request.items]
+        start = time.monotonic()
+        try:
+            results = self.process(key, items)
+            offset = 0
+            for request in requests:
+                request.future.set_result(results[offset:offset + len(request.items)])
+                offset += len(request.items)
+        except Exception as e:
+            logger.error(f"合批处理失败（{len(items)} 条）: {e}")
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        end = time.monotonic()
+
+        with self._stats_lock:
+            self.stats['requests'] += len(requests)
+            self.stats['batches'] += 1
+            self.stats['items'] += len(items)
+            self.stats['queue_ms'] += sum(start - request.submitted_at for request in requests) * 1000
+            self.stats['process_ms'] += (end - start) * 1000
+
+    def get_stats(self) -> Dict:
+        """
+        合批统计
+
+        Returns:
+            requests、batches、items，以及 avg_batch（每批条目数）、
+            avg_queue_ms（请求等待凑批的平均时间）、avg_process_ms（每批处理耗时）
+        """
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['avg_batch'] = stats['items'] / stats['batches'] if stats['batches'] else 0.0
+        stats['avg_queue_ms'] = round(stats['queue_ms'] / stats['requests'], 3) if stats['requests'] else 0.0
+        stats['avg_process_ms'] = round(stats['process_ms'] / stats['batches'], 3) if stats['batches'] else 0.0
+        stats['queue_ms'] = round(stats['queue_ms'], 2)
+        stats['process_ms'] = round(stats['process_ms'], 2)
+        stats['max_wait_ms'] = self.max_wait * 1000
+        stats['max_batch'] = self.max_batch
+        return stats
@@ -0,0 +1,831 @@
+"""
+NumPy精确检索后端
+语料只有数千个块时，对归一化的 float32 矩阵做一次矩阵-向量乘法就能得到精确的Top-K，
+比经过 Chroma（SQLite + HNSW + 结果封装）更快。
+
+实现 VectorStore 用到的 Chroma 集合接口子集（add / upsert / get / delete / query / count），
+通过 VECTOR_DB_TYPE=numpy 启用：
+- 向量保存在连续的 float32 数组中（按容量倍增扩展）
+- 检索：向量化内积 + argpartition 取Top-K，元数据过滤用布尔掩码
+- 持久化：写入先在内存中生效，persist()（VectorStore.flush()）时生成新一代目录，原子替换 manifest.json 后切换；
+  多个写入进程（如 watch_index.py 与 update_index.py）用集合目录下的 write.lock 互斥，
+  落盘前若磁盘上已有更新的一代，先加载它再重放本进程未落盘的写入
+
+磁盘格式可以只读 mmap，多个API工作进程通过页缓存共享同一份数据（MmapCollection）：
+- embeddings.npy：定长的向量行
+- ids / documents / metadata：UTF-8 拼接的 .bin + 偏移表 .offsets.npy（只解码返回的行）
+- 列式元数据：doc_id / chunk_type / layer / doc_type 按字典编码为 int32 列，weight 为 float32 列
+"""
+
+import os
+import json
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import logging
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from .config import NUMPY_STORE_CHECK_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# 格式变化时递增
+_STORE_FORMAT = 2
+
+MANIFEST_FILE = "manifest.json"
+
+# 写入进程之间的互斥锁文件
+LOCK_FILE = "write.lock"
+
+# 旧的代被替换后至少保留这么久（秒）再删除：只读进程可能刚读完旧 manifest、还没来得及映射文件
+GENERATION_GRACE_SECONDS = 60.0
+
+# 列式保存、可直接按列过滤的元数据字段
+COLUMN_FIELDS = ('doc_id', 'chunk_type', 'layer', 'doc_type')
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+def _top_k(
+    matrix: np.ndarray,
+    query_embeddings: Sequence[Sequence[float]],
+    n_results: int,
+    rows: Optional[np.ndarray] = None
+) -> Tuple[List[List[int]], np.ndarray]:
+    """
+    精确Top-K（矩阵行已归一化，内积即余弦相似度）
+
+    Args:
+        matrix: 向量矩阵（可以是mmap）
+        query_embeddings: 查询向量
+        n_results: 每个查询返回的数量
+        rows: 参与检索的行（过滤后的候选），None表示全部
+
+    Returns:
+        (每个查询的行号列表, 对应的余弦距离数组)
+    """
+    queries = np.asarray(query_embeddings, dtype=np.float32)
+    if queries.ndim == 1:
+        queries = queries[None, :]
+    candidates = matrix if rows is None else matrix[rows]
+    k = min(n_results, len(candidates))
+    if k == 0:
+        return [[] for _ in range(len(queries))], np.zeros((len(queries), 0), dtype=np.float32)
+
+    similarities = _normalize_rows(queries) @ candidates.T
+    if k < len(candidates):
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(len(candidates)), (len(queries), len(candidates)))
+    top_scores = np.take_along_axis(similarities, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    scores = np.take_along_axis(top_scores, order, axis=1)
+    if rows is not None:
+        top = rows[top]
+    return top.tolist(), 1.0 - scores
+
+def _parse_weight(metadata: Dict) -> float:
+    try:
+        return float(metadata.get('weight', 1.0))
+    except (TypeError, ValueError):
+        return 1.0
+
+# ---------- 磁盘格式 ----------
+
+def _write_strings(path: Path, name: str, values: List[str]):
+    """UTF-8拼接写入 <name>.bin，偏移表写入 <name>.offsets.npy（第i项为 [offsets[i], offsets[i+1])）"""
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    with open(path / f"{name}.bin", 'wb') as f:
+        f.write(b''.join(encoded))
+    np.save(path / f"{name}.offsets.npy", offsets)
+
+class _StringColumn:
+    """mmap的字符串列：按下标解码单个值，不把整列读入内存"""
+
+    def __init__(self, path: Path, name: str):
+        self.offsets = np.load(path / f"{name}.offsets.npy", mmap_mode='r')
+        blob_path = path / f"{name}.bin"
+        # 空文件不能mmap
+        self.blob = np.memmap(blob_path, dtype=np.uint8, mode='r') if blob_path.stat().st_size else np.zeros(0, np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.blob[int(self.offsets[i]):int(self.offsets[i + 1])].tobytes().decode('utf-8')
+
+def write_layout(
+    gen_path: Path,
+    ids: List[str],
+    documents: List[str],
+    metadatas: List[Dict],
+    matrix: np.ndarray
+):
+    """
+    写出一代完整数据
+
+    Args:
+        gen_path: 本代目录
+        ids: 块ID
+        documents: 块内容
+        metadatas: 块元数据
+        matrix: 归一化向量矩阵（行数与ids一致）
+    """
+    gen_path.mkdir(parents=True, exist_ok=True)
+    np.save(gen_path / "embeddings.npy", np.ascontiguousarray(matrix, dtype=np.float32))
+    _write_strings(gen_path, "ids", ids)
+    _write_strings(gen_path, "documents", documents)
+    _write_strings(gen_path, "metadata", [json.dumps(metadata, ensure_ascii=False) for metadata in metadatas])
+    # 按ID排序的行号，读取端二分查找ID而不必建立字典
+    np.save(gen_path / "id_order.npy", np.array(sorted(range(len(ids)), key=ids.__getitem__), dtype=np.int32))
+
+    columns = {}
+    for field in COLUMN_FIELDS:
+        values: Dict[str, int] = {}
+        codes = np.fromiter(
+            (values.setdefault(str(metadata.get(field, "")), len(values)) for metadata in metadatas),
+            dtype=np.int32, count=len(metadatas)
+        )
+        np.save(gen_path / f"{field}.codes.npy", codes)
+        columns[field] = list(values)
+    np.save(gen_path / "weight.npy", np.array([_parse_weight(metadata) for metadata in metadatas], dtype=np.float32))
+    with open(gen_path / "columns.json", 'w', encoding='utf-8') as f:
+        json.dump(columns, f, ensure_ascii=False)
+
+class MappedLayout:
+    """只读打开的一代数据（向量、字符串、列式元数据均为mmap）"""
+
+    def __init__(self, gen_path: Path):
+        self.path = gen_path
+        self.embeddings = np.load(gen_path / "embeddings.npy", mmap_mode='r')
+        self.ids = _StringColumn(gen_path, "ids")
+        self.documents = _StringColumn(gen_path, "documents")
+        self.metadata = _StringColumn(gen_path, "metadata")
+        self.id_order = np.load(gen_path / "id_order.npy", mmap_mode='r')
+        with open(gen_path / "columns.json", 'r', encoding='utf-8') as f:
+            values = json.load(f)
+        self.columns = {
+            field: (np.load(gen_path / f"{field}.codes.npy", mmap_mode='r'), {value: code for code, value in enumerate(values[field])})
+            for field in COLUMN_FIELDS
+        }
+        self.weight = np.load(gen_path / "weight.npy", mmap_mode='r')
+        if len(self.embeddings) != len(self.ids):
+            raise ValueError(f"向量数 {len(self.embeddings)} 与块数 {len(self.ids)} 不一致")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def find(self, chunk_id: str) -> Optional[int]:
+        """按ID二分查找行号"""
+        lo, hi = 0, len(self.id_order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ids[int(self.id_order[mid])] < chunk_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.id_order) and self.ids[int(self.id_order[lo])] == chunk_id:
+            return int(self.id_order[lo])
+        return None
+
+    def value_mask(self, field: str, value: Any) -> np.ndarray:
+        """字段等值掩码：列式字段直接比较编码，其他字段逐行解码元数据"""
+        if field in self.columns:
+            codes, lookup = self.columns[field]
+            code = lookup.get(str(value))
+            if code is None:
+                return np.zeros(len(self), dtype=bool)
+            return np.asarray(codes) == code
+        return np.fromiter(
+            (json.loads(self.metadata[row]).get(field) == value for row in range(len(self))),
+            dtype=bool, count=len(self)
+        )
+
+@contextmanager
+def _exclusive_lock(path: Path):
+    """集合目录下 write.lock 的进程间排他锁（阻塞等待）"""
+    path.mkdir(parents=True, exist_ok=True)
+    with open(path / LOCK_FILE, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK 等待约10秒后仍未拿到锁会抛出OSError，继续等待
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def read_manifest(path: Path) -> Optional[Dict]:
+    """读取集合目录下的 manifest.json（不存在时返回None）"""
+    manifest_path = path / MANIFEST_FILE
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != _STORE_FORMAT:
+        raise ValueError(f"格式版本 {manifest.get('format')} 不受支持，请重新构建索引")
+    return manifest
+
+def _filter_mask(where: Optional[Dict], n: int, value_mask) -> np.ndarray:
+    """
+    元数据过滤条件 → 布尔掩码
+
+    支持Chroma的 {字段: 值}、$eq/$ne/$in/$nin 以及 $and/$or 组合
+
+    Args:
+        where: 过滤条件
+        n: 行数
+        value_mask: (字段, 值) → 等值掩码
+    """
+    mask = np.ones(n, dtype=bool)
+    if not where:
+        return mask
+    for key, condition in where.items():
+        if key == '$and':
+            for sub in condition:
+                mask &= _filter_mask(sub, n, value_mask)
+        elif key == '$or':
+            any_mask = np.zeros(n, dtype=bool)
+            for sub in condition:
+                any_mask |= _filter_mask(sub, n, value_mask)
+            mask &= any_mask
+        elif isinstance(condition, dict):
+            for op, value in condition.items():
+                if op == '$eq':
+                    mask &= value_mask(key, value)
+                elif op == '$ne':
+                    mask &= ~value_mask(key, value)
+                elif op in ('$in', '$nin'):
+                    in_mask = np.zeros(n, dtype=bool)
+                    for item in value:
+                        in_mask |= value_mask(key, item)
+                    mask &= in_mask if op == '$in' else ~in_mask
+                else:
+                    raise ValueError(f"不支持的过滤运算符: {op}")
+        else:
+            mask &= value_mask(key, condition)
+    return mask
+
+def _document_mask(where_document: Optional[Dict], documents) -> Optional[np.ndarray]:
+    """文档内容过滤（$contains / $not_contains）"""
+    if not where_document:
+        return None
+    n = len(documents)
+    mask = np.ones(n, dtype=bool)
+    for op, value in where_document.items():
+        if op == '$contains':
+            mask &= np.fromiter((value in documents[i] for i in range(n)), dtype=bool, count=n)
+        elif op == '$not_contains':
+            mask &= np.fromiter((value not in documents[i] for i in range(n)), dtype=bool, count=n)
+        else:
+            raise ValueError(f"不支持的文档过滤运算符: {op}")
+    return mask
+
+# ---------- 集合 ----------
+
+class NumpyCollection:
+    """
+    可写集合：数据在内存中，persist() 时落盘为新的一代
+
+    每次落盘都写出完整数据，批量写入期间只改内存，结束后调用一次 persist()，
+    避免每批写入都重写整个库；未 persist 的写入在进程退出后丢失
+
+    其他进程可能同时写入同一集合：没有未落盘的写入时，读写前发现磁盘上有新的一代就重新加载；
+    persist() 在 write.lock 下进行，磁盘上已有更新的一代时先加载它，再重放本进程未落盘的写入，
+    新一代的编号取自磁盘上的 manifest
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        name: str,
+        metadata: Optional[Dict] = None,
+        check_interval: float = NUMPY_STORE_CHECK_INTERVAL
+    ):
+        """
+        Args:
+            path: 集合目录
+            name: 集合名称
+            metadata: 集合元数据（与Chroma一致，如 {"hnsw:space": "cosine"}）
+            check_interval: 读取时检查其他进程写出的新一代的最小间隔（秒），0表示每次都检查，负数表示只在写入前检查
+        """
+        self.path = path
+        self.name = name
+        self.metadata = metadata or {}
+        self._lock = threading.RLock()
+
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict] = []
+        self.row_of: Dict[str, int] = {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)  # 容量 ≥ 块数，前 len(ids) 行有效
+        self._generation = 0
+        self._masks: Dict[tuple, np.ndarray] = {}  # (字段, 取值) → 布尔掩码，写入后失效
+        self.dirty = False  # 有尚未落盘的写入
+        # 尚未落盘的写入操作，落盘前发现其他进程写出了新的一代时在其上重放
+        self._pending: List[Tuple] = []
+        self.check_interval = check_interval
+        self._last_check = time.monotonic()
+
+        if (self.path / "chunks.json").exists() and not (self.path / MANIFEST_FILE).exists():
+            logger.warning(f"NumPy向量库为旧格式，已忽略，请重新构建索引: {self.path}")
+        self._load(self._read_manifest())
+
+    # ---------- 持久化 ----------
+
+    def _read_manifest(self) -> Optional[Dict]:
+        try:
+            return read_manifest(self.path)
+        except Exception as e:
+            logger.error(f"NumPy向量库读取失败 {self.path}: {e}")
+            raise
+
+    def _load(self, manifest: Optional[Dict]):
+        """加载 manifest 指向的一代（None 表示集合为空）"""
+        self.ids, self.documents, self.metadatas, self.row_of = [], [], [], {}
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._masks.clear()
+        self._generation = 0
+        if manifest is None:
+            return
+        try:
+            layout = MappedLayout(self.path / manifest['generation_dir'])
+        except Exception as e:
+            logger.error(f"NumPy向量库读取失败 {self.path}: {e}")
+            raise
+
+        self.metadata = manifest.get('metadata') or self.metadata
+        self.ids = [layout.ids[i] for i in range(len(layout))]
+        self.documents = [layout.documents[i] for i in range(len(layout))]
+        self.metadatas = [json.loads(layout.metadata[i]) for i in range(len(layout))]
+        self.row_of = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self._matrix = np.array(layout.embeddings, dtype=np.float32)
+        self._generation = manifest['generation']
+        logger.info(f"NumPy向量库加载成功: {manifest['generation_dir']}（{len(self.ids)} 个块）")
+
+    def _refresh(self, force: bool = False):
+        """
+        其他进程写出了新的一代时重新加载（有未落盘的写入时不加载，留到 persist() 合并）
+
+        Args:
+            force: 忽略 check_interval 立即检查（写入前）
+        """
+        if self.dirty:
+            return
+        if not force:
+            now = time.monotonic()
+            if self.check_interval < 0 or now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+        manifest = self._read_manifest()
+        if (manifest['generation'] if manifest else 0) != self._generation:
+            logger.info("NumPy向量库已被其他进程更新，重新加载")
+            self._load(manifest)
+
+    def persist(self) -> bool:
+        """
+        把尚未落盘的写入写出为新的一代
+
+        Returns:
+            是否写出了新的一代（没有未落盘的写入时返回False）
+        """
+        with self._lock, _exclusive_lock(self.path):
+            if not self.dirty:
+                return False
+            manifest = self._read_manifest()
+            if (manifest['generation'] if manifest else 0) != self._generation:
+                logger.info(f"NumPy向量库已被其他进程更新，在新的一代上重放 {len(self._pending)} 次写入")
+                self._load(manifest)
+                for operation, *args in self._pending:
+                    if operation == 'write':
+                        self._apply_write(*args)
+                    else:
+                        self._apply_delete(*args)
+            self._save()
+            self._pending = []
+            self.dirty = False
+            self._last_check = time.monotonic()
+            return True
+
+    def _save(self):
+        """写出新一代目录，原子替换 manifest.json，再清理旧的代（仍被其他进程映射时跳过；需持有 write.lock）"""
+        self._generation += 1
+        # 上次写到一半（已改名、未替换manifest）留下的目录编号不再使用
+        while (self.path / f"gen-{self._generation:06d}").exists():
+            self._generation += 1
+        generation_dir = f"gen-{self._generation:06d}"
+        tmp_dir = self.path / f"{generation_dir}.{os.getpid()}.tmp"
+        try:
+            write_layout(tmp_dir, self.ids, self.documents, self.metadatas, self._matrix[:len(self.ids)])
+            os.replace(tmp_dir, self.path / generation_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        manifest_tmp = self.path / f"{MANIFEST_FILE}.{os.getpid()}.tmp"
+        with open(manifest_tmp, 'w', encoding='utf-8') as f:
+            json.dump({
+                'format': _STORE_FORMAT,
+                'name': self.name,
+                'metadata': self.metadata,
+                'generation': self._generation,
+                'generation_dir': generation_dir,
+                'count': len(self.ids),
+                'dimension': int(self._matrix.shape[1])
+            }, f, ensure_ascii=False)
+        os.replace(manifest_tmp, self.path / MANIFEST_FILE)
+        self._remove_old_generations()
+
+    def _remove_old_generations(self):
+        """
+        清理旧的代：始终保留当前和上一代；更早的代只有在替换它的那一代写出超过
+        GENERATION_GRACE_SECONDS 之后才删除（Windows下仍被其他进程映射时删除失败，留到下次）
+        """
+        generations = sorted(
+            path for path in self.path.glob("gen-*") if path.is_dir() and not path.name.endswith(".tmp")
+        )
+        now = time.time()
+        for old, successor in zip(generations[:-2], generations[1:-1]):
+            try:
+                replaced_for = now - successor.stat().st_mtime
+            except OSError:
+                continue
+            if replaced_for >= GENERATION_GRACE_SECONDS:
+                shutil.rmtree(old, ignore_errors=True)
+
+    # ---------- 写入 ----------
+
+    def _prepare(self, embeddings: Sequence[Sequence[float]]) -> np.ndarray:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError("embeddings必须是二维（块数 × 维度）")
+        if len(self.ids) and vectors.shape[1] != self._matrix.shape[1]:
+            raise ValueError(f"向量维度 {vectors.shape[1]} 与集合维度 {self._matrix.shape[1]} 不一致")
+        # 余弦距离：预先归一化，检索时内积即余弦相似度
+        return _normalize_rows(vectors)
+
+    def _reserve(self, n_rows: int, dim: int):
+        """按容量倍增扩展矩阵（避免每批写入都复制整个矩阵）"""
+        if self._matrix.shape[1] != dim:
+            self._matrix = np.zeros((0, dim), dtype=np.float32)
+        if n_rows <= len(self._matrix):
+            return
+        capacity = max(n_rows, 2 * len(self._matrix), 1024)
+        matrix = np.zeros((capacity, dim), dtype=np.float32)
+        matrix[:len(self.ids)] = self._matrix[:len(self.ids)]
+        self._matrix = matrix
+
+    def _write(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict], overwrite: bool):
+        with self._lock:
+            self._refresh(force=True)
+            vectors = self._prepare(embeddings)
+            metadatas = [dict(metadata or {}) for metadata in metadatas]
+            if self._apply_write(list(ids), vectors, list(documents), metadatas, overwrite):
+                self._pending.append(('write', list(ids), vectors, list(documents), metadatas, overwrite))
+                self.dirty = True
+
+    def _apply_write(self, ids: List[str], vectors: np.ndarray, documents: List[str], metadatas: List[Dict], overwrite: bool) -> int:
+        """把已归一化的向量写入内存，返回写入的块数"""
+        self._reserve(len(self.ids) + len(ids), vectors.shape[1])
+        written = 0
+        for chunk_id, vector, document, metadata in zip(ids, vectors, documents, metadatas):
+            row = self.row_of.get(chunk_id)
+            if row is None:
+                row = len(self.ids)
+                self.row_of[chunk_id] = row
+                self.ids.append(chunk_id)
+                self.documents.append(document)
+                self.metadatas.append(metadata)
+            elif overwrite:
+                self.documents[row] = document
+                self.metadatas[row] = metadata
+            else:
+                # 与Chroma一致：add 遇到已存在的ID时忽略
+                logger.warning(f"块已存在，忽略: {chunk_id}")
+                continue
+            self._matrix[row] = vector
+            written += 1
+        if written:
+            self._masks.clear()
+        return written
+
+    def add(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict]):
+        """添加块（已存在的ID忽略）"""
+        self._write(ids, embeddings, documents, metadatas, overwrite=False)
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict]):
+        """写入或覆盖块"""
+        self._write(ids, embeddings, documents, metadatas, overwrite=True)
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        """按ID或元数据条件删除块（压缩矩阵，保持其余块的相对顺序）"""
+        with self._lock:
+            self._refresh(force=True)
+            ids = list(ids) if ids is not None else None
+            if self._apply_delete(ids, where):
+                self._pending.append(('delete', ids, where))
+                self.dirty = True
+
+    def _apply_delete(self, ids: Optional[List[str]], where: Optional[Dict]) -> bool:
+        """从内存中删除块，返回是否删除了任何块"""
+        remove = np.zeros(len(self.ids), dtype=bool)
+        if ids is not None:
+            rows = [self.row_of[chunk_id] for chunk_id in ids if chunk_id in self.row_of]
+            remove[rows] = True
+        if where:
+            remove |= self._filter_mask(where)
+        if not remove.any():
+            return False
+        keep = np.flatnonzero(~remove)
+        self._matrix = np.ascontiguousarray(self._matrix[keep])
+        self.ids = [self.ids[row] for row in keep.tolist()]
+        self.documents = [self.documents[row] for row in keep.tolist()]
+        self.metadatas = [self.metadatas[row] for row in keep.tolist()]
+        self.row_of = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self._masks.clear()
+        return True
+
+    # ---------- 读取 ----------
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self.ids)
+
+    def _value_mask(self, field: str, value: Any) -> np.ndarray:
+        key = (field, value)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = np.fromiter(
+                (metadata.get(field) == value for metadata in self.metadatas),
+                dtype=bool, count=len(self.metadatas)
+            )
+            self._masks[key] = mask
+        return mask
+
+    def _filter_mask(self, where: Optional[Dict]) -> np.ndarray:
+        return _filter_mask(where, len(self.ids), self._value_mask)
+
+    def _rows(self, where: Optional[Dict], where_document: Optional[Dict]) -> Optional[np.ndarray]:
+        if not where and not where_document:
+            return None
+        mask = self._filter_mask(where)
+        document_mask = _document_mask(where_document, self.documents)
+        if document_mask is not None:
+            mask &= document_mask
+        return np.flatnonzero(mask)
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        where_document: Optional[Dict] = None,
+        include: Sequence[str] = ('documents', 'metadatas')
+    ) -> Dict:
+        """按ID/条件读取块（与Chroma的 get 返回格式一致）"""
+        with self._lock:
+            self._refresh()
+            if ids is not None:
+                rows = [self.row_of[chunk_id] for chunk_id in ids if chunk_id in self.row_of]
+            else:
+                rows = list(range(len(self.ids)))
+            filtered = self._rows(where, where_document)
+            if filtered is not None:
+                allowed = set(filtered.tolist())
+                rows = [row for row in rows if row in allowed]
+            start = offset or 0
+            rows = rows[start:start + limit] if limit is not None else rows[start:]
+
+            return {
+                'ids': [self.ids[row] for row in rows],
+                'documents': [self.documents[row] for row in rows] if 'documents' in include else None,
+                'metadatas': [self.metadatas[row] for row in rows] if 'metadatas' in include else None,
+                'embeddings': self._matrix[rows].tolist() if 'embeddings' in include else None
+            }
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        where_document: Optional[Dict] = None,
+        include: Sequence[str] = ('documents', 'metadatas', 'distances')
+    ) -> Dict:
+        """
+        精确Top-K检索（余弦距离 = 1 - 内积）
+
+        Returns:
+            与Chroma的 query 相同的格式：ids/documents/metadatas/distances 均为每个查询一个列表
+        """
+        with self._lock:
+            self._refresh()
+            result_rows, distances = _top_k(
+                self._matrix[:len(self.ids)], query_embeddings, n_results, self._rows(where, where_document)
+            )
+            return {
+                'ids': [[self.ids[row] for row in rows] for rows in result_rows],
+                'documents': [[self.documents[row] for row in rows] for rows in result_rows]
+                if 'documents' in include else None,
+                'metadatas': [[self.metadatas[row] for row in rows] for rows in result_rows]
+                if 'metadatas' in include else None,
+                'distances': distances.tolist() if 'distances' in include else None
+            }
+
+class MmapCollection:
+    """
+    只读集合：直接映射磁盘上的当前一代数据
+
+    多个进程映射同一份文件时共享页缓存，打开只需读取 manifest 和建立映射；
+    每隔 check_interval 秒检查 manifest，写入进程生成新一代后自动切换
+    """
+
+    def __init__(self, path: Path, name: str, check_interval: float = NUMPY_STORE_CHECK_INTERVAL):
+        """
+        Args:
+            path: 集合目录
+            name: 集合名称
+            check_interval: 检查新一代数据的最小间隔（秒），0表示每次访问都检查，负数表示不检查
+        """
+        self.path = path
+        self.name = name
+        self.check_interval = check_interval
+        self.metadata: Dict = {}
+        self.layout: Optional[MappedLayout] = None
+        self._manifest_mtime: Optional[int] = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self, attempts: int = 3):
+        """
+        映射 manifest 指向的当前一代
+
+        读取 manifest 与映射文件之间，写入进程可能已切换到新一代并清理了这一代，
+        此时重新读取 manifest 重试；仍然失败时保留已映射的旧一代，下次检查再试
+        """
+        manifest_path = self.path / MANIFEST_FILE
+        for attempt in range(attempts):
+            try:
+                mtime = manifest_path.stat().st_mtime_ns
+            except FileNotFoundError:
+                if self._last_check == 0.0:
+                    logger.warning(f"NumPy向量库不存在: {self.path}")
+                self.layout = None
+                self._manifest_mtime = None
+                return
+            if mtime == self._manifest_mtime:
+                return
+            try:
+                manifest = read_manifest(self.path)
+                layout = MappedLayout(self.path / manifest['generation_dir'])
+            except FileNotFoundError as e:
+                if attempt + 1 < attempts:
+                    logger.debug(f"NumPy向量库的这一代已被替换，重新读取manifest: {e}")
+                    continue
+                if self.layout is None:
+                    raise
+                logger.warning(f"NumPy向量库切换失败，继续使用已映射的数据: {e}")
+                return
+            break
+        self.layout = layout
+        self.metadata = manifest.get('metadata') or {}
+        self._manifest_mtime = mtime
+        logger.info(f"NumPy向量库已映射: {manifest['generation_dir']}（{len(self.layout)} 个块）")
+
+    def _current(self) -> Optional[MappedLayout]:
+        if self.check_interval >= 0:
+            now = time.monotonic()
+            if now - self._last_check >= self.check_interval:
+                with self._lock:
+                    self._last_check = now
+                    self._open()
+        return self.layout
+
+    def _read_only(self, *args, **kwargs):
+        raise PermissionError("只读集合不能写入（请在构建/更新进程中写入）")
+
+    add = upsert = delete = _read_only
+
+    def count(self) -> int:
+        layout = self._current()
+        return len(layout) if layout is not None else 0
+
+    def _rows(self, layout: MappedLayout, where: Optional[Dict], where_document: Optional[Dict]) -> Optional[np.ndarray]:
+        if not where and not where_document:
+            return None
+        mask = _filter_mask(where, len(layout), layout.value_mask)
+        document_mask = _document_mask(where_document, layout.documents)
+        if document_mask is not None:
+            mask &= document_mask
+        return np.flatnonzero(mask)
+
+    @staticmethod
+    def _fetch(layout: MappedLayout, rows: List[int], include: Sequence[str]) -> Dict:
+        return {
+            'ids': [layout.ids[row] for row in rows],
+            'documents': [layout.documents[row] for row in rows] if 'documents' in include else None,
+            'metadatas': [json.loads(layout.metadata[row]) for row in rows] if 'metadatas' in include else None,
+            'embeddings': np.asarray(layout.embeddings[rows]).tolist() if 'embeddings' in include else None
+        }
+
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        where_document: Optional[Dict] = None,
+        include: Sequence[str] = ('documents', 'metadatas')
+    ) -> Dict:
+        """按ID/条件读取块（与Chroma的 get 返回格式一致）"""
+        layout = self._current()
+        if layout is None:
+            return {'ids': [], 'documents': [], 'metadatas': [], 'embeddings': None}
+        if ids is not None:
+            rows = [row for row in (layout.find(chunk_id) for chunk_id in ids) if row is not None]
+        else:
+            rows = list(range(len(layout)))
+        filtered = self._rows(layout, where, where_document)
+        if filtered is not None:
+            allowed = set(filtered.tolist())
+            rows = [row for row in rows if row in allowed]
+        start = offset or 0
+        rows = rows[start:start + limit] if limit is not None else rows[start:]
+        return self._fetch(layout, rows, include)
+
+    def query(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        where_document: Optional[Dict] = None,
+        include: Sequence[str] = ('documents', 'metadatas', 'distances')
+    ) -> Dict:
+        """精确Top-K检索（只解码返回的行）"""
+        layout = self._current()
+        n_queries = len(query_embeddings)
+        if layout is None:
+            return {'ids': [[]] * n_queries, 'documents': [[]] * n_queries, 'metadatas': [[]] * n_queries, 'distances': [[]] * n_queries}
+        result_rows, distances = _top_k(
+            layout.embeddings, query_embeddings, n_results, self._rows(layout, where, where_document)
+        )
+        fetched = [self._fetch(layout, rows, include) for rows in result_rows]
+        return {
+            'ids': [item['ids'] for item in fetched],
+            'documents': [item['documents'] for item in fetched] if 'documents' in include else None,
+            'metadatas': [item['metadatas'] for item in fetched] if 'metadatas' in include else None,
+            'distances': distances.tolist() if 'distances' in include else None
+        }
+
+class NumpyClient:
+    """集合管理（接口与 chromadb.PersistentClient 的子集一致）"""
+
+    def __init__(self, path: Path, read_only: bool = False):
+        """
+        Args:
+            path: 向量库目录（集合保存在 <path>/numpy/<集合名称>/）
+            read_only: 只读模式（mmap映射，多进程共享，不能写入）
+        """
+        self.path = Path(path) / "numpy"
+        self.read_only = read_only
+        self._collections: Dict[str, Any] = {}
+
+    def get_or_create_collection(self, name: str, metadata: Optional[Dict] = None):
+        if name not in self._collections:
+            if self.read_only:
+                self._collections[name] = MmapCollection(self.path / name, name)
+            else:
+                self._collections[name] = NumpyCollection(self.path / name, name, metadata)
+        return self._collections[name]
+
+    def delete_collection(self, name: str):
+        if self.read_only:
+            raise PermissionError("只读模式不能删除集合")
+        self._collections.pop(name, None)
+        shutil.rmtree(self.path / name, ignore_errors=True)
@@ -0,0 +1,222 @@
+"""
+ONNX Runtime Embedding后端
+把 SentenceTransformer 的Transformer部分导出为ONNX图（可选动态int8量化），
+在CPU上用ONNX Runtime推理，对外提供与 SentenceTransformer 相同的 encode 接口，
+由 EmbeddingModel 在 EMBEDDING_BACKEND=onnx 时使用
+"""
+
+import json
+from pathlib import Path
+from typing import Dict, List, Union
+import logging
+
+import numpy as np
+from tqdm import tqdm
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+logger = logging.getLogger(__name__)
+
+ONNX_MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+BACKEND_CONFIG_FILE = "onnx_config.json"
+
+# 支持导出的池化方式（SentenceTransformer Pooling模块的配置项）
+_POOLING_MODES = {
+    'pooling_mode_cls_token': 'cls',
+    'pooling_mode_mean_tokens': 'mean',
+}
+
+def _require_onnxruntime():
+    if ort is None:
+        raise ImportError("未安装onnxruntime，请运行: pip install onnxruntime")
+
+def export_onnx_model(
+    model_name: str,
+    output_dir: Path,
+    quantize: bool = True,
+    opset: int = 14
+) -> Path:
+    """
+    导出ONNX模型（需要torch和sentence-transformers）
+
+    Args:
+        model_name: SentenceTransformer模型名称或路径
+        output_dir: 输出目录（保存ONNX图、tokenizer和池化配置）
+        quantize: 是否额外生成动态int8量化版本
+        opset: ONNX opset版本
+
+    Returns:
+        输出目录
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    _require_onnxruntime()
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    logger.info(f"加载模型: {model_name}")
+    st_model = SentenceTransformer(model_name, device="cpu", trust_remote_code=True)
+    modules = list(st_model)
+    transformer = modules[0]
+
+    # 只支持 Transformer + Pooling (+ Normalize) 结构，额外的Dense层等无法在这里复现
+    pooling = None
+    for module in modules[1:]:
+        name = type(module).__name__
+        if name == 'Pooling':
+            config = module.get_config_dict()
+            enabled = [key for key, value in config.items() if key.startswith('pooling_mode') and value]
+            if len(enabled) != 1 or enabled[0] not in _POOLING_MODES:
+                raise ValueError(f"不支持的池化配置: {config}")
+            pooling = _POOLING_MODES[enabled[0]]
+        elif name != 'Normalize':
+            raise ValueError(f"不支持导出包含 {name} 模块的模型")
+    if pooling is None:
+        raise ValueError("模型缺少Pooling模块")
+
+    auto_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+    dummy = tokenizer(["导出示例文本", "export"], padding=True, return_tensors="pt")
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in dummy]
+
+    class _Wrapper(torch.nn.Module):
+        """只输出 last_hidden_state，池化在推理端完成"""
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(input_names, inputs)))[0]
+
+    onnx_path = output_dir / ONNX_MODEL_FILE
+    logger.info(f"导出ONNX图: {onnx_path}")
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+    with torch.no_grad():
+        torch.onnx.export(
+            _Wrapper(auto_model),
+            tuple(dummy[name] for name in input_names),
+            str(onnx_path),
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True
+        )
+
+    tokenizer.save_pretrained(str(output_dir))
+    with open(output_dir / BACKEND_CONFIG_FILE, 'w', encoding='utf-8') as f:
+        json.dump({
+            'model_name': model_name,
+            'pooling': pooling,
+            'max_seq_length': st_model.max_seq_length,
+            'dimension': st_model.get_sentence_embedding_dimension(),
+        }, f, ensure_ascii=False, indent=2)
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        quantized_path = output_dir / QUANTIZED_MODEL_FILE
+        logger.info(f"动态int8量化: {quantized_path}")
+        quantize_dynamic(str(onnx_path), str(quantized_path), weight_type=QuantType.QInt8)
+
+    logger.info("ONNX模型导出完成")
+    return output_dir
+
+class OnnxSentenceEncoder:
+    """
+    基于ONNX Runtime的句向量编码器
+
+    提供 EmbeddingModel 用到的 SentenceTransformer 接口子集：
+    encode、tokenizer、max_seq_length、get_sentence_embedding_dimension
+    """
+
+    def __init__(self, model_dir: Path, quantized: bool = True, num_threads: int = 0):
+        """
+        初始化ONNX编码器
+
+        Args:
+            model_dir: export_onnx_model 的输出目录
+            quantized: 是否加载int8量化版本
+            num_threads: 推理线程数，0表示由ONNX Runtime自动决定
+        """
+        _require_onnxruntime()
+        from transformers import AutoTokenizer
+
+        model_file = model_dir / (QUANTIZED_MODEL_FILE if quantized else ONNX_MODEL_FILE)
+        if not model_file.exists():
+            raise FileNotFoundError(
+                f"ONNX模型不存在: {model_file}，请先运行 python scripts/export_onnx_model.py"
+            )
+
+        with open(model_dir / BACKEND_CONFIG_FILE, 'r', encoding='utf-8') as f:
+            self.config: Dict = json.load(f)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(str(model_dir))
+        self.max_seq_length: int = self.config['max_seq_length']
+        self.pooling: str = self.config['pooling']
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(str(model_file), options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+        logger.info(f"ONNX模型加载成功: {model_file.name}（池化: {self.pooling}）")
+
+    def encode(
+        self,
+        sentences: Union[str, List[str]],
+        normalize_embeddings: bool = False,
+        show_progress_bar: bool = False,
+        batch_size: int = 32,
+        convert_to_numpy: bool = True
+    ) -> np.ndarray:
+        """
+        向量化（参数含义与 SentenceTransformer.encode 一致）
+
+        Returns:
+            float32数组，形状为 (文本数, 维度)；传入单个字符串时为一维数组
+        """
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        outputs = []
+        starts = range(0, len(sentences), batch_size)
+        for start in tqdm(starts, desc="Batches", disable=not show_progress_bar):
+            outputs.append(self._encode_batch(sentences[start:start + batch_size]))
+
+        dimension = self.get_sentence_embedding_dimension()
+        embeddings = np.concatenate(outputs) if outputs else np.zeros((0, dimension), dtype=np.float32)
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.clip(norms, 1e-12, None)
+
+        return embeddings[0] if single else embeddings
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        features = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np"
+        )
+        feed = {name: features[name].astype(np.int64) for name in self.input_names}
+        hidden = self.session.run(None, feed)[0]
+
+        if self.pooling == 'cls':
+            return hidden[:, 0].astype(np.float32)
+
+        mask = features['attention_mask'][..., None].astype(np.float32)
+        return ((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)).astype(np.float32)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        """获取向量维度"""
+        return self.config['dimension']
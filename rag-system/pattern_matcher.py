@@ -0,0 +1,259 @@
+"""
+查询模式匹配器
+对YAML索引中所有 query_patterns / keywords 建立自动机，一次线性扫描查询文本得到全部命中文档：
+- 模式包含于查询：Aho-Corasick 自动机
+- 查询包含于模式：所有模式的广义后缀自动机
+命中结果用文档位掩码表示，layer/doc_type 过滤是一次按位与
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 参与匹配的索引字段
+FIELD_QUERY_PATTERNS = "query_patterns"
+FIELD_KEYWORDS = "keywords"
+MATCH_FIELDS = (FIELD_QUERY_PATTERNS, FIELD_KEYWORDS)
+
+class AhoCorasick:
+    """Aho-Corasick 多模式匹配：报告出现在文本中的所有模式（以位掩码表示所属文档）"""
+
+    def __init__(self, patterns: Iterable[Tuple[str, int]]):
+        """
+        Args:
+            patterns: (模式文本, 文档位掩码) 列表
+        """
+        self.goto: List[Dict[str, int]] = [{}]
+        self.output: List[int] = [0]
+        for pattern, mask in patterns:
+            node = 0
+            for char in pattern:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.output.append(0)
+                node = next_node
+            self.output[node] |= mask
+
+        # BFS建立失败指针，并把失败链上的输出合并到每个节点
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                target = self.goto[fail].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                self.output[child] |= self.output[self.fail[child]]
+                queue.append(child)
+
+    def search(self, text: str) -> int:
+        """
+        扫描文本
+
+        Returns:
+            所有出现在文本中的模式的文档位掩码之并
+        """
+        goto, fail, output = self.goto, self.fail, self.output
+        node = 0
+        mask = output[0]  # 空模式总是命中
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            mask |= output[node]
+        return mask
+
+    def __len__(self) -> int:
+        return len(self.goto)
+
+class SuffixAutomaton:
+    """广义后缀自动机：报告包含给定文本（作为子串）的所有模式（以位掩码表示所属文档）"""
+
+    def __init__(self, patterns: Iterable[Tuple[str, int]]):
+        """
+        Args:
+            patterns: (模式文本, 文档位掩码) 列表
+        """
+        self.next: List[Dict[str, int]] = [{}]
+        self.link: List[int] = [-1]
+        self.length: List[int] = [0]
+        self.mask: List[int] = [0]
+
+        patterns = list(patterns)
+        for pattern, _ in patterns:
+            last = 0
+            for char in pattern:
+                last = self._extend(last, char)
+
+        # 每个模式的所有子串对应状态 = 各前缀状态沿后缀链接的祖先，标记其所属文档
+        for pattern, mask in patterns:
+            self._mark(0, mask)
+            state = 0
+            for char in pattern:
+                state = self.next[state][char]
+                self._mark(state, mask)
+
+    def _new_state(self, length: int, link: int, transitions: Dict[str, int]) -> int:
+        self.next.append(transitions)
+        self.link.append(link)
+        self.length.append(length)
+        self.mask.append(0)
+        return len(self.next) - 1
+
+    def _clone(self, p: int, q: int, char: str) -> int:
+        clone = self._new_state(self.length[p] + 1, self.link[q], dict(self.next[q]))
+        while p != -1 and self.next[p].get(char) == q:
+            self.next[p][char] = clone
+            p = self.link[p]
+        self.link[q] = clone
+        return clone
+
+    def _extend(self, last: int, char: str) -> int:
+        # 广义后缀自动机：转移已存在时直接复用（必要时克隆），避免产生多余状态
+        q = self.next[last].get(char)
+        if q is not None:
+            if self.length[last] + 1 == self.length[q]:
+                return q
+            return self._clone(last, q, char)
+
+        cur = self._new_state(self.length[last] + 1, 0, {})
+        p = last
+        while p != -1 and char not in self.next[p]:
+            self.next[p][char] = cur
+            p = self.link[p]
+        if p != -1:
+            q = self.next[p][char]
+            if self.length[p] + 1 == self.length[q]:
+                self.link[cur] = q
+            else:
+                self.link[cur] = self._clone(p, q, char)
+        return cur
+
+    def _mark(self, state: int, mask: int):
+        # 祖先已带有该掩码时其上的链也一定已标记，可以提前结束
+        while state != -1 and self.mask[state] & mask != mask:
+            self.mask[state] |= mask
+            state = self.link[state]
+
+    def search(self, text: str) -> int:
+        """
+        沿转移读入文本
+
+        Returns:
+            包含该文本的所有模式的文档位掩码之并（文本不是任何模式的子串时为0）
+        """
+        state = 0
+        for char in text:
+            state = self.next[state].get(char)
+            if state is None:
+                return 0
+        return self.mask[state]
+
+    def __len__(self) -> int:
+        return len(self.next)
+
+class PatternMatcher:
+    """
+    基于自动机的索引模式匹配器
+
+    每个文档对应一个比特位，layer/doc_type 预先按取值建立掩码；
+    单次匹配的代价只与查询长度有关，不随文档数和模式数增长
+    """
+
+    def __init__(self, entries: Sequence[Tuple[str, Dict]]):
+        """
+        Args:
+            entries: (文档ID, 索引数据) 列表，文档顺序即匹配结果的顺序
+        """
+        self.doc_ids: List[str] = [doc_id for doc_id, _ in entries]
+        self.layer_masks: Dict[str, int] = {}
+        self.doc_type_masks: Dict[str, int] = {}
+
+        field_patterns: Dict[str, List[Tuple[str, int]]] = {field: [] for field in MATCH_FIELDS}
+        for i, (doc_id, data) in enumerate(entries):
+            bit = 1 << i
+            self.layer_masks[data.get('layer')] = self.layer_masks.get(data.get('layer'), 0) | bit
+            self.doc_type_masks[data.get('doc_type')] = self.doc_type_masks.get(data.get('doc_type'), 0) | bit
+            for field in MATCH_FIELDS:
+                for pattern in data.get(field) or []:
+                    field_patterns[field].append((str(pattern).lower(), bit))
+
+        self.forward = {field: AhoCorasick(patterns) for field, patterns in field_patterns.items()}
+        self.reverse = {field: SuffixAutomaton(patterns) for field, patterns in field_patterns.items()}
+
+        logger.debug(
+            "模式匹配器已建立: %d 个文档，%s",
+            len(self.doc_ids),
+            "，".join(
+                f"{field} {len(field_patterns[field])} 个模式"
+                f"（AC {len(self.forward[field])} / SAM {len(self.reverse[field])} 个状态）"
+                for field in MATCH_FIELDS
+            )
+        )
+
+    def match_mask(
+        self,
+        query: str,
+        layer: Optional[str] = None,
+        doc_type: Optional[str] = None,
+        fields: Sequence[str] = (FIELD_QUERY_PATTERNS,)
+    ) -> int:
+        """
+        匹配查询，返回命中文档的位掩码（模式包含于查询，或查询包含于模式）
+
+        Args:
+            query: 查询文本
+            layer: 层级过滤
+            doc_type: 文档类型过滤
+            fields: 参与匹配的索引字段
+
+        Returns:
+            命中文档的位掩码
+        """
+        query_lower = query.lower()
+        mask = 0
+        for field in fields:
+            mask |= self.forward[field].search(query_lower)
+            mask |= self.reverse[field].search(query_lower)
+        if layer:
+            mask &= self.layer_masks.get(layer, 0)
+        if doc_type:
+            mask &= self.doc_type_masks.get(doc_type, 0)
+        return mask
+
+    def match(
+        self,
+        query: str,
+        layer: Optional[str] = None,
+        doc_type: Optional[str] = None,
+        fields: Sequence[str] = (FIELD_QUERY_PATTERNS,)
+    ) -> List[str]:
+        """
+        匹配查询
+
+        Args:
+            query: 查询文本
+            layer: 层级过滤
+            doc_type: 文档类型过滤
+            fields: 参与匹配的索引字段（query_patterns 和/或 keywords）
+
+        Returns:
+            命中的文档ID列表（按文档顺序）
+        """
+        return self.mask_to_doc_ids(self.match_mask(query, layer, doc_type, fields))
+
+    def mask_to_doc_ids(self, mask: int) -> List[str]:
+        """位掩码 → 文档ID列表"""
+        doc_ids = []
+        while mask:
+            low = mask & -mask
+            doc_ids.append(self.doc_ids[low.bit_length() - 1])
+            mask ^= low
+        return doc_ids
@@ -3,12 +3,16 @@ RAG链实现
 整合检索和生成
 """
 
-from typing import List, Dict, Optional
+import asyncio
+from concurrent.futures import Executor
+from typing import Dict, Generator, Iterator, List, Optional
 import logging
 
 from .retriever import HybridRetriever
 from .query_processor import QueryProcessor
-from .config import LLM_PROVIDER, LLM_MODEL, OPENAI_API_KEY
+from .result_cache import ResultCache
+from .semantic_cache import SemanticQueryCache
+from .config import LLM_PROVIDER, LLM_MODEL, OPENAI_API_KEY, OPENAI_BASE_URL, OLLAMA_BASE_URL
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +25,9 @@ class RAGChain:
         query_processor: Optional[QueryProcessor] = None,
         llm_provider: str = LLM_PROVIDER,
         llm_model: str = LLM_MODEL,
-        use_llm: bool = True
+        use_llm: bool = True,
+        result_cache: Optional[ResultCache] = None,
+        semantic_cache: Optional[SemanticQueryCache] = None
     ):
         """
         初始化RAG链
@@ -32,13 +38,21 @@ class RAGChain:
             llm_provider: LLM提供商
             llm_model: LLM模型名称
             use_llm: 是否启用LLM（如果为False，只返回检索结果）
+            result_cache: 结果缓存（可选，相同问题直接返回上次的检索结果和回答）
+            semantic_cache: 语义缓存（可选，与已回答的问题足够相似时直接返回那次的结果）
         """
         self.retriever = retriever
         self.query_processor = query_processor or QueryProcessor()
         self.llm_provider = llm_provider
         self.llm_model = llm_model
         self.use_llm = use_llm
+        self.result_cache = result_cache
+        self.semantic_cache = semantic_cache
+        self.cache_counts = {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0}
         self.llm = None
+        # 异步OpenAI客户端（绑定创建它的事件循环，首次 aquery 时创建）
+        self._async_openai = None
+        self._async_openai_loop = None
         
         # 初始化LLM（如果需要）
         if use_llm:
@@ -54,7 +68,7 @@ class RAGChain:
             if not OPENAI_API_KEY:
                 logger.warning("OPENAI_API_KEY未设置，将无法使用LLM生成回答")
             else:
-                self.llm = OpenAI(api_key=OPENAI_API_KEY)
+                self.llm = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL or None)
                 logger.info("OpenAI LLM初始化成功")
         except ImportError:
             logger.warning("openai包未安装，将无法使用LLM生成回答")
@@ -63,7 +77,7 @@ class RAGChain:
         """初始化Ollama"""
         try:
             from langchain_community.llms import Ollama
-            self.llm = Ollama(model=self.llm_model)
+            self.llm = Ollama(model=self.llm_model, base_url=OLLAMA_BASE_URL)
             logger.info(f"Ollama LLM初始化成功: {self.llm_model}")
         except ImportError:
             logger.warning("ollama未安装或未运行，将无法使用LLM生成回答")
@@ -89,9 +103,147 @@ class RAGChain:
             - answer: LLM生成的回答（如果use_llm=True）
             - sources: 来源文档列表
         """
+        state = self._prepare(query, top_k, use_llm)
+        if state['cached'] is not None:
+            return state['cached']
+        
+        # 4. 生成回答（如果启用）
+        answer = None
+        if state['generate']:
+            answer = self._generate_answer(query, state['context'])
+        
+        return self._finish(query, state, answer)
+    
+    def query_stream(
+        self,
+        query: str,
+        top_k: int = 5,
+        use_llm: bool = True
+    ) -> Iterator[Dict]:
+        """
+        流式执行RAG查询：检索完成后立即返回检索结果和来源，回答在LLM生成时逐段返回
+        
+        Args:
+            query: 查询文本
+            top_k: 检索文档数量
+            use_llm: 是否使用LLM生成回答
+            
+        Yields:
+            事件字典，按顺序为：
+            - {'type': 'retrieval', 'query', 'processed_query', 'retrieved_docs', 'sources'}
+            - {'type': 'token', 'text'}：回答片段（零个或多个；缓存命中时整个回答为一段）
+            - {'type': 'done', 'result'}：与 query() 返回值相同的完整结果
+              （生成失败时 answer 为 None，已输出的片段不会被缓存）
+        """
+        state = self._prepare(query, top_k, use_llm)
+        result = state['cached']
+        if result is not None:
+            yield self._retrieval_event(result)
+            if result['answer']:
+                yield {'type': 'token', 'text': result['answer']}
+            yield {'type': 'done', 'result': result}
+            return
+        
+        yield self._retrieval_event({'query': query, **state})
+        
+        answer = None
+        if state['generate']:
+            answer = yield from self._stream_answer(query, state['context'])
+        
+        yield {'type': 'done', 'result': self._finish(query, state, answer)}
+    
+    @staticmethod
+    def _retrieval_event(result: Dict) -> Dict:
+        return {
+            'type': 'retrieval',
+            'query': result['query'],
+            'processed_query': result['processed_query'],
+            'retrieved_docs': result['retrieved_docs'],
+            'sources': result['sources']
+        }
+    
+    async def aquery(
+        self,
+        query: str,
+        top_k: int = 5,
+        use_llm: bool = True,
+        executor: Optional[Executor] = None
+    ) -> Dict:
+        """
+        异步执行RAG查询（结果与 query() 相同）
+        
+        查询处理、检索等CPU工作在线程池中执行，等待LLM回答时只挂起协程、不占用线程，
+        同一事件循环中可以同时有大量查询在等待生成，其他查询的检索与之重叠进行
+        
+        Args:
+            query: 查询文本
+            top_k: 检索文档数量
+            use_llm: 是否使用LLM生成回答
+            executor: 执行检索的线程池（None为事件循环的默认线程池）
+            
+        Returns:
+            结果字典（同 query()）
+        """
+        loop = asyncio.get_running_loop()
+        state = await loop.run_in_executor(executor, self._prepare, query, top_k, use_llm)
+        if state['cached'] is not None:
+            return state['cached']
+        
+        answer = None
+        if state['generate']:
+            answer = await self._agenerate_answer(query, state['context'])
+        
+        # 写缓存（SQLite）同样放到线程池
+        return await loop.run_in_executor(executor, self._finish, query, state, answer)
+    
+    def _prepare(self, query: str, top_k: int, use_llm: bool) -> Dict:
+        """
+        生成回答之前的步骤：查缓存、查询处理、检索、构建上下文和来源列表
+        
+        Returns:
+            状态字典：cached 为缓存命中的完整结果（未命中为None）；
+            未命中时包含 processed_query、retrieved_docs、context、sources，
+            以及 _finish() 写缓存所需的 generate、cache_key 等
+        """
+        # 0. 结果缓存（是否生成回答、用哪个模型生成都计入键）
+        generate = bool(use_llm and self.llm)
+        llm_label = f"{self.llm_provider}/{self.llm_model}" if generate else None
+        state = {'cached': None, 'generate': generate}
+        if self.result_cache is not None:
+            state['cache_version'] = self.result_cache.current_version()
+            state['cache_key'] = self.retriever.result_cache_key('query', query, top_k=top_k, llm=llm_label)
+            cached = self.result_cache.get(state['cache_key'], state['cache_version'])
+            if cached is not None:
+                logger.info(f"问答结果缓存命中: {query}")
+                self.cache_counts['exact_hits'] += 1
+                state['cached'] = cached
+                return state
+        
         # 1. 查询处理
         processed_query = self.query_processor.process_query(query)
         
+        # 1.5 语义缓存（查询向量在随后的检索中可命中Embedding的查询缓存）
+        if self.semantic_cache is not None:
+            state['query_embedding'] = self.retriever.embedding_model.encode_query(processed_query['enhanced_query'])
+            self.retriever.catalog.refresh()
+            state['semantic_scope'] = (
+                top_k, processed_query['layer'], processed_query['doc_type'], llm_label, self.retriever.catalog.version
+            )
+            hit = self.semantic_cache.get(state['query_embedding'], state['semantic_scope'])
+            if hit is not None:
+                cached, matched_query, similarity = hit
+                logger.info(f"语义缓存命中: {query} ≈ {matched_query}（相似度 {similarity:.4f}）")
+                self.cache_counts['semantic_hits'] += 1
+                result = {**cached, 'query': query, 'semantic_match': {'query': matched_query, 'similarity': similarity}}
+                # 同一说法再次出现时直接精确命中
+                if self.result_cache is not None:
+                    self.result_cache.put(state['cache_key'], result, state['cache_version'])
+                state['cached'] = result
+                return state
+        
+        if self.result_cache is not None or self.semantic_cache is not None:
+            self.cache_counts['misses'] += 1
+        
         # 2. 检索
         retrieved_docs = self.retriever.retrieve(
             processed_query['enhanced_query'],
@@ -100,41 +252,66 @@ class RAGChain:
             doc_type=processed_query['doc_type']
         )
         
-        # 3. 构建上下文
-        context = self._build_context(retrieved_docs)
-        
-        # 4. 生成回答（如果启用）
-        answer = None
-        if use_llm and self.llm:
-            answer = self._generate_answer(query, context)
-        
-        # 5. 构建来源列表
-        sources = [
+        # 3. 构建上下文与来源列表（标题取自已加载的索引目录）
+        titles = self.retriever.catalog.get_titles()
+        state['processed_query'] = processed_query
+        state['retrieved_docs'] = retrieved_docs
+        state['context'] = self._build_context(retrieved_docs, titles)
+        state['sources'] = [
             {
                 'doc_id': doc['doc_id'],
-                'title': self._get_doc_title(doc['doc_id']),
+                'title': titles.get(doc['doc_id'], doc['doc_id']),
                 'content': doc['content'][:200] + '...' if len(doc['content']) > 200 else doc['content'],
                 'score': doc['score']
             }
             for doc in retrieved_docs
         ]
-        
-        return {
+        return state
+    
+    def _finish(self, query: str, state: Dict, answer: Optional[str]) -> Dict:
+        """组装最终结果并写入缓存"""
+        result = {
             'query': query,
-            'processed_query': processed_query,
-            'retrieved_docs': retrieved_docs,
-            'context': context,
+            'processed_query': state['processed_query'],
+            'retrieved_docs': state['retrieved_docs'],
+            'context': state['context'],
             'answer': answer,
-            'sources': sources
+            'sources': state['sources']
         }
+        
+        # 生成失败（answer为None）的结果不缓存，下次重新尝试
+        if answer is not None or not state['generate']:
+            if self.result_cache is not None:
+                self.result_cache.put(state['cache_key'], result, state['cache_version'])
+            if self.semantic_cache is not None:
+                self.semantic_cache.put(state['query_embedding'], state['semantic_scope'], query, result)
+        return result
     
-    def _build_context(self, docs: List[Dict]) -> str:
+    def get_cache_stats(self) -> Dict:
+        """
+        问答缓存统计
+        
+        Returns:
+            exact_hits（规范化后相同的问题）、semantic_hits（相似的问题）、misses，
+            以及各缓存自身的统计
+        """
+        lookups = sum(self.cache_counts.values())
+        return {
+            **self.cache_counts,
+            'hit_rate': (self.cache_counts['exact_hits'] + self.cache_counts['semantic_hits']) / lookups if lookups else 0.0,
+            'result_cache': self.result_cache.get_stats() if self.result_cache is not None else None,
+            'semantic_cache': self.semantic_cache.get_stats() if self.semantic_cache is not None else None
+        }
+    
+    def _build_context(self, docs: List[Dict], titles: Optional[Dict[str, str]] = None) -> str:
         """构建上下文"""
+        if titles is None:
+            titles = self.retriever.catalog.get_titles()
         context_parts = []
         
         for i, doc in enumerate(docs, 1):
             doc_id = doc['doc_id']
-            title = self._get_doc_title(doc_id)
+            title = titles.get(doc_id, doc_id)
             content = doc['content']
             
             context_parts.append(
@@ -143,12 +320,9 @@ class RAGChain:
         
         return "\n---\n".join(context_parts)
     
-    def _generate_answer(self, query: str, context: str) -> str:
-        """使用LLM生成回答"""
-        if not self.llm:
-            return None
-        
-        prompt = f"""基于以下知识库内容回答用户问题。
+    def _build_prompt(self, query: str, context: str) -> str:
+        """构建生成回答的提示词"""
+        return f"""基于以下知识库内容回答用户问题。
 
 知识库内容：
 {context}
@@ -158,15 +332,25 @@ class RAGChain:
 请基于上述知识库内容，用中文回答用户问题。如果知识库中没有相关信息，请说明。
 
 回答："""
+    
+    def _openai_messages(self, prompt: str) -> List[Dict]:
+        return [
+            {"role": "system", "content": "你是一个知识库助手，基于提供的知识库内容回答问题。"},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _generate_answer(self, query: str, context: str) -> str:
+        """使用LLM生成回答"""
+        if not self.llm:
+            return None
+        
+        prompt = self._build_prompt(query, context)
         
         try:
             if self.llm_provider == "openai":
                 response = self.llm.chat.completions.create(
                     model=self.llm_model,
-                    messages=[
-                        {"role": "system", "content": "你是一个知识库助手，基于提供的知识库内容回答问题。"},
-                        {"role": "user", "content": prompt}
-                    ],
+                    messages=self._openai_messages(prompt),
                     temperature=0.7,
                     max_tokens=1000
                 )
@@ -177,9 +361,78 @@ class RAGChain:
             logger.error(f"LLM生成回答失败: {e}")
             return None
     
-    def _get_doc_title(self, doc_id: str) -> str:
-        """获取文档标题"""
-        doc_info = self.retriever.get_doc_info(doc_id)
-        if doc_info:
-            return doc_info.get('title', doc_id)
-        return doc_id
+    def _get_async_openai(self):
+        """获取当前事件循环的异步OpenAI客户端（连接池不能跨事件循环共享）"""
+        loop = asyncio.get_running_loop()
+        if self._async_openai is None or self._async_openai_loop is not loop:
+            from openai import AsyncOpenAI
+            self._async_openai = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL or None)
+            self._async_openai_loop = loop
+        return self._async_openai
+    
+    async def _agenerate_answer(self, query: str, context: str) -> Optional[str]:
+        """使用异步LLM客户端生成回答"""
+        if not self.llm:
+            return None
+        
+        prompt = self._build_prompt(query, context)
+        
+        try:
+            if self.llm_provider == "openai":
+                response = await self._get_async_openai().chat.completions.create(
+                    model=self.llm_model,
+                    messages=self._openai_messages(prompt),
+                    temperature=0.7,
+                    max_tokens=1000
+                )
+                return response.choices[0].message.content
+            elif self.llm_provider == "ollama":
+                return await self.llm.ainvoke(prompt)
+        except Exception as e:
+            logger.error(f"LLM生成回答失败: {e}")
+            return None
+    
+    def _stream_answer(self, query: str, context: str) -> Generator[Dict, None, Optional[str]]:
+        """
+        使用LLM流式生成回答
+        
+        Yields:
+            {'type': 'token', 'text'} 回答片段
+            
+        Returns:
+            完整回答；生成失败或中途出错时返回None
+        """
+        if not self.llm:
+            return None
+        
+        prompt = self._build_prompt(query, context)
+        parts = []
+        try:
+            if self.llm_provider == "openai":
+                stream = self.llm.chat.completions.create(
+                    model=self.llm_model,
+                    messages=self._openai_messages(prompt),
+                    temperature=0.7,
+                    max_tokens=1000,
+                    stream=True
+                )
+                try:
+                    for chunk in stream:
+                        text = chunk.choices[0].delta.content if chunk.choices else None
+                        if text:
+                            parts.append(text)
+                            yield {'type': 'token', 'text': text}
+                finally:
+                    # 调用方提前停止迭代时也释放连接
+                    stream.close()
+            elif self.llm_provider == "ollama":
+                for text in self.llm.stream(prompt):
+                    if text:
+                        parts.append(text)
+                        yield {'type': 'token', 'text': text}
+            else:
+                return None
+        except Exception as e:
+            logger.error(f"LLM流式生成回答失败（已输出 {len(parts)} 段）: {e}")
+            return None
+        return "".join(parts)
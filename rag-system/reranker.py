@@ -0,0 +1,280 @@
+"""
+交叉编码器重排序
+对融合后的前N个候选块用交叉编码器（如 bge-reranker）逐对打分：
+- 候选数量上限与单次请求的耗时上限
+- (查询, 块) 合批打分
+- 分数按 (模型, 查询哈希, 块ID, 块内容哈希) 持久化缓存，热门问题不必重复打分
+"""
+
+import sqlite3
+import hashlib
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from .config import (
+    RERANK_ENABLED, RERANK_MODEL, RERANK_DEVICE,
+    RERANK_CANDIDATES, RERANK_MAX_LATENCY_MS, RERANK_BATCH_SIZE,
+    RERANK_CACHE_ENABLED, RERANK_CACHE_PATH, RERANK_CACHE_MAX_ENTRIES
+)
+
+logger = logging.getLogger(__name__)
+
+# 单条SQL中IN子句的最大参数个数（SQLite默认上限为999）
+_SQL_BATCH = 500
+
+def _hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class RerankScoreCache:
+    """基于SQLite的重排序分数缓存（超过条目上限时淘汰最早写入的条目）"""
+
+    def __init__(self, db_path: Path, max_entries: int = 1_000_000):
+        """
+        Args:
+            db_path: 缓存数据库文件路径
+            max_entries: 条目数上限
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # 块内容哈希一并作为键：块ID不变但内容更新后不会命中旧分数
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rerank_scores (
+                model TEXT NOT NULL,
+                query_hash TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                score REAL NOT NULL,
+                PRIMARY KEY (model, query_hash, chunk_id, text_hash)
+            )
+            """
+        )
+        self._conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model_name: str, query: str, candidates: List[Tuple[str, str]]) -> List[Optional[float]]:
+        """
+        批量查询分数
+
+        Args:
+            model_name: 模型名称
+            query: 查询文本
+            candidates: [(块ID, 块内容)]
+
+        Returns:
+            与candidates对应的分数，未命中的位置为None
+        """
+        query_hash = _hash_text(query)
+        keys = [(chunk_id, _hash_text(text)) for chunk_id, text in candidates]
+        found: Dict[Tuple[str, str], float] = {}
+        with self._lock:
+            chunk_ids = list(dict.fromkeys(chunk_id for chunk_id, _ in keys))
+            for i in range(0, len(chunk_ids), _SQL_BATCH):
+                batch = chunk_ids[i:i + _SQL_BATCH]
+                rows = self._conn.execute(
+                    "SELECT chunk_id, text_hash, score FROM rerank_scores "
+                    f"WHERE model = ? AND query_hash = ? AND chunk_id IN ({','.join('?' * len(batch))})",
+                    [model_name, query_hash, *batch]
+                ).fetchall()
+                for chunk_id, text_hash, score in rows:
+                    found[(chunk_id, text_hash)] = score
+            results = [found.get(key) for key in keys]
+            hit_count = sum(1 for score in results if score is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, model_name: str, query: str, candidates: List[Tuple[str, str]], scores: List[float]):
+        """
+        批量写入分数
+
+        Args:
+            model_name: 模型名称
+            query: 查询文本
+            candidates: [(块ID, 块内容)]
+            scores: 对应的分数
+        """
+        if not candidates:
+            return
+        query_hash = _hash_text(query)
+        rows = [
+            (model_name, query_hash, chunk_id, _hash_text(text), float(score))
+            for (chunk_id, text), score in zip(candidates, scores)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO rerank_scores (model, query_hash, chunk_id, text_hash, score) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM rerank_scores").fetchone()[0]
+            if count > self.max_entries:
+                # 淘汰到上限的90%
+                n_evict = count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM rerank_scores WHERE rowid IN "
+                    "(SELECT rowid FROM rerank_scores ORDER BY rowid LIMIT ?)",
+                    (n_evict,)
+                )
+                logger.info(f"重排序缓存超过上限，已淘汰 {n_evict} 条")
+            self._conn.commit()
+
+    def get_stats(self) -> Dict:
+        """获取缓存统计信息"""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM rerank_scores").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': count
+        }
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM rerank_scores")
+            self._conn.commit()
+        logger.warning(f"已清空重排序缓存: {self.db_path}")
+
+class CrossEncoderReranker:
+    """交叉编码器重排序（首次使用时加载模型）"""
+
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL,
+        device: str = RERANK_DEVICE,
+        cache: Optional[RerankScoreCache] = None,
+        max_candidates: int = RERANK_CANDIDATES,
+        max_latency_ms: float = RERANK_MAX_LATENCY_MS,
+        batch_size: int = RERANK_BATCH_SIZE
+    ):
+        """
+        Args:
+            model_name: 交叉编码器模型名称或路径
+            device: 设备类型
+            cache: 分数缓存（可选）
+            max_candidates: 参与打分的候选块数上限
+            max_latency_ms: 单次重排序的耗时上限（毫秒），0表示不限制；
+                超时后剩余候选不再打分，排在已打分的候选之后
+            batch_size: 每批送入模型的 (查询, 块) 对数
+        """
+        self.model_name = model_name
+        self.device = device
+        self.cache = cache
+        self.max_candidates = max_candidates
+        self.max_latency_ms = max_latency_ms
+        self.batch_size = batch_size
+        self._model = None
+        self._ms_per_pair: Optional[float] = None  # 单对打分耗时的滑动估计，用于在耗时上限内裁剪批次
+        self.last_stats: Dict = {}
+        self.totals = {'requests': 0, 'candidates': 0, 'cached': 0, 'scored': 0, 'skipped': 0, 'ms': 0.0}
+
+    @property
+    def model(self):
+        """交叉编码器模型"""
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+
+            logger.info(f"正在加载重排序模型: {self.model_name} (设备: {self.device})")
+            self._model = CrossEncoder(self.model_name, device=self.device)
+            logger.info("重排序模型加载成功")
+        return self._model
+
+    def score(self, query: str, candidates: List[Tuple[str, str]]) -> List[Optional[float]]:
+        """
+        为候选块打分（最多 max_candidates 个，受耗时上限约束）
+
+        Args:
+            query: 查询文本
+            candidates: 按当前名次排列的 [(块ID, 块内容)]
+
+        Returns:
+            与candidates对应的分数，超出候选上限或超时未打分的位置为None
+        """
+        start = time.perf_counter()
+        budget = candidates[:self.max_candidates]
+        scores: List[Optional[float]] = (
+            self.cache.get_many(self.model_name, query, budget) if self.cache is not None else [None] * len(budget)
+        )
+        cached = sum(1 for score in scores if score is not None)
+
+        # 按当前名次从高到低合批打分，越靠前的候选越先得到分数
+        pending = [i for i, score in enumerate(scores) if score is None]
+        scored = []
+        while pending:
+            batch_size = self.batch_size
+            if self.max_latency_ms > 0:
+                remaining_ms = self.max_latency_ms - (time.perf_counter() - start) * 1000
+                if self._ms_per_pair:
+                    batch_size = min(batch_size, int(remaining_ms / self._ms_per_pair))
+                if remaining_ms <= 0 or batch_size <= 0:
+                    break
+            batch, pending = pending[:batch_size], pending[batch_size:]
+
+            batch_start = time.perf_counter()
+            batch_scores = self.model.predict(
+                [(query, budget[i][1]) for i in batch],
+                batch_size=len(batch),
+                show_progress_bar=False
+            )
+            ms_per_pair = (time.perf_counter() - batch_start) * 1000 / len(batch)
+            self._ms_per_pair = ms_per_pair if self._ms_per_pair is None else 0.7 * self._ms_per_pair + 0.3 * ms_per_pair
+
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+            scored.extend(batch)
+
+        if self.cache is not None and scored:
+            self.cache.put_many(self.model_name, query, [budget[i] for i in scored], [scores[i] for i in scored])
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.last_stats = {
+            'candidates': len(budget),
+            'cached': cached,
+            'scored': len(scored),
+            'skipped': len(candidates) - cached - len(scored),
+            'ms': round(elapsed_ms, 2)
+        }
+        self.totals['requests'] += 1
+        for key in ('candidates', 'cached', 'scored', 'skipped'):
+            self.totals[key] += self.last_stats[key]
+        self.totals['ms'] += elapsed_ms
+        return scores + [None] * (len(candidates) - len(budget))
+
+    def get_stats(self) -> Dict:
+        """累计统计（avg_ms 为每次重排序的平均耗时）"""
+        stats = dict(self.totals)
+        stats['ms'] = round(stats['ms'], 2)
+        stats['avg_ms'] = round(stats['ms'] / stats['requests'], 2) if stats['requests'] else 0.0
+        if self.cache is not None:
+            stats['cache'] = self.cache.get_stats()
+        return stats
+
+def create_reranker(enabled: bool = RERANK_ENABLED, use_cache: bool = RERANK_CACHE_ENABLED) -> Optional[CrossEncoderReranker]:
+    """
+    按配置创建重排序器
+
+    Args:
+        enabled: 是否启用（RERANK_ENABLED）
+        use_cache: 是否启用分数磁盘缓存
+
+    Returns:
+        重排序器实例，未启用时返回None
+    """
+    if not enabled:
+        return None
+    cache = RerankScoreCache(RERANK_CACHE_PATH, RERANK_CACHE_MAX_ENTRIES) if use_cache else None
+    return CrossEncoderReranker(cache=cache)
@@ -0,0 +1,282 @@
+"""
+检索/问答结果缓存
+相同问题（规范化后）直接返回上次的检索结果或回答，不再重复查询处理、向量化、检索和重排序：
+- 内存LRU层 + SQLite磁盘层（多个进程共享）
+- 键包含规范化查询与检索参数，条目按索引版本号标记
+- 构建/增量更新索引后递增版本号（vector_db/index_version.json），旧版本的条目全部失效
+"""
+
+import os
+import json
+import pickle
+import sqlite3
+import hashlib
+import threading
+import time
+import unicodedata
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+from .lru_cache import LRUCache
+from .config import (
+    RESULT_CACHE_ENABLED, RESULT_CACHE_MEMORY_SIZE, RESULT_CACHE_PATH,
+    RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL, INDEX_VERSION_PATH
+)
+
+logger = logging.getLogger(__name__)
+
+# 规范化时去掉的句末标点（NFKC之后全角标点已转为半角）
+_TRAILING_PUNCTUATION = "?!.。！？~～…"
+
+def normalize_query(query: str) -> str:
+    """
+    规范化查询文本（全角转半角、小写、合并空白、去掉句末标点）
+
+    Args:
+        query: 查询文本
+
+    Returns:
+        规范化后的文本
+    """
+    text = unicodedata.normalize('NFKC', query).lower()
+    return ' '.join(text.split()).rstrip(_TRAILING_PUNCTUATION + ' ')
+
+def read_index_version(version_path: Path = INDEX_VERSION_PATH) -> int:
+    """读取索引版本号（文件不存在时为0）"""
+    try:
+        with open(version_path, 'r', encoding='utf-8') as f:
+            return int(json.load(f)['version'])
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"索引版本号读取失败 {version_path}: {e}")
+        return 0
+
+def bump_index_version(version_path: Path = INDEX_VERSION_PATH) -> int:
+    """
+    递增索引版本号（写入向量库后调用，使所有进程中的结果缓存失效）
+
+    Args:
+        version_path: 版本号文件路径
+
+    Returns:
+        新的版本号
+    """
+    version = read_index_version(version_path) + 1
+    version_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = version_path.with_name(f"{version_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': version, 'updated_at': datetime.now().isoformat(timespec='seconds')}, f)
+    os.replace(tmp_path, version_path)
+    logger.info(f"索引版本号已更新: {version}")
+    return version
+
+class IndexVersionWatcher:
+    """跟踪索引版本号（按文件 (mtime, size) 判断是否变化，未变化时不重新读取）"""
+
+    def __init__(self, version_path: Path = INDEX_VERSION_PATH):
+        """
+        Args:
+            version_path: 版本号文件路径
+        """
+        self.version_path = version_path
+        self._signature: Optional[Tuple[int, int]] = None
+        self.version: Optional[int] = None
+
+    def check(self) -> Tuple[int, bool]:
+        """
+        读取当前版本号
+
+        Returns:
+            (版本号, 是否比上次读取时发生了变化)，首次读取时不算变化
+        """
+        try:
+            stat = os.stat(self.version_path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+        if signature == self._signature and self.version is not None:
+            return self.version, False
+
+        self._signature = signature
+        version = read_index_version(self.version_path)
+        changed = self.version is not None and version != self.version
+        self.version = version
+        return version, changed
+
+class ResultCache:
+    """两级结果缓存（内存LRU + SQLite磁盘，按索引版本号失效）"""
+
+    def __init__(
+        self,
+        db_path: Path = RESULT_CACHE_PATH,
+        version_path: Path = INDEX_VERSION_PATH,
+        memory_size: int = RESULT_CACHE_MEMORY_SIZE,
+        max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+        ttl: float = RESULT_CACHE_TTL
+    ):
+        """
+        Args:
+            db_path: 磁盘层数据库文件路径
+            version_path: 索引版本号文件路径
+            memory_size: 内存层条目数
+            max_entries: 磁盘层条目数上限，超过后淘汰最早写入的条目
+            ttl: 过期时间（秒），0表示只按索引版本失效
+        """
+        self.db_path = db_path
+        self.version_path = version_path
+        self.max_entries = max_entries
+        self.ttl = ttl or None
+        self.memory = LRUCache(memory_size, self.ttl)
+
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                value BLOB NOT NULL,
+                created REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+        self._version_watcher = IndexVersionWatcher(version_path)
+        self._purged_version: Optional[int] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(namespace: str, query: str, **params) -> str:
+        """
+        生成缓存键
+
+        Args:
+            namespace: 结果类型（retrieve / query）
+            query: 查询文本（会被规范化）
+            **params: 影响结果的其他参数（top_k、layer、doc_type、expand_related等）
+
+        Returns:
+            键的哈希
+        """
+        raw = json.dumps([namespace, normalize_query(query), sorted(params.items())], ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def current_version(self) -> int:
+        """当前索引版本号（变化时清空内存层并删除磁盘层中的旧版本条目）"""
+        with self._lock:
+            version, changed = self._version_watcher.check()
+            if changed:
+                logger.info(f"索引版本号变为 {version}，结果缓存失效")
+                self.invalidations += 1
+                self.memory.clear()
+            if version != self._purged_version:
+                self._purged_version = version
+                self._conn.execute("DELETE FROM results WHERE version != ?", (version,))
+                self._conn.commit()
+        return version
+
+    def get(self, key: str, version: Optional[int] = None) -> Optional[Any]:
+        """
+        查询缓存（先查内存层，未命中再查磁盘层）
+
+        Args:
+            key: make_key 生成的键
+            version: 索引版本号，None表示当前版本
+
+        Returns:
+            缓存的结果，未命中时返回None
+        """
+        if version is None:
+            version = self.current_version()
+        data = self.memory.get((key, version))
+        if data is not None:
+            self.memory_hits += 1
+            return pickle.loads(data)
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM results WHERE key = ? AND version = ?", (key, version)
+            ).fetchone()
+        if row is None or (self.ttl is not None and time.time() - row[1] > self.ttl):
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self.memory.put((key, version), row[0])
+        return pickle.loads(row[0])
+
+    def put(self, key: str, value: Any, version: Optional[int] = None):
+        """
+        写入缓存
+
+        Args:
+            key: make_key 生成的键
+            value: 结果（可pickle）
+            version: 计算结果时的索引版本号（应在查询前取得，避免计算期间版本变化后写入旧结果）
+        """
+        if version is None:
+            version = self.current_version()
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.memory.put((key, version), data)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, version, value, created) VALUES (?, ?, ?, ?)",
+                (key, version, data, time.time())
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            if count > self.max_entries:
+                # 淘汰到上限的90%
+                n_evict = count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY rowid LIMIT ?)",
+                    (n_evict,)
+                )
+                logger.info(f"结果缓存超过上限，已淘汰 {n_evict} 条")
+            self._conn.commit()
+
+    def get_stats(self) -> Dict:
+        """获取缓存统计信息（仅统计当前进程）"""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            'invalidations': self.invalidations,
+            'index_version': self._version_watcher.version,
+            'memory_size': len(self.memory),
+            'disk_entries': count
+        }
+
+    def clear(self):
+        """清空缓存"""
+        self.memory.clear()
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+        logger.warning(f"已清空结果缓存: {self.db_path}")
+
+def create_result_cache(enabled: bool = RESULT_CACHE_ENABLED) -> Optional[ResultCache]:
+    """
+    按配置创建结果缓存
+
+    Args:
+        enabled: 是否启用（RESULT_CACHE_ENABLED）
+
+    Returns:
+        结果缓存实例，未启用时返回None
+    """
+    if not enabled:
+        return None
+    return ResultCache()
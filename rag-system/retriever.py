@@ -5,13 +5,17 @@
 
 from typing import List, Dict, Optional, Set
 from pathlib import Path
-import yaml
 import logging
 from collections import defaultdict
 
 from .vector_store import VectorStore
 from .embedding import EmbeddingModel
-from .config import INDEX_DIR, TOP_K
+from .index_catalog import get_index_catalog
+from .m3_vectors import sparse_score, colbert_score
+from .reranker import CrossEncoderReranker
+from .result_cache import ResultCache
+from .pattern_matcher import FIELD_QUERY_PATTERNS, FIELD_KEYWORDS
+from .config import INDEX_DIR, TOP_K, RRF_K, KEYWORD_MATCH_BOOST, M3_WEIGHT_DENSE, M3_WEIGHT_SPARSE, M3_WEIGHT_COLBERT
 
 logger = logging.getLogger(__name__)
 
@@ -22,7 +26,9 @@ class HybridRetriever:
         self,
         vector_store: VectorStore,
         embedding_model: EmbeddingModel,
-        index_dir: Path = INDEX_DIR
+        index_dir: Path = INDEX_DIR,
+        reranker: Optional[CrossEncoderReranker] = None,
+        result_cache: Optional[ResultCache] = None
     ):
         """
         初始化混合检索器
@@ -31,11 +37,15 @@ class HybridRetriever:
             vector_store: 向量数据库实例
             embedding_model: Embedding模型实例
             index_dir: 索引文件目录
+            reranker: 交叉编码器重排序器（可选，对融合后的候选块重新打分）
+            result_cache: 结果缓存（可选，相同查询和参数直接返回上次的结果）
         """
         self.vector_store = vector_store
         self.embedding_model = embedding_model
         self.index_dir = index_dir
-        self.index_cache = {}  # 缓存索引数据
+        self.reranker = reranker
+        self.result_cache = result_cache
+        self.catalog = get_index_catalog(index_dir)  # 共享的编译后索引目录
     
     def retrieve(
         self,
@@ -64,29 +74,197 @@ class HybridRetriever:
         """
         logger.info(f"开始检索: {query}")
         
-        # 1. 向量检索
-        query_embedding = self.embedding_model.encode_query(query)
+        # 0. 结果缓存（版本号在检索前取得，检索期间索引更新时不会写入旧版本的结果）
+        if self.result_cache is not None:
+            cache_version = self.result_cache.current_version()
+            cache_key = self.result_cache_key(
+                'retrieve', query, top_k=top_k, layer=layer, doc_type=doc_type, expand_related=expand_related
+            )
+            cached = self.result_cache.get(cache_key, cache_version)
+            if cached is not None:
+                logger.info(f"检索结果缓存命中，返回 {len(cached)} 个结果")
+                return cached
+        
+        # 1. 向量检索（启用BGE-M3多向量时，查询的稠密/稀疏/多向量一次前向得到，再对召回结果重新打分）
+        query_multi = self._encode_query_multi(query)
+        query_embedding = query_multi['dense'] if query_multi else self.embedding_model.encode_query(query)
         vector_results = self.vector_store.search(
             query_embedding,
             n_results=top_k * 3,  # 多召回一些，后续重排序
             where=self._build_filter(layer, doc_type)
         )
+        if query_multi:
+            vector_results = self._score_multi_vector(query_multi, vector_results)
         
-        # 2. 关键词匹配（query_patterns）
+        # 2. BM25关键词检索（与向量检索召回相同数量）
+        sparse_results = self.vector_store.search_sparse(
+            query,
+            n_results=top_k * 3,
+            where=self._build_filter(layer, doc_type)
+        )
+        
+        # 3. 关键词匹配（query_patterns，以及加权较弱的 keywords）
         pattern_matches = self._match_query_patterns(query, layer, doc_type)
+        keyword_matches = self._match_keywords(query, layer, doc_type)
         
-        # 3. 结果融合与重排序
+        # 4. 结果融合与重排序
         final_results = self._rerank(
             vector_results,
             pattern_matches,
             query,
             top_k,
-            expand_related
+            expand_related,
+            sparse_results,
+            keyword_matches
         )
         
+        if self.result_cache is not None:
+            self.result_cache.put(cache_key, final_results, cache_version)
+        
         logger.info(f"检索完成，返回 {len(final_results)} 个结果")
         return final_results
     
+    def result_cache_key(self, namespace: str, query: str, **params) -> str:
+        """
+        结果缓存键（YAML索引目录的版本一并计入，query_patterns和关联关系变化后不会命中旧结果）
+        
+        Args:
+            namespace: 结果类型（retrieve / query）
+            query: 查询文本
+            **params: 影响结果的参数
+        """
+        self.catalog.refresh()
+        return ResultCache.make_key(namespace, query, catalog_version=self.catalog.version, **params)
+    
+    def retrieve_many(
+        self,
+        queries: List[str],
+        top_k: int = TOP_K,
+        layer: Optional[str] = None,
+        doc_type: Optional[str] = None,
+        expand_related: bool = True,
+        batch_size: int = 256
+    ) -> List[List[Dict]]:
+        """
+        批量混合检索（用于离线评测、批量问答等场景）
+        
+        每批查询只做一次批量向量化和一次多向量检索，关键词匹配与重排序仍按查询分别进行，
+        单个查询的结果与 retrieve 相同。
+        
+        Args:
+            queries: 查询文本列表
+            top_k: 每个查询返回的结果数量
+            layer: 层级过滤（对所有查询生效）
+            doc_type: 文档类型过滤（对所有查询生效）
+            expand_related: 是否扩展关联文档
+            batch_size: 每批查询数量（控制单次向量化和检索的规模）
+            
+        Returns:
+            与queries顺序一致的检索结果列表
+        """
+        logger.info(f"开始批量检索: {len(queries)} 个查询")
+        where = self._build_filter(layer, doc_type)
+        
+        all_results: List[List[Dict]] = []
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start:start + batch_size]
+            
+            # 1. 批量向量化 + 一次多向量检索
+            query_multis = self.embedding_model.encode_queries_multi(batch) if self._multi_vector_enabled else None
+            if query_multis and all(query_multis):
+                query_embeddings = [query_multi['dense'] for query_multi in query_multis]
+            else:
+                query_multis = None
+                query_embeddings = self.embedding_model.encode_queries(batch)
+            vector_results = self.vector_store.search_many(
+                query_embeddings,
+                n_results=top_k * 3,
+                where=where
+            )
+            
+            # 2-4. 每个查询分别做BM25检索、关键词匹配和重排序
+            for i, query in enumerate(batch):
+                query_vector_results = self._slice_results(vector_results, i)
+                if query_multis:
+                    query_vector_results = self._score_multi_vector(query_multis[i], query_vector_results)
+                sparse_results = self.vector_store.search_sparse(query, n_results=top_k * 3, where=where)
+                pattern_matches = self._match_query_patterns(query, layer, doc_type)
+                keyword_matches = self._match_keywords(query, layer, doc_type)
+                all_results.append(self._rerank(
+                    query_vector_results,
+                    pattern_matches,
+                    query,
+                    top_k,
+                    expand_related,
+                    sparse_results,
+                    keyword_matches
+                ))
+        
+        logger.info(f"批量检索完成: {len(all_results)} 个查询")
+        return all_results
+    
+    @staticmethod
+    def _slice_results(results: Dict, i: int) -> Dict:
+        """从多查询检索结果中取出第i个查询的结果（保持单查询结果的格式）"""
+        return {
+            key: [results[key][i]]
+            for key in ('ids', 'documents', 'metadatas', 'distances')
+            if results.get(key)
+        }
+    
+    @property
+    def _multi_vector_enabled(self) -> bool:
+        """是否启用BGE-M3稀疏/多向量打分（配置了多向量存储且模型支持）"""
+        model = self.embedding_model
+        return getattr(model, 'multi_vector_store', None) is not None and model.supports_multi_vector
+    
+    def _encode_query_multi(self, query: str) -> Optional[Dict]:
+        """查询的BGE-M3稠密/稀疏/多向量表示（未启用时返回None）"""
+        if not self._multi_vector_enabled:
+            return None
+        return self.embedding_model.encode_query_multi(query)
+    
+    def _score_multi_vector(self, query_multi: Dict, vector_results: Dict) -> Dict:
+        """
+        用BGE-M3词权重和多向量为召回的块重新打分
+        
+        融合分数 = 稠密相似度、词权重匹配分、ColBERT分 的加权平均（M3_WEIGHT_*），
+        写回为距离（1 - 融合分数）并按新分数重新排序，后续RRF融合与重排序不变。
+        有块缺少多向量（如旧索引或客户端模式构建）时保持原结果，避免分数不可比。
+        
+        Args:
+            query_multi: encode_query_multi 的输出
+            vector_results: 单个查询的向量检索结果
+            
+        Returns:
+            格式与 vector_results 相同的结果
+        """
+        if not vector_results or not vector_results.get('ids') or not vector_results['ids'][0]:
+            return vector_results
+        
+        documents = vector_results['documents'][0]
+        stored = self.embedding_model.multi_vector_store.get_many(documents)
+        if any(item is None for item in stored):
+            logger.debug("部分块缺少多向量，跳过BGE-M3多向量打分")
+            return vector_results
+        
+        total_weight = M3_WEIGHT_DENSE + M3_WEIGHT_SPARSE + M3_WEIGHT_COLBERT
+        scores = [
+            (
+                M3_WEIGHT_DENSE * (1.0 - distance)
+                + M3_WEIGHT_SPARSE * sparse_score(query_multi['sparse'], item['sparse'])
+                + M3_WEIGHT_COLBERT * colbert_score(query_multi['colbert'], item['colbert'])
+            ) / total_weight
+            for distance, item in zip(vector_results['distances'][0], stored)
+        ]
+        order = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        return {
+            'ids': [[vector_results['ids'][0][i] for i in order]],
+            'documents': [[documents[i] for i in order]],
+            'metadatas': [[vector_results['metadatas'][0][i] for i in order]],
+            'distances': [[1.0 - scores[i] for i in order]]
+        }
+    
     def _match_query_patterns(
         self,
         query: str,
@@ -104,39 +282,29 @@ class HybridRetriever:
         Returns:
             匹配的文档ID列表
         """
-        matches = []
-        query_lower = query.lower()
+        # 自动机一次扫描查询：模式包含于查询（Aho-Corasick）或查询包含于模式（后缀自动机）
+        return self.catalog.get_matcher().match(query, layer, doc_type, fields=(FIELD_QUERY_PATTERNS,))
+    
+    def _match_keywords(
+        self,
+        query: str,
+        layer: Optional[str] = None,
+        doc_type: Optional[str] = None
+    ) -> List[str]:
+        """
+        匹配YAML索引的keywords（与query_patterns同样的自动机匹配，命中只为已召回的块加权）
         
-        for index_file in self.index_dir.glob("*.yaml"):
-            doc_id = index_file.stem
-            
-            # 加载索引
-            if doc_id not in self.index_cache:
-                try:
-                    with open(index_file, 'r', encoding='utf-8') as f:
-                        self.index_cache[doc_id] = yaml.safe_load(f)
-                except Exception as e:
-                    logger.warning(f"加载索引文件失败 {index_file}: {e}")
-                    continue
-            
-            index_data = self.index_cache[doc_id]
-            
-            # 过滤检查
-            if layer and index_data.get('layer') != layer:
-                continue
-            if doc_type and index_data.get('doc_type') != doc_type:
-                continue
+        Args:
+            query: 查询文本
+            layer: 层级过滤
+            doc_type: 文档类型过滤
             
-            # 匹配query_patterns
-            patterns = index_data.get('query_patterns', [])
-            for pattern in patterns:
-                pattern_lower = pattern.lower()
-                # 简单匹配：查询包含模式或模式包含查询
-                if pattern_lower in query_lower or query_lower in pattern_lower:
-                    matches.append(doc_id)
-                    break
-        
-        return matches
+        Returns:
+            匹配的文档ID列表（KEYWORD_MATCH_BOOST 为1时不匹配，返回空列表）
+        """
+        if KEYWORD_MATCH_BOOST == 1.0:
+            return []
+        return self.catalog.get_matcher().match(query, layer, doc_type, fields=(FIELD_KEYWORDS,))
     
     def _expand_related_docs(self, doc_ids: List[str]) -> Set[str]:
         """
@@ -151,19 +319,9 @@ class HybridRetriever:
         related_docs = set(doc_ids)
         
         for doc_id in doc_ids:
-            if doc_id not in self.index_cache:
-                index_file = self.index_dir / f"{doc_id}.yaml"
-                if index_file.exists():
-                    try:
-                        with open(index_file, 'r', encoding='utf-8') as f:
-                            self.index_cache[doc_id] = yaml.safe_load(f)
-                    except Exception as e:
-                        logger.warning(f"加载索引文件失败 {index_file}: {e}")
-                        continue
-            
-            if doc_id in self.index_cache:
-                related = self.index_cache[doc_id].get('related_docs', [])
-                related_docs.update(related)
+            index_data = self.catalog.get(doc_id)
+            if index_data:
+                related_docs.update(index_data.get('related_docs', []))
         
         return related_docs
     
@@ -173,7 +331,9 @@ class HybridRetriever:
         pattern_matches: List[str],
         query: str,
         top_k: int,
-        expand_related: bool
+        expand_related: bool,
+        sparse_results: Optional[Dict] = None,
+        keyword_matches: Optional[List[str]] = None
     ) -> List[Dict]:
         """
         重排序结果
@@ -184,6 +344,8 @@ class HybridRetriever:
             query: 查询文本
             top_k: 返回数量
             expand_related: 是否扩展关联文档
+            sparse_results: BM25检索结果（可选，与向量结果做RRF融合）
+            keyword_matches: keywords匹配的文档ID（可选，加权弱于query_patterns，不单独引入文档）
             
         Returns:
             重排序后的结果列表
@@ -191,67 +353,65 @@ class HybridRetriever:
         # 收集所有候选结果
         candidates = {}
         
-        # 处理向量检索结果
-        if vector_results and 'ids' in vector_results and vector_results['ids']:
-            ids = vector_results['ids'][0]
-            documents = vector_results['documents'][0]
-            metadatas = vector_results['metadatas'][0]
-            distances = vector_results['distances'][0] if 'distances' in vector_results else [0.0] * len(ids)
+        # 处理向量检索结果（有BM25结果时先按名次做RRF融合，启用时再经交叉编码器重新打分）
+        fused = self._fuse_results(vector_results, sparse_results)
+        if self.reranker is not None and fused:
+            fused = self._cross_encode(query, fused)
+        for doc_id_chunk, document, metadata, score in fused:
+            # 提取doc_id（格式：DOC-D001_metadata_0）
+            doc_id = doc_id_chunk.split('_')[0]
             
-            for i, doc_id_chunk in enumerate(ids):
-                # 提取doc_id（格式：DOC-D001_metadata_0）
-                doc_id = doc_id_chunk.split('_')[0]
-                
-                score = 1.0 - distances[i]  # 距离转相似度
-                weight = float(metadatas[i].get('weight', 1.0))
-                
-                # 应用权重
-                final_score = score * weight
-                
-                # 如果是query_pattern匹配，额外加分
-                if doc_id in pattern_matches:
-                    final_score *= 1.5
-                
-                # 如果是core文档，额外加分
-                doc_weight = metadatas[i].get('doc_weight', 'important')
-                if doc_weight == 'core':
-                    final_score *= 1.3
-                elif doc_weight == 'important':
-                    final_score *= 1.1
-                
-                # 合并同一文档的不同块
-                if doc_id not in candidates:
-                    candidates[doc_id] = {
-                        'doc_id': doc_id,
-                        'content': documents[i],
-                        'score': final_score,
-                        'metadata': metadatas[i],
-                        'chunks': [{
-                            'content': documents[i],
-                            'score': score,
-                            'chunk_type': metadatas[i].get('chunk_type', 'content')
-                        }]
-                    }
-                else:
-                    # 如果这个块的分数更高，更新内容
-                    if final_score > candidates[doc_id]['score']:
-                        candidates[doc_id]['content'] = documents[i]
-                        candidates[doc_id]['score'] = final_score
-                        candidates[doc_id]['metadata'] = metadatas[i]
-                    
-                    # 添加块信息
-                    candidates[doc_id]['chunks'].append({
-                        'content': documents[i],
+            weight = float(metadata.get('weight', 1.0))
+            
+            # 应用权重
+            final_score = score * weight
+            
+            # 如果是query_pattern匹配，额外加分；只命中keywords时加分较少
+            if doc_id in pattern_matches:
+                final_score *= 1.5
+            elif keyword_matches and doc_id in keyword_matches:
+                final_score *= KEYWORD_MATCH_BOOST
+            
+            # 如果是core文档，额外加分
+            doc_weight = metadata.get('doc_weight', 'important')
+            if doc_weight == 'core':
+                final_score *= 1.3
+            elif doc_weight == 'important':
+                final_score *= 1.1
+            
+            # 合并同一文档的不同块
+            if doc_id not in candidates:
+                candidates[doc_id] = {
+                    'doc_id': doc_id,
+                    'content': document,
+                    'score': final_score,
+                    'metadata': metadata,
+                    'chunks': [{
+                        'content': document,
                         'score': score,
-                        'chunk_type': metadatas[i].get('chunk_type', 'content')
-                    })
+                        'chunk_type': metadata.get('chunk_type', 'content')
+                    }]
+                }
+            else:
+                # 如果这个块的分数更高，更新内容
+                if final_score > candidates[doc_id]['score']:
+                    candidates[doc_id]['content'] = document
+                    candidates[doc_id]['score'] = final_score
+                    candidates[doc_id]['metadata'] = metadata
+                
+                # 添加块信息
+                candidates[doc_id]['chunks'].append({
+                    'content': document,
+                    'score': score,
+                    'chunk_type': metadata.get('chunk_type', 'content')
+                })
         
         # 处理关键词匹配但未在向量结果中的文档
         for doc_id in pattern_matches:
             if doc_id not in candidates:
                 # 加载文档摘要作为内容
-                if doc_id in self.index_cache:
-                    index_data = self.index_cache[doc_id]
+                index_data = self.catalog.get(doc_id)
+                if index_data:
                     candidates[doc_id] = {
                         'doc_id': doc_id,
                         'content': index_data.get('summary', ''),
@@ -268,8 +428,8 @@ class HybridRetriever:
         if expand_related:
             related_doc_ids = self._expand_related_docs(list(candidates.keys()))
             for doc_id in related_doc_ids:
-                if doc_id not in candidates and doc_id in self.index_cache:
-                    index_data = self.index_cache[doc_id]
+                index_data = self.catalog.get(doc_id) if doc_id not in candidates else None
+                if index_data:
                     # 关联文档分数较低
                     candidates[doc_id] = {
                         'doc_id': doc_id,
@@ -294,6 +454,100 @@ class HybridRetriever:
         # 返回Top-K
         return sorted_results[:top_k]
     
+    @staticmethod
+    def _fuse_results(vector_results: Dict, sparse_results: Optional[Dict]) -> List[tuple]:
+        """
+        融合向量检索与BM25检索的块
+        
+        没有BM25结果时，块分数为向量相似度（1 - 距离）；
+        有BM25结果时按倒数名次融合（RRF）：Σ 1/(RRF_K + 名次) 决定顺序，分数仍用向量相似度的刻度——
+        融合后第i名取向量结果中第i高的相似度，超出向量结果数的名次取其中最低的相似度。
+        这样关键词匹配的基础分（0.8）、关联文档分（0.5）和各项加权与只有向量检索时含义一致
+        
+        Args:
+            vector_results: 向量检索结果
+            sparse_results: BM25检索结果
+            
+        Returns:
+            [(块ID, 内容, 元数据, 分数)]，按融合后的名次排列
+        """
+        dense = []
+        if vector_results and vector_results.get('ids'):
+            ids = vector_results['ids'][0]
+            distances = vector_results['distances'][0] if 'distances' in vector_results else [0.0] * len(ids)
+            dense = [
+                (chunk_id, document, metadata, 1.0 - distance)  # 距离转相似度
+                for chunk_id, document, metadata, distance in zip(
+                    ids, vector_results['documents'][0], vector_results['metadatas'][0], distances
+                )
+            ]
+        if not sparse_results or not sparse_results.get('ids') or not sparse_results['ids'][0]:
+            return dense
+        
+        sparse = list(zip(sparse_results['ids'][0], sparse_results['documents'][0], sparse_results['metadatas'][0]))
+        fused: Dict[str, float] = defaultdict(float)
+        chunks: Dict[str, tuple] = {}
+        for ranked in (dense, sparse):
+            for rank, (chunk_id, document, metadata, *_) in enumerate(ranked, start=1):
+                fused[chunk_id] += 1.0 / (RRF_K + rank)
+                chunks.setdefault(chunk_id, (document, metadata))
+        
+        order = [chunk_id for chunk_id, _ in sorted(fused.items(), key=lambda item: item[1], reverse=True)]
+        if not dense:
+            # 没有向量结果可借用刻度（过滤后为空），按两路都排第一时的分数归一化
+            best = 2.0 / (RRF_K + 1)
+            return [(chunk_id, chunks[chunk_id][0], chunks[chunk_id][1], fused[chunk_id] / best) for chunk_id in order]
+        similarities = sorted((score for *_, score in dense), reverse=True)
+        return [
+            (chunk_id, chunks[chunk_id][0], chunks[chunk_id][1], similarities[min(i, len(similarities) - 1)])
+            for i, chunk_id in enumerate(order)
+        ]
+    
+    def _cross_encode(self, query: str, fused: List[tuple]) -> List[tuple]:
+        """
+        用交叉编码器为融合后的块重新打分
+        
+        前 RERANK_CANDIDATES 个块的分数替换为交叉编码器分数并重新排序；
+        超出候选上限或因耗时上限未打分的块保持原顺序排在后面，分数不高于已打分块的最低分。
+        
+        Args:
+            query: 查询文本
+            fused: _fuse_results 的输出
+            
+        Returns:
+            格式相同、重新排序后的块列表
+        """
+        scores = self.reranker.score(query, [(chunk_id, document) for chunk_id, document, _, _ in fused])
+        stats = self.reranker.last_stats
+        logger.info(
+            f"交叉编码器重排序: {stats['candidates']} 个候选（缓存命中 {stats['cached']}，"
+            f"打分 {stats['scored']}，跳过 {stats['skipped']}），耗时 {stats['ms']:.1f} ms"
+        )
+        
+        scored = sorted(
+            ((chunk_id, document, metadata, score) for (chunk_id, document, metadata, _), score in zip(fused, scores) if score is not None),
+            key=lambda item: item[3],
+            reverse=True
+        )
+        if not scored:
+            return fused
+        floor = scored[-1][3]
+        rest = [
+            (chunk_id, document, metadata, min(original, floor))
+            for (chunk_id, document, metadata, original), score in zip(fused, scores) if score is None
+        ]
+        return scored + rest
+    
+    def get_result_cache_stats(self) -> Optional[Dict]:
+        """获取结果缓存统计信息（未启用时返回None）"""
+        return self.result_cache.get_stats() if self.result_cache is not None else None
+    
+    def get_rerank_stats(self) -> Optional[Dict]:
+        """交叉编码器重排序统计（未启用时返回None；last 为最近一次请求，含耗时 ms）"""
+        if self.reranker is None:
+            return None
+        return {'last': dict(self.reranker.last_stats), **self.reranker.get_stats()}
+    
     def _build_filter(
         self,
         layer: Optional[str] = None,
@@ -328,14 +582,4 @@ class HybridRetriever:
         Returns:
             文档索引信息
         """
-        if doc_id not in self.index_cache:
-            index_file = self.index_dir / f"{doc_id}.yaml"
-            if index_file.exists():
-                try:
-                    with open(index_file, 'r', encoding='utf-8') as f:
-                        self.index_cache[doc_id] = yaml.safe_load(f)
-                except Exception as e:
-                    logger.warning(f"加载索引文件失败 {index_file}: {e}")
-                    return None
-        
-        return self.index_cache.get(doc_id)
+        return self.catalog.get(doc_id)
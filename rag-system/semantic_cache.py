@@ -0,0 +1,184 @@
+"""
+语义近似查询缓存
+"AI用多了会变傻吗" 与 "AI用多了人会变傻吗?" 这类换个说法的问题精确键缓存命中不了：
+保留最近回答过的查询向量，新查询与其中某个的余弦相似度超过阈值时直接返回那次的检索结果和回答，
+同时跳过检索与LLM生成
+- 向量存放在预分配的矩阵中，一次矩阵乘法完成比较
+- 按LRU淘汰，索引版本号变化时全部失效
+- 只在 top_k、过滤条件、LLM 等参数相同的条目之间比较
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+import logging
+
+import numpy as np
+
+from .result_cache import IndexVersionWatcher
+from .config import (
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE,
+    SEMANTIC_CACHE_TTL, INDEX_VERSION_PATH
+)
+
+logger = logging.getLogger(__name__)
+
+class SemanticQueryCache:
+    """按查询向量相似度命中的结果缓存（进程内，LRU淘汰）"""
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = SEMANTIC_CACHE_SIZE,
+        ttl: float = SEMANTIC_CACHE_TTL,
+        version_watcher: Optional[IndexVersionWatcher] = None
+    ):
+        """
+        Args:
+            threshold: 命中所需的最低余弦相似度
+            max_entries: 最多保留的查询数，超过后淘汰最久未使用的
+            ttl: 过期时间（秒），0表示只按索引版本失效
+            version_watcher: 索引版本号（变化时清空缓存）
+        """
+        if max_entries <= 0:
+            raise ValueError("max_entries必须大于0")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl or None
+        self.version_watcher = version_watcher or IndexVersionWatcher(INDEX_VERSION_PATH)
+
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None  # (max_entries, 维度)，行已归一化
+        self._scopes: List[Optional[Hashable]] = [None] * max_entries  # 空槽为None
+        self._entries: Dict[int, Tuple[str, Any, float]] = {}  # 槽位 -> (原查询, 结果, 写入时间)
+        self._lru: "OrderedDict[int, None]" = OrderedDict()  # 槽位的使用顺序
+        self._free = list(range(max_entries - 1, -1, -1))
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self):
+        """索引版本号变化时清空缓存（调用方持有锁）"""
+        _, changed = self.version_watcher.check()
+        if changed and self._entries:
+            logger.info(f"索引版本号变为 {self.version_watcher.version}，语义缓存失效（{len(self._entries)} 条）")
+            self.invalidations += 1
+            self._clear()
+
+    def _clear(self):
+        self._scopes = [None] * self.max_entries
+        self._entries.clear()
+        self._lru.clear()
+        self._free = list(range(self.max_entries - 1, -1, -1))
+
+    def _release(self, slot: int):
+        self._scopes[slot] = None
+        del self._entries[slot]
+        self._lru.pop(slot, None)
+        self._free.append(slot)
+
+    def get(self, embedding: List[float], scope: Hashable) -> Optional[Tuple[Any, str, float]]:
+        """
+        查找相似的已回答查询
+
+        Args:
+            embedding: 查询向量
+            scope: 影响结果的参数（只与scope相同的条目比较）
+
+        Returns:
+            (结果, 命中的原查询, 相似度)，未命中时返回None
+        """
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        with self._lock:
+            self._check_version()
+            slots = [slot for slot in self._lru if self._scopes[slot] == scope]
+            if not slots or self._matrix is None or self._matrix.shape[1] != len(vector):
+                self.misses += 1
+                return None
+
+            similarities = self._matrix[slots] @ vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            slot = slots[best]
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            query, value, stored_at = self._entries[slot]
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                self._release(slot)
+                self.misses += 1
+                return None
+
+            self._lru.move_to_end(slot)
+            self.hits += 1
+            return value, query, similarity
+
+    def put(self, embedding: List[float], scope: Hashable, query: str, value: Any):
+        """
+        记录已回答的查询
+
+        Args:
+            embedding: 查询向量
+            scope: 影响结果的参数
+            query: 原查询文本
+            value: 结果
+        """
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        with self._lock:
+            self._check_version()
+            if self._matrix is None or self._matrix.shape[1] != len(vector):
+                self._matrix = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                self._clear()
+            if not self._free:
+                oldest = next(iter(self._lru))
+                self._release(oldest)
+                self.evictions += 1
+            slot = self._free.pop()
+            self._matrix[slot] = vector
+            self._scopes[slot] = scope
+            self._entries[slot] = (query, value, time.monotonic())
+            self._lru[slot] = None
+
+    def clear(self):
+        """清空缓存（保留统计）"""
+        with self._lock:
+            self._clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get_stats(self) -> Dict:
+        """获取缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'size': len(self._entries),
+                'max_size': self.max_entries,
+                'threshold': self.threshold
+            }
+
+def create_semantic_cache(enabled: bool = SEMANTIC_CACHE_ENABLED) -> Optional[SemanticQueryCache]:
+    """
+    按配置创建语义缓存
+
+    Args:
+        enabled: 是否启用（SEMANTIC_CACHE_ENABLED）
+
+    Returns:
+        语义缓存实例，未启用时返回None
+    """
+    if not enabled:
+        return None
+    return SemanticQueryCache()
@@ -1,23 +1,70 @@
 """
 向量数据库封装
-支持Chroma、Qdrant等向量数据库
+支持Chroma（HNSW近似检索）和进程内NumPy精确检索（VECTOR_DB_TYPE=numpy）
 """
 
-import chromadb
-from chromadb.config import Settings
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Iterator, Optional, Any
 from pathlib import Path
+import json
+import time
 import logging
 
+from .document_loader import get_chunk_id
+from .bm25_index import BM25Index
+from .numpy_store import NumpyClient
+from .config import (
+    BM25_ENABLED, BM25_CHECK_INTERVAL, VECTOR_DB_TYPE, VECTOR_DB_READ_ONLY, HNSW_PARAMS, HNSW_ENV_OVERRIDES
+)
+
+try:
+    import chromadb
+    from chromadb.config import Settings
+except ImportError:
+    chromadb = None
+
 logger = logging.getLogger(__name__)
 
+BM25_INDEX_FILE = "bm25_index.npz"
+HNSW_PARAMS_FILE = "hnsw_params.json"  # scripts/tune_hnsw.py 记录的调优结果
+
+def resolve_hnsw_params(db_path: Path) -> Dict[str, int]:
+    """
+    确定建立集合时使用的HNSW参数
+
+    优先级：环境变量 > 向量库目录中记录的调优结果 > rag-index/config.yaml > Chroma默认值
+
+    Args:
+        db_path: 向量库目录
+
+    Returns:
+        {'M': ..., 'construction_ef': ..., 'search_ef': ...}
+    """
+    params = dict(HNSW_PARAMS)
+    params_file = db_path / HNSW_PARAMS_FILE
+    if params_file.exists():
+        try:
+            with open(params_file, 'r', encoding='utf-8') as f:
+                chosen = json.load(f)['chosen']
+            params.update({key: int(chosen[key]) for key in params if key in chosen})
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"HNSW调优记录读取失败 {params_file}: {e}")
+    params.update(HNSW_ENV_OVERRIDES)
+    return params
+
+def hnsw_metadata(params: Dict[str, int]) -> Dict[str, Any]:
+    """HNSW参数 → Chroma集合元数据"""
+    return {"hnsw:space": "cosine", **{f"hnsw:{key}": value for key, value in params.items()}}
+
 class VectorStore:
     """向量数据库封装类"""
     
     def __init__(
         self,
         db_path: Path,
-        collection_name: str = "wendao_knowledge_base"
+        collection_name: str = "wendao_knowledge_base",
+        sparse_index: bool = BM25_ENABLED,
+        backend: str = VECTOR_DB_TYPE,
+        read_only: bool = VECTOR_DB_READ_ONLY
     ):
         """
         初始化向量数据库
@@ -25,32 +72,71 @@ class VectorStore:
         Args:
             db_path: 数据库存储路径
             collection_name: 集合名称
+            sparse_index: 是否同步维护BM25稀疏索引
+            backend: 向量库后端（"chroma" 或 "numpy"）
+            read_only: 只读模式（仅numpy后端：mmap映射索引文件，多个工作进程共享内存）
         """
         self.db_path = db_path
         self.collection_name = collection_name
+        self.backend = backend
+        self.read_only = read_only
+        self.sparse_index = sparse_index
+        self._bm25: Optional[BM25Index] = None  # 首次使用时加载
+        self._bm25_checked = 0.0  # 检索路径上次检查索引文件的时间
+        self._bm25_warned = False
+        self._search_warned = False
         
         # 确保目录存在
         db_path.mkdir(parents=True, exist_ok=True)
         
-        logger.info(f"初始化向量数据库: {db_path}")
+        logger.info(f"初始化向量数据库: {db_path}（后端: {backend}）")
         
         try:
-            self.client = chromadb.PersistentClient(
-                path=str(db_path),
-                settings=Settings(anonymized_telemetry=False)
-            )
+            if backend == "numpy":
+                self.client = NumpyClient(db_path, read_only=read_only)
+            elif backend == "chroma":
+                if chromadb is None:
+                    raise ImportError("未安装chromadb，请安装或设置 VECTOR_DB_TYPE=numpy")
+                if read_only:
+                    logger.warning("Chroma后端不支持只读模式，忽略 read_only")
+                self.client = chromadb.PersistentClient(
+                    path=str(db_path),
+                    settings=Settings(anonymized_telemetry=False)
+                )
+            else:
+                raise ValueError(f"不支持的向量库后端: {backend}")
             
             # 获取或创建集合
-            self.collection = self.client.get_or_create_collection(
-                name=collection_name,
-                metadata={"hnsw:space": "cosine"}  # 使用余弦相似度
-            )
+            self.hnsw_params = resolve_hnsw_params(db_path)
+            self.collection = self._open_collection()
             
             logger.info(f"向量数据库初始化成功，集合: {collection_name}")
         except Exception as e:
             logger.error(f"向量数据库初始化失败: {e}")
             raise
     
+    def _open_collection(self):
+        """打开集合，不存在时按当前HNSW参数建立（余弦相似度）"""
+        if self.backend != "chroma":
+            return self.client.get_or_create_collection(name=self.collection_name, metadata={"hnsw:space": "cosine"})
+        
+        metadata = hnsw_metadata(self.hnsw_params)
+        try:
+            collection = self.client.get_collection(name=self.collection_name)
+        except ValueError:
+            # 集合不存在
+            return self.client.create_collection(name=self.collection_name, metadata=metadata)
+        
+        # 已有集合的HNSW图按建立时的参数构建，不覆盖其元数据，只提示差异
+        current = collection.metadata or {}
+        changed = {
+            key: (current.get(key), value) for key, value in metadata.items()
+            if key != "hnsw:space" and current.get(key, value) != value
+        }
+        if changed:
+            logger.info(f"HNSW参数与现有集合不同 {changed}（现有值 → 配置值），使用 build_index.py --reset 重建后生效")
+        return collection
+    
     def add_documents(
         self,
         chunks: List[Dict],
@@ -70,37 +156,11 @@ class VectorStore:
         
         # 生成ID（如果未提供）
         if ids is None:
-            ids = [
-                f"{chunk['doc_id']}_{chunk['chunk_type']}_{chunk.get('chunk_index', chunk.get('pattern_index', chunk.get('example_index', 0)))}"
-                for chunk in chunks
-            ]
-        
-        metadatas = []
-        documents = []
-        
-        for chunk in chunks:
-            # 构建metadata
-            metadata = {
-                'doc_id': chunk['doc_id'],
-                'chunk_type': chunk['chunk_type'],
-                'weight': str(chunk.get('weight', 1.0))  # Chroma需要字符串
-            }
-            
-            # 添加chunk的metadata
-            if 'metadata' in chunk:
-                for k, v in chunk['metadata'].items():
-                    metadata[k] = str(v) if v is not None else ""
-            
-            # 添加索引信息
-            if 'chunk_index' in chunk:
-                metadata['chunk_index'] = str(chunk['chunk_index'])
-            if 'pattern_index' in chunk:
-                metadata['pattern_index'] = str(chunk['pattern_index'])
-            if 'example_index' in chunk:
-                metadata['example_index'] = str(chunk['example_index'])
-            
-            metadatas.append(metadata)
-            documents.append(chunk['content'])
+            ids = [get_chunk_id(chunk) for chunk in chunks]
+        
+        metadatas = [self.build_metadata(chunk) for chunk in chunks]
+        documents = [chunk['content'] for chunk in chunks]
+        bm25 = self._writable_bm25()  # 先加载（与写入前的向量库对比是否一致）
         
         try:
             self.collection.add(
@@ -109,11 +169,133 @@ class VectorStore:
                 metadatas=metadatas,
                 ids=ids
             )
+            if bm25 is not None:
+                bm25.upsert(ids, documents, metadatas)
             logger.info(f"成功添加 {len(chunks)} 个文档块到向量数据库")
         except Exception as e:
             logger.error(f"添加文档块失败: {e}")
             raise
     
+    def upsert_documents(
+        self,
+        chunks: List[Dict],
+        embeddings: List[List[float]],
+        ids: Optional[List[str]] = None
+    ):
+        """
+        写入或覆盖文档块（ID已存在时更新内容、向量和元数据）
+        
+        Args:
+            chunks: 文档块列表（包含content和metadata）
+            embeddings: 向量列表
+            ids: 文档块ID列表（可选，自动生成）
+        """
+        if len(chunks) != len(embeddings):
+            raise ValueError("chunks和embeddings数量不匹配")
+        
+        if ids is None:
+            ids = [get_chunk_id(chunk) for chunk in chunks]
+        
+        documents = [chunk['content'] for chunk in chunks]
+        metadatas = [self.build_metadata(chunk) for chunk in chunks]
+        bm25 = self._writable_bm25()  # 先加载（与写入前的向量库对比是否一致）
+        
+        try:
+            self.collection.upsert(
+                embeddings=embeddings,
+                documents=documents,
+                metadatas=metadatas,
+                ids=ids
+            )
+            if bm25 is not None:
+                bm25.upsert(ids, documents, metadatas)
+            logger.info(f"成功写入 {len(chunks)} 个文档块到向量数据库")
+        except Exception as e:
+            logger.error(f"写入文档块失败: {e}")
+            raise
+    
+    @staticmethod
+    def build_metadata(chunk: Dict) -> Dict[str, str]:
+        """
+        构建文档块在向量数据库中的metadata
+        
+        Args:
+            chunk: 文档块字典
+            
+        Returns:
+            metadata字典（值均为字符串）
+        """
+        metadata = {
+            'doc_id': chunk['doc_id'],
+            'chunk_type': chunk['chunk_type'],
+            'weight': str(chunk.get('weight', 1.0))  # Chroma需要字符串
+        }
+        
+        # 添加chunk的metadata
+        if 'metadata' in chunk:
+            for k, v in chunk['metadata'].items():
+                metadata[k] = str(v) if v is not None else ""
+        
+        # 添加索引信息
+        if 'chunk_index' in chunk:
+            metadata['chunk_index'] = str(chunk['chunk_index'])
+        if 'pattern_index' in chunk:
+            metadata['pattern_index'] = str(chunk['pattern_index'])
+        if 'example_index' in chunk:
+            metadata['example_index'] = str(chunk['example_index'])
+        
+        return metadata
+    
+    def get_doc_chunks(self, doc_id: str) -> Dict[str, Dict]:
+        """
+        获取某个文档当前在库中的所有块
+        
+        Args:
+            doc_id: 文档ID
+            
+        Returns:
+            {chunk_id: {'content': 文本, 'metadata': 元数据}}
+        """
+        results = self.collection.get(
+            where={'doc_id': doc_id},
+            include=['documents', 'metadatas']
+        )
+        return {
+            chunk_id: {'content': document, 'metadata': metadata}
+            for chunk_id, document, metadata in zip(
+                results['ids'], results['documents'], results['metadatas']
+            )
+        }
+    
+    def delete_chunks(self, ids: List[str]):
+        """
+        按ID删除文档块
+        
+        Args:
+            ids: 文档块ID列表
+        """
+        if not ids:
+            return
+        bm25 = self._writable_bm25()
+        self.collection.delete(ids=ids)
+        if bm25 is not None:
+            bm25.delete(ids)
+        logger.info(f"已删除 {len(ids)} 个文档块")
+    
+    def delete_document(self, doc_id: str) -> int:
+        """
+        删除某个文档的所有块
+        
+        Args:
+            doc_id: 文档ID
+            
+        Returns:
+            删除的块数量
+        """
+        ids = list(self.get_doc_chunks(doc_id).keys())
+        self.delete_chunks(ids)
+        return len(ids)
+    
     def search(
         self,
         query_embedding: List[float],
@@ -133,6 +315,7 @@ class VectorStore:
         Returns:
             检索结果字典，包含ids、documents、metadatas、distances
         """
+        self._check_search_mode()
         try:
             results = self.collection.query(
                 query_embeddings=[query_embedding],
@@ -145,13 +328,199 @@ class VectorStore:
             logger.error(f"向量检索失败: {e}")
             raise
     
+    def _check_search_mode(self):
+        """可写的numpy集合提供检索时提示一次（每个进程各复制一份全部向量，检索服务应使用只读模式）"""
+        if self.defers_writes and not self._search_warned:
+            self._search_warned = True
+            logger.warning(
+                "NumPy向量库以可写模式提供检索：本进程在内存中复制了全部向量，"
+                "检索/问答进程请使用只读模式（read_only=True 或 VECTOR_DB_READ_ONLY=true）"
+            )
+    
+    def search_many(
+        self,
+        query_embeddings: List[List[float]],
+        n_results: int = 5,
+        where: Optional[Dict[str, Any]] = None,
+        where_document: Optional[Dict[str, Any]] = None
+    ) -> Dict:
+        """
+        多查询向量检索（一次调用检索多个查询向量）
+        
+        Args:
+            query_embeddings: 查询向量列表
+            n_results: 每个查询返回的结果数量
+            where: 元数据过滤条件（对所有查询生效）
+            where_document: 文档内容过滤条件
+            
+        Returns:
+            检索结果字典，ids、documents、metadatas、distances 均为与查询一一对应的列表
+        """
+        if not query_embeddings:
+            return {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        self._check_search_mode()
+        try:
+            return self.collection.query(
+                query_embeddings=query_embeddings,
+                n_results=n_results,
+                where=where,
+                where_document=where_document
+            )
+        except Exception as e:
+            logger.error(f"向量检索失败: {e}")
+            raise
+    
+    def search_sparse(
+        self,
+        query: str,
+        n_results: int = 5,
+        where: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict]:
+        """
+        BM25关键词检索
+        
+        Args:
+            query: 查询文本
+            n_results: 返回结果数量
+            where: 元数据过滤条件（layer/doc_type）
+            
+        Returns:
+            与 search 相同格式的结果字典（distances 换成 scores，为BM25分数）；未启用稀疏索引时返回None
+        """
+        if self.bm25 is None:
+            return None
+        hits = self.bm25.search(query, n_results=n_results, where=where)
+        ids = [chunk_id for chunk_id, _ in hits]
+        stored = self.collection.get(ids=ids, include=['documents', 'metadatas']) if ids else {'ids': []}
+        found = {
+            chunk_id: (document, metadata)
+            for chunk_id, document, metadata in zip(
+                stored['ids'], stored.get('documents') or [], stored.get('metadatas') or []
+            )
+        }
+        hits = [(chunk_id, score) for chunk_id, score in hits if chunk_id in found]
+        return {
+            'ids': [[chunk_id for chunk_id, _ in hits]],
+            'documents': [[found[chunk_id][0] for chunk_id, _ in hits]],
+            'metadatas': [[found[chunk_id][1] for chunk_id, _ in hits]],
+            'scores': [[score for _, score in hits]]
+        }
+    
+    @property
+    def bm25(self) -> Optional[BM25Index]:
+        """
+        检索使用的BM25稀疏索引（未启用或索引文件不存在时为None）
+        
+        只读取、不重建也不保存：每隔 BM25_CHECK_INTERVAL 秒检查索引文件，
+        被构建/更新进程重新保存后自动重新加载；本进程有未保存的写入时直接使用内存中的索引
+        """
+        if not self.sparse_index:
+            return None
+        index = self._bm25
+        if index is not None and index.dirty:
+            return index
+        now = time.monotonic()
+        if index is not None and now - self._bm25_checked < BM25_CHECK_INTERVAL:
+            return index
+        self._bm25_checked = now
+        if index is not None and not index.file_changed():
+            return index
+        
+        reloaded = BM25Index(self.db_path / BM25_INDEX_FILE)
+        if not reloaded.load():
+            if not self._bm25_warned:
+                logger.warning("BM25索引文件不存在或无法读取，暂时只使用向量检索（运行 build_index.py 或 update_index.py 生成）")
+                self._bm25_warned = True
+            return index
+        count = self.collection.count()
+        if reloaded.needs_rebuild or len(reloaded) != count:
+            # 构建/更新进程写入中途，或上次写入被中断；由写入进程负责重建
+            logger.warning(f"BM25索引（{len(reloaded)} 个块）与向量库（{count} 个块）不一致，等待写入进程更新")
+        else:
+            logger.info(f"BM25索引{'已重新' if index is not None else ''}加载: {len(reloaded)} 个块")
+        self._bm25_warned = False
+        self._bm25 = reloaded
+        return reloaded
+    
+    def _writable_bm25(self) -> Optional[BM25Index]:
+        """写入路径使用的BM25索引：未加载、文件已被其他进程更新或与向量库不一致时重新加载/重建"""
+        if not self.sparse_index:
+            return None
+        index = self._bm25
+        if index is not None and (index.dirty or not index.file_changed()):
+            return index
+        index = BM25Index(self.db_path / BM25_INDEX_FILE)
+        loaded = index.load()
+        if not loaded or index.needs_rebuild or len(index) != self.collection.count():
+            logger.info("BM25索引不存在或与向量库不一致")
+            self._rebuild_bm25(index)
+        else:
+            logger.info(f"BM25索引加载成功: {len(index)} 个块")
+        self._bm25 = index
+        return index
+    
+    def rebuild_sparse_index(self):
+        """从向量库中已存的块重建并保存BM25索引"""
+        if not self.sparse_index:
+            return
+        index = BM25Index(self.db_path / BM25_INDEX_FILE)
+        self._rebuild_bm25(index)
+        self._bm25 = index
+    
+    def _rebuild_bm25(self, index: BM25Index, page_size: int = 1000):
+        """从向量库中已存的块重建BM25索引"""
+        logger.info("从向量库重建BM25索引...")
+        index.clear()
+        for page in self.iter_chunks(page_size):
+            index.upsert(page['ids'], page['documents'], page['metadatas'])
+        index.save()
+    
+    def iter_chunks(self, page_size: int = 1000) -> Iterator[Dict]:
+        """
+        分页遍历向量库中的所有块
+        
+        Args:
+            page_size: 每页块数
+            
+        Yields:
+            {'ids': [...], 'documents': [...], 'metadatas': [...]}
+        """
+        offset = 0
+        while True:
+            page = self.collection.get(include=['documents', 'metadatas'], limit=page_size, offset=offset)
+            if not page['ids']:
+                break
+            yield page
+            offset += len(page['ids'])
+    
+    @property
+    def defers_writes(self) -> bool:
+        """写入是否要到 flush() 才落盘（numpy后端），此时调用方应在 flush() 之后再记录写入已完成"""
+        return self.backend == "numpy" and not self.read_only
+    
+    def flush(self):
+        """
+        持久化批量写入（写入结束后调用）
+        
+        numpy后端的写入在此时才落盘为新的一代；BM25索引中途中断时下次加载会自动重建
+        """
+        if self.defers_writes:
+            self.collection.persist()
+        if self._bm25 is not None and self._bm25.dirty:
+            self._bm25.save()
+    
     def get_collection_info(self) -> Dict:
         """获取集合信息"""
         count = self.collection.count()
         return {
             'collection_name': self.collection_name,
             'document_count': count,
-            'db_path': str(self.db_path)
+            'db_path': str(self.db_path),
+            'backend': self.backend,
+            'hnsw': {
+                key.split(':', 1)[1]: value for key, value in (self.collection.metadata or {}).items()
+                if key.startswith('hnsw:')
+            } if self.backend == "chroma" else None
         }
     
     def delete_collection(self):
@@ -162,8 +531,10 @@ class VectorStore:
     def reset_collection(self):
         """重置集合（删除所有数据）"""
         self.delete_collection()
-        self.collection = self.client.get_or_create_collection(
-            name=self.collection_name,
-            metadata={"hnsw:space": "cosine"}
-        )
+        self.hnsw_params = resolve_hnsw_params(self.db_path)
+        self.collection = self._open_collection()
+        if self.sparse_index:
+            self._bm25 = BM25Index(self.db_path / BM25_INDEX_FILE)
+            self._bm25.clear()
+            self._bm25.save()
         logger.info(f"集合已重置: {self.collection_name}")
@@ -0,0 +1,207 @@
+"""
+Embedding吞吐基准测试
+用知识库的真实分块对比 固定条数分批 与 按token长度分桶+token预算组批 的向量化速度，
+并检查两种方式得到的向量顺序与数值一致
+
+用法：
+    python scripts/benchmark_embedding.py                     # 使用全部文档的分块
+    python scripts/benchmark_embedding.py --limit 500         # 只取前500个块
+    python scripts/benchmark_embedding.py --token-budget 8192
+    python scripts/benchmark_embedding.py --query-threads 16     # 并发查询：逐条推理 vs 合批推理
+"""
+
+import sys
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# 处理 rag-system 目录的导入（目录名包含连字符，不能直接导入）
+import importlib.util
+rag_system_path = project_root / "rag-system"
+rag_system_init = rag_system_path / "__init__.py"
+if rag_system_init.exists():
+    spec = importlib.util.spec_from_file_location("rag_system", rag_system_init)
+    rag_system_module = importlib.util.module_from_spec(spec)
+    sys.modules["rag_system"] = rag_system_module
+    spec.loader.exec_module(rag_system_module)
+    # 导入子模块
+    for module_file in ["config", "embedding_cache", "lru_cache", "onnx_backend", "micro_batcher", "embedding_server", "m3_vectors", "embedding", "pattern_matcher", "index_catalog", "document_loader"]:
+        module_path = rag_system_path / f"{module_file}.py"
+        if module_path.exists():
+            spec = importlib.util.spec_from_file_location(f"rag_system.{module_file}", module_path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[f"rag_system.{module_file}"] = module
+            spec.loader.exec_module(module)
+
+from rag_system.config import (
+    EMBEDDING_MODEL, EMBEDDING_DEVICE, EMBEDDING_BATCH_SIZE,
+    EMBEDDING_TOKEN_BUDGET, DOC_MAPPING, QUERY_BATCH_WAIT_MS, QUERY_BATCH_MAX
+)
+from rag_system.embedding import EmbeddingModel
+from rag_system.document_loader import DocumentLoader
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def load_chunk_texts(limit: int = 0) -> List[str]:
+    """加载所有文档的分块文本"""
+    loader = DocumentLoader()
+    texts = []
+    for doc_id in DOC_MAPPING:
+        try:
+            doc = loader.load_document(doc_id)
+        except Exception as e:
+            logger.warning(f"跳过文档 {doc_id}: {e}")
+            continue
+        texts.extend(chunk['content'] for chunk in loader.chunk_document(doc))
+        if limit and len(texts) >= limit:
+            return texts[:limit]
+    return texts
+
+def run_benchmark(
+    limit: int = 0,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    token_budget: int = EMBEDDING_TOKEN_BUDGET,
+    repeat: int = 1
+):
+    """
+    对比两种组批方式的吞吐
+
+    Args:
+        limit: 最多使用的块数（0表示全部）
+        batch_size: 固定分批的条数
+        token_budget: 分桶组批的token预算
+        repeat: 每种方式重复次数（取最快一次）
+    """
+    texts = load_chunk_texts(limit)
+    logger.info(f"共 {len(texts)} 个块，平均 {sum(map(len, texts)) / max(len(texts), 1):.0f} 字符")
+
+    # 不使用缓存，保证每次都真正经过模型
+    model = EmbeddingModel(EMBEDDING_MODEL, EMBEDDING_DEVICE, cache=None, token_budget=token_budget)
+    model.encode(texts[:8], show_progress_bar=False)  # 预热
+
+    def timed(budget: int):
+        model.token_budget = budget
+        best, embeddings = float('inf'), None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            embeddings = model.encode(texts, show_progress_bar=False, batch_size=batch_size)
+            best = min(best, time.perf_counter() - started)
+        return best, embeddings
+
+    fixed_time, fixed_embeddings = timed(0)
+    model.batch_stats = {'batches': 0, 'texts': 0, 'tokens': 0, 'padded_tokens': 0}
+    bucketed_time, bucketed_embeddings = timed(token_budget)
+    stats = model.get_batch_stats()
+
+    max_diff = max(
+        (abs(a - b) for u, v in zip(fixed_embeddings, bucketed_embeddings) for a, b in zip(u, v)),
+        default=0.0
+    )
+
+    logger.info("=" * 60)
+    logger.info(f"固定分批（每批 {batch_size} 条）: {fixed_time:.2f}s，{len(texts) / fixed_time:.1f} 块/秒")
+    logger.info(
+        f"分桶组批（预算 {token_budget} token）: {bucketed_time:.2f}s，{len(texts) / bucketed_time:.1f} 块/秒"
+        f"（{stats['batches'] // repeat} 批，padding效率 {stats['padding_efficiency']:.1%}）"
+    )
+    logger.info(f"加速比: {fixed_time / bucketed_time:.2f}x，向量最大偏差: {max_diff:.2e}")
+    logger.info("=" * 60)
+
+def run_query_benchmark(
+    threads: int,
+    n_queries: int = 512,
+    max_wait_ms: float = QUERY_BATCH_WAIT_MS,
+    max_batch: int = QUERY_BATCH_MAX
+):
+    """
+    模拟并发查询：多个线程同时调用 encode_query，对比逐条推理与合批推理的吞吐和单次延迟
+
+    Args:
+        threads: 并发线程数
+        n_queries: 查询条数（取各块开头的文字，互不重复）
+        max_wait_ms: 合批窗口（毫秒）
+        max_batch: 每批最多查询数
+    """
+    queries = list(dict.fromkeys(text[:40] for text in load_chunk_texts(n_queries * 2)))[:n_queries]
+    logger.info(f"共 {len(queries)} 个查询，{threads} 个线程并发")
+
+    # 关闭查询缓存，保证每次都真正经过模型
+    model = EmbeddingModel(EMBEDDING_MODEL, EMBEDDING_DEVICE, cache=None, query_cache_size=0)
+    model.encode_queries(queries[:8])  # 预热
+
+    def timed():
+        latencies = []
+
+        def worker(query: str):
+            started = time.perf_counter()
+            model.encode_query(query)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(worker, queries))
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return len(queries) / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99) - 1]
+
+    single_qps, single_p50, single_p99 = timed()
+    model.enable_query_batching(max_wait_ms, max_batch)
+    batched_qps, batched_p50, batched_p99 = timed()
+    stats = model.get_query_batch_stats()
+
+    logger.info("=" * 60)
+    logger.info(f"逐条推理: {single_qps:.1f} 查询/秒，p50 {single_p50:.1f} ms，p99 {single_p99:.1f} ms")
+    logger.info(
+        f"合批推理（窗口 {max_wait_ms} ms，每批最多 {max_batch} 条）: {batched_qps:.1f} 查询/秒，"
+        f"p50 {batched_p50:.1f} ms，p99 {batched_p99:.1f} ms（平均每批 {stats['avg_batch']:.1f} 条，"
+        f"平均等待 {stats['avg_queue_ms']:.2f} ms）"
+    )
+    logger.info(f"吞吐提升: {batched_qps / single_qps:.2f}x")
+    logger.info("=" * 60)
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Embedding组批方式吞吐对比")
+    parser.add_argument("--limit", type=int, default=0, help="最多使用的块数（默认全部）")
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE, help="固定分批的条数")
+    parser.add_argument("--token-budget", type=int, default=EMBEDDING_TOKEN_BUDGET, help="分桶组批的token预算")
+    parser.add_argument("--repeat", type=int, default=1, help="每种方式重复次数（取最快一次）")
+    parser.add_argument("--query-threads", type=int, default=0, help="并发查询线程数（指定后改为测试查询合批）")
+    parser.add_argument("--batch-wait-ms", type=float, default=QUERY_BATCH_WAIT_MS, help="查询合批窗口（毫秒）")
+    parser.add_argument("--max-batch", type=int, default=QUERY_BATCH_MAX, help="查询合批每批最多条数")
+
+    args = parser.parse_args()
+
+    if args.token_budget <= 0:
+        parser.error("--token-budget 必须大于0")
+
+    if args.query_threads > 0:
+        run_query_benchmark(
+            threads=args.query_threads,
+            max_wait_ms=args.batch_wait_ms,
+            max_batch=args.max_batch
+        )
+        return
+
+    run_benchmark(
+        limit=args.limit,
+        batch_size=args.batch_size,
+        token_budget=args.token_budget,
+        repeat=args.repeat
+    )
+
+if __name__ == "__main__":
+    main()
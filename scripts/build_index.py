@@ -1,11 +1,20 @@
 """
 构建向量索引脚本
 批量加载85篇核心文档，进行分块、向量化，存储到向量数据库
+
+文档以有界流水线的方式流过 加载/分块 → 向量化 → 写入 三个阶段，边处理边写入，
+各阶段缓冲区受 --max-memory-mb 限制，内存占用与语料规模无关。
+已提交的批次和文档记录在构建日志中，中断后可用 --resume 从断点继续
 """
 
 import sys
+import queue
 import logging
+import threading
+from array import array
 from pathlib import Path
+from typing import List, Dict, Optional, Set, Tuple, Iterator
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
 from tqdm import tqdm
 
 # 添加项目根目录到路径
@@ -22,7 +31,7 @@ if rag_system_init.exists():
     sys.modules["rag_system"] = rag_system_module
     spec.loader.exec_module(rag_system_module)
     # 导入子模块
-    for module_file in ["config", "embedding", "document_loader", "vector_store"]:
+    for module_file in ["config", "embedding_cache", "lru_cache", "onnx_backend", "micro_batcher", "embedding_server", "m3_vectors", "embedding", "pattern_matcher", "index_catalog", "document_loader", "bm25_index", "numpy_store", "vector_store", "result_cache", "indexer"]:
         module_path = rag_system_path / f"{module_file}.py"
         if module_path.exists():
             spec = importlib.util.spec_from_file_location(f"rag_system.{module_file}", module_path)
@@ -33,11 +42,15 @@ if rag_system_init.exists():
 from rag_system.config import (
     INDEX_DIR, VECTOR_DB_DIR, COLLECTION_NAME,
     EMBEDDING_MODEL, EMBEDDING_DEVICE,
+    EMBEDDING_BATCH_SIZE, BUILD_WORKERS, EMBEDDING_CACHE_ENABLED,
+    BUILD_MAX_MEMORY_MB, WRITE_BATCH_MB,
     DOC_MAPPING
 )
-from rag_system.embedding import EmbeddingModel
-from rag_system.document_loader import DocumentLoader
+from rag_system.embedding import EmbeddingModel, create_embedding_model
+from rag_system.document_loader import DocumentLoader, get_chunk_id
 from rag_system.vector_store import VectorStore
+from rag_system.indexer import IndexManifest, BuildJournal
+from rag_system.result_cache import bump_index_version
 
 # 配置日志
 logging.basicConfig(
@@ -46,98 +59,516 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def build_index(reset: bool = False):
+# 每个块除正文和向量外的固定开销估计（chunk字典、metadata、ID等Python对象）
+_CHUNK_OVERHEAD_BYTES = 1024
+
+# (doc_id, 文件状态, 分块结果, 错误信息)，失败时分块结果为None
+DocResult = Tuple[str, Dict, Optional[List[Dict]], Optional[str]]
+
+def estimate_chunk_bytes(chunk: Dict, dimension: int = 0) -> int:
+    """
+    估算一个块在流水线中占用的内存
+    
+    Args:
+        chunk: 文档块
+        dimension: 向量维度（尚未向量化时为0），向量按float32数组计
+    
+    Returns:
+        估算的字节数
+    """
+    return len(chunk['content'].encode('utf-8')) + 4 * dimension + _CHUNK_OVERHEAD_BYTES
+
+# ---------------------------------------------------------------------------
+# 阶段1：加载/分块
+#   workers=0 时在主进程中逐个生成；workers>0 时用进程池并行，
+#   但同时在途的文档数有上限，不会一次性把所有文档的分块结果堆在内存里
+# ---------------------------------------------------------------------------
+
+# 子进程内的文档加载器（由 _init_worker 初始化，每个进程一份）
+_worker_loader: Optional[DocumentLoader] = None
+
+def _init_worker():
+    """子进程初始化：创建文档加载器"""
+    global _worker_loader
+    _worker_loader = DocumentLoader()
+
+def _load_and_chunk(doc_id: str):
+    """
+    子进程任务：加载并分块单个文档
+    
+    Returns:
+        (doc_id, chunks, error) 三元组，失败时chunks为None
+    """
+    try:
+        doc = _worker_loader.load_document(doc_id)
+        chunks = _worker_loader.chunk_document(doc)
+        return doc_id, chunks, None
+    except Exception as e:
+        return doc_id, None, str(e)
+
+def iter_documents(
+    doc_ids: List[str],
+    manifest: IndexManifest,
+    workers: int = 0,
+    max_in_flight: Optional[int] = None
+) -> Iterator[DocResult]:
+    """
+    逐个生成文档的分块结果
+    
+    Args:
+        doc_ids: 待处理的文档ID列表
+        manifest: 索引清单（用于在加载前记录文件状态）
+        workers: 加载/分块的进程数，0表示在当前进程中处理
+        max_in_flight: 进程池中同时在途的文档数上限（默认 workers*2）
+    
+    Yields:
+        (doc_id, state, chunks, error)
+    """
+    if workers <= 0:
+        loader = DocumentLoader()
+        for doc_id in doc_ids:
+            state = manifest.current_state(doc_id)
+            try:
+                doc = loader.load_document(doc_id)
+                yield doc_id, state, loader.chunk_document(doc), None
+            except Exception as e:
+                yield doc_id, state, None, str(e)
+        return
+    
+    max_in_flight = max_in_flight or workers * 2
+    remaining = iter(doc_ids)
+    in_flight: Dict[Future, Dict] = {}
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        def submit_next() -> bool:
+            doc_id = next(remaining, None)
+            if doc_id is None:
+                return False
+            # 先记录文件状态（供增量更新判断是否变化），再交给子进程加载
+            state = manifest.current_state(doc_id)
+            in_flight[executor.submit(_load_and_chunk, doc_id)] = state
+            return True
+        
+        while len(in_flight) < max_in_flight and submit_next():
+            pass
+        
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                state = in_flight.pop(future)
+                doc_id, chunks, error = future.result()
+                submit_next()
+                yield doc_id, state, chunks, error
+
+# ---------------------------------------------------------------------------
+# 阶段2：跨文档凑批向量化
+# ---------------------------------------------------------------------------
+
+def iter_embedded_batches(
+    documents: Iterator[DocResult],
+    embedding_model: EmbeddingModel,
+    tracker: "_DocTracker",
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    max_pending_bytes: int = 64 * 1024 * 1024,
+    skip_chunk_ids: Optional[Set[str]] = None
+) -> Iterator[Tuple[List[Dict], List[array]]]:
+    """
+    把多个文档的块凑成满批次后向量化
+    
+    Args:
+        documents: iter_documents 生成的分块结果
+        embedding_model: Embedding模型实例
+        tracker: 文档完成情况跟踪器（登记每个文档的块）
+        batch_size: 每个Embedding批次的块数
+        max_pending_bytes: 待向量化块的内存上限，超过时不足一个批次也立即向量化
+        skip_chunk_ids: 已提交过的块ID（断点续建时跳过，不再重复向量化）
+    
+    Yields:
+        (chunks, embeddings)，向量以float32数组保存以减少内存占用
+    """
+    pending: List[Dict] = []
+    pending_bytes = 0
+    
+    def embed(batch: List[Dict]) -> Tuple[List[Dict], List[array]]:
+        embeddings = embedding_model.encode_batch(
+            [chunk['content'] for chunk in batch],
+            batch_size=batch_size,
+            show_progress_bar=False
+        )
+        return batch, [array('f', embedding) for embedding in embeddings]
+    
+    for doc_id, state, chunks, error in documents:
+        if error is not None:
+            logger.error(f"❌ 处理文档 {doc_id} 失败: {error}")
+            tracker.fail(doc_id)
+            continue
+        
+        chunk_ids = [get_chunk_id(chunk) for chunk in chunks]
+        if skip_chunk_ids:
+            chunks = [chunk for chunk, chunk_id in zip(chunks, chunk_ids) if chunk_id not in skip_chunk_ids]
+        tracker.add(doc_id, chunk_ids, state, pending=len(chunks))
+        pending.extend(chunks)
+        pending_bytes += sum(estimate_chunk_bytes(chunk) for chunk in chunks)
+        logger.debug(f"✅ {doc_id} 分块完成: {len(chunk_ids)} 个块，待写入 {len(chunks)} 个")
+        
+        while pending and (len(pending) >= batch_size or pending_bytes >= max_pending_bytes):
+            batch, pending = pending[:batch_size], pending[batch_size:]
+            pending_bytes -= sum(estimate_chunk_bytes(chunk) for chunk in batch)
+            yield embed(batch)
+    
+    # 剩余不足一个批次的块
+    if pending:
+        yield embed(pending)
+
+# ---------------------------------------------------------------------------
+# 阶段3：按字节大小攒批写入向量数据库
+# ---------------------------------------------------------------------------
+
+class _DocTracker:
+    """
+    跟踪每个文档的块是否已全部写入
+
+    每个批次写入成功后记录到构建日志；文档的最后一个块写入成功后立即记录到
+    构建日志和索引清单，构建中途失败时已完成的文档不会丢失
+    """
+    
+    def __init__(self, manifest: IndexManifest, journal: BuildJournal):
+        self.manifest = manifest
+        self.journal = journal
+        self._lock = threading.Lock()
+        self._remaining: Dict[str, int] = {}
+        self._chunk_ids: Dict[str, List[str]] = {}
+        self._states: Dict[str, Dict] = {}
+        self.completed: List[str] = []
+        self.failed: Set[str] = set()
+    
+    def add(self, doc_id: str, chunk_ids: List[str], state: Dict, pending: Optional[int] = None):
+        """
+        登记一个已分块的文档
+        
+        Args:
+            doc_id: 文档ID
+            chunk_ids: 文档的全部块ID
+            state: 加载前记录的文件状态
+            pending: 还需要写入的块数（默认为全部块，断点续建时扣除已提交的块）
+        """
+        with self._lock:
+            self._remaining[doc_id] = len(chunk_ids) if pending is None else pending
+            self._chunk_ids[doc_id] = chunk_ids
+            self._states[doc_id] = state
+            if self._remaining[doc_id] == 0:
+                self._complete([doc_id])
+    
+    def fail(self, doc_id: str):
+        """标记文档处理失败（不记录到清单，下次 update_index.py --changed 会重试）"""
+        with self._lock:
+            self.failed.add(doc_id)
+    
+    def written(self, chunks: List[Dict], ok: bool):
+        """写入线程回调：一批块写入成功或失败"""
+        with self._lock:
+            if ok:
+                doc_states = {
+                    chunk['doc_id']: BuildJournal.state_key(self._states[chunk['doc_id']])
+                    for chunk in chunks
+                }
+                self.journal.commit_batch([get_chunk_id(chunk) for chunk in chunks], doc_states)
+            finished = []
+            for chunk in chunks:
+                doc_id = chunk['doc_id']
+                if not ok:
+                    self.failed.add(doc_id)
+                self._remaining[doc_id] -= 1
+                if self._remaining[doc_id] == 0:
+                    finished.append(doc_id)
+            self._complete([doc_id for doc_id in finished if doc_id not in self.failed])
+    
+    def _complete(self, doc_ids: List[str]):
+        if not doc_ids:
+            return
+        for doc_id in doc_ids:
+            self.manifest.record(doc_id, self._chunk_ids.pop(doc_id), self._states.pop(doc_id))
+            self.journal.commit_document(doc_id)
+            self._remaining.pop(doc_id, None)
+            self.completed.append(doc_id)
+        self.manifest.save()
+
+class _VectorStoreWriter(threading.Thread):
+    """
+    写入线程：把已向量化的块攒成约 write_batch_bytes 大小的批次写入向量数据库
+
+    队列和攒批缓冲区共用 max_buffer_bytes 的内存预算，预算用尽时 put() 阻塞，
+    对向量化阶段形成背压
+
+    写入要到 flush() 才落盘的后端（numpy）：已写入的批次先不记录到构建日志，
+    未落盘的块数达到已落盘块数（至少 checkpoint_rows）时落盘一次再记录，
+    落盘的总写出量与块数成线性关系，中断后 --resume 也不会跳过未落盘的块
+    """
+    
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        tracker: _DocTracker,
+        max_buffer_bytes: int,
+        write_batch_bytes: int,
+        checkpoint_rows: int = 4096
+    ):
+        """
+        Args:
+            vector_store: 向量数据库实例
+            tracker: 文档完成情况跟踪器
+            max_buffer_bytes: 等待写入的块的内存上限
+            write_batch_bytes: 每次写入的批次大小（字节）
+            checkpoint_rows: 写入延迟落盘时，两次落盘之间的最少块数
+        """
+        super().__init__(name="vector-store-writer", daemon=True)
+        self.vector_store = vector_store
+        self.tracker = tracker
+        self.max_buffer_bytes = max_buffer_bytes
+        # 批次不能超过预算的一半，否则缓冲区永远攒不满一个批次
+        self.write_batch_bytes = max(1, min(write_batch_bytes, max_buffer_bytes // 2))
+        self.queue: "queue.Queue[Optional[Tuple[List[Dict], List[array], int]]]" = queue.Queue()
+        self._budget = threading.Condition()
+        self._buffered_bytes = 0
+        self.written = 0
+        self.write_calls = 0
+        self.failed_batches = 0
+        self.peak_buffered_bytes = 0
+        self.checkpoint_rows = checkpoint_rows
+        self.checkpoints = 0
+        self._unpersisted: List[List[Dict]] = []  # 已写入内存、尚未落盘的批次
+        self._unpersisted_rows = 0
+        self._persisted_rows = 0
+    
+    def put(self, chunks: List[Dict], embeddings: List[array]):
+        """提交一批已向量化的块（内存预算不足时阻塞）"""
+        nbytes = sum(
+            estimate_chunk_bytes(chunk, len(embedding))
+            for chunk, embedding in zip(chunks, embeddings)
+        )
+        with self._budget:
+            while self._buffered_bytes > 0 and self._buffered_bytes + nbytes > self.max_buffer_bytes:
+                self._budget.wait()
+            self._buffered_bytes += nbytes
+            self.peak_buffered_bytes = max(self.peak_buffered_bytes, self._buffered_bytes)
+        self.queue.put((chunks, embeddings, nbytes))
+    
+    def close(self):
+        """通知写入线程退出并等待剩余批次写完"""
+        self.queue.put(None)
+        self.join()
+    
+    def run(self):
+        chunks: List[Dict] = []
+        embeddings: List[array] = []
+        nbytes = 0
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            chunks.extend(item[0])
+            embeddings.extend(item[1])
+            nbytes += item[2]
+            if nbytes >= self.write_batch_bytes:
+                self._flush(chunks, embeddings, nbytes)
+                chunks, embeddings, nbytes = [], [], 0
+        if chunks:
+            self._flush(chunks, embeddings, nbytes)
+        self._checkpoint()
+    
+    def _flush(self, chunks: List[Dict], embeddings: List[array], nbytes: int):
+        ok = True
+        try:
+            self.vector_store.upsert_documents(
+                chunks,
+                [embedding.tolist() for embedding in embeddings],
+                [get_chunk_id(chunk) for chunk in chunks]
+            )
+            self.written += len(chunks)
+        except Exception as e:
+            ok = False
+            self.failed_batches += 1
+            logger.error(f"写入批次失败（{len(chunks)} 个块）: {e}")
+        self.write_calls += 1
+        if ok and self.vector_store.defers_writes:
+            self._unpersisted.append(chunks)
+            self._unpersisted_rows += len(chunks)
+            if self._unpersisted_rows >= max(self._persisted_rows, self.checkpoint_rows):
+                self._checkpoint()
+        else:
+            self.tracker.written(chunks, ok)
+        
+        with self._budget:
+            self._buffered_bytes -= nbytes
+            self._budget.notify_all()
+
+    def _checkpoint(self):
+        """把尚未落盘的批次落盘，再记录到构建日志"""
+        if not self._unpersisted:
+            return
+        batches, self._unpersisted = self._unpersisted, []
+        ok = True
+        try:
+            self.vector_store.flush()
+            self.checkpoints += 1
+        except Exception as e:
+            ok = False
+            self.failed_batches += len(batches)
+            self.written -= self._unpersisted_rows
+            logger.error(f"向量库落盘失败（{self._unpersisted_rows} 个块）: {e}")
+        if ok:
+            self._persisted_rows += self._unpersisted_rows
+        self._unpersisted_rows = 0
+        for chunks in batches:
+            self.tracker.written(chunks, ok)
+
+def build_index(
+    reset: bool = False,
+    use_cache: bool = EMBEDDING_CACHE_ENABLED,
+    workers: int = 0,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    max_memory_mb: float = BUILD_MAX_MEMORY_MB,
+    write_batch_mb: float = WRITE_BATCH_MB,
+    resume: bool = False
+):
     """
     构建向量索引
     
+    文档依次流过 加载/分块 → 跨文档凑批向量化 → 按字节攒批写入 三个阶段，
+    边处理边写入向量数据库，每个文档写完即记录到索引清单。
+    
     Args:
         reset: 是否重置现有索引
+        use_cache: 是否使用Embedding磁盘缓存
+        workers: 加载/分块的进程数，0表示在主进程中处理
+        batch_size: 每个Embedding批次的块数
+        max_memory_mb: 各阶段缓冲区（待向量化的块 + 待写入的向量）的内存上限（MB）
+        write_batch_mb: 每次写入向量数据库的批次大小（MB）
+        resume: 从上次中断的构建继续（此时忽略reset，已提交的文档和批次不再重复处理）
     """
+    mode = f"{workers} 个进程" if workers > 0 else "单进程"
     logger.info("=" * 60)
-    logger.info("开始构建RAG知识库向量索引")
+    logger.info(
+        f"开始构建RAG知识库向量索引（{mode}，批次 {batch_size}，"
+        f"内存上限 {max_memory_mb} MB，写入批次 {write_batch_mb} MB）"
+    )
     logger.info("=" * 60)
     
     # 1. 初始化组件
     logger.info("初始化组件...")
-    embedding_model = EmbeddingModel(EMBEDDING_MODEL, EMBEDDING_DEVICE)
+    embedding_model = create_embedding_model(EMBEDDING_MODEL, EMBEDDING_DEVICE, use_cache=use_cache)
     vector_store = VectorStore(VECTOR_DB_DIR, COLLECTION_NAME)
-    document_loader = DocumentLoader()
+    manifest = IndexManifest()
+    journal = BuildJournal()
     
-    # 2. 重置索引（如果需要）
-    if reset:
-        logger.warning("重置现有索引...")
-        vector_store.reset_collection()
-    
-    # 3. 获取所有文档ID
     doc_ids = list(DOC_MAPPING.keys())
+    skip_chunk_ids: Set[str] = set()
+    
+    # 2. 断点续建，或重置索引（如果需要）后开始新的构建
+    if resume and journal.is_unfinished:
+        logger.info(
+            f"从 {journal.build['started_at']} 开始的构建继续：已提交 {len(journal.committed_docs)} 篇文档、"
+            f"{journal.batches} 个批次（{len(journal.committed_chunks)} 个块）"
+        )
+        if reset:
+            logger.warning("断点续建时忽略 --reset，不会清空已写入的数据")
+        # 已提交且之后没有再修改过的文档直接跳过；修改过的文档整篇重新处理
+        done_docs = {doc_id for doc_id in journal.committed_docs if not manifest.is_changed(doc_id)}
+        doc_ids = [doc_id for doc_id in doc_ids if doc_id not in done_docs]
+        # 只写了一部分的文档：文件未修改时跳过已提交的块
+        partial_docs = {
+            doc_id for doc_id, state_key in journal.doc_states.items()
+            if doc_id not in journal.committed_docs
+            and state_key == BuildJournal.state_key(manifest.current_state(doc_id))
+        }
+        skip_chunk_ids = {
+            chunk_id for chunk_id in journal.committed_chunks
+            if chunk_id.split('_')[0] in partial_docs
+        }
+    else:
+        if resume:
+            logger.info("没有未完成的构建，开始新的构建")
+        if reset:
+            logger.warning("重置现有索引...")
+            vector_store.reset_collection()
+            manifest.clear()
+        journal.start({'reset': reset, 'workers': workers, 'batch_size': batch_size})
+    
+    # 3. 待处理的文档
     logger.info(f"共 {len(doc_ids)} 篇文档需要处理")
     
-    # 4. 批量处理文档
-    all_chunks = []
-    all_embeddings = []
-    all_ids = []
+    # 内存预算：1/4 给待向量化的块，其余给等待写入的向量
+    max_bytes = int(max_memory_mb * 1024 * 1024)
+    tracker = _DocTracker(manifest, journal)
+    writer = _VectorStoreWriter(
+        vector_store,
+        tracker,
+        max_buffer_bytes=max_bytes - max_bytes // 4,
+        write_batch_bytes=int(write_batch_mb * 1024 * 1024)
+    )
+    writer.start()
     
-    logger.info("开始处理文档...")
-    for doc_id in tqdm(doc_ids, desc="处理文档"):
-        try:
-            # 加载文档
-            doc = document_loader.load_document(doc_id)
-            logger.debug(f"加载文档: {doc_id} - {doc['index'].get('title', '')}")
-            
-            # 分块
-            chunks = document_loader.chunk_document(doc)
-            logger.debug(f"文档 {doc_id} 分块完成，共 {len(chunks)} 个块")
-            
-            # 向量化
-            chunk_texts = [chunk['content'] for chunk in chunks]
-            embeddings = embedding_model.encode_batch(
-                chunk_texts,
-                batch_size=32,
-                show_progress_bar=False
-            )
-            
-            # 生成ID
-            chunk_ids = [
-                f"{doc_id}_{chunk['chunk_type']}_{chunk.get('chunk_index', chunk.get('pattern_index', chunk.get('example_index', 0)))}"
-                for chunk in chunks
-            ]
-            
-            # 收集数据
-            all_chunks.extend(chunks)
-            all_embeddings.extend(embeddings)
-            all_ids.extend(chunk_ids)
-            
-            logger.info(f"✅ {doc_id} 处理完成: {len(chunks)} 个块")
-            
-        except Exception as e:
-            logger.error(f"❌ 处理文档 {doc_id} 失败: {e}")
-            continue
+    # 4. 加载/分块 → 凑批向量化（主进程） → 写入（写入线程）
+    try:
+        documents = tqdm(iter_documents(doc_ids, manifest, workers), total=len(doc_ids), desc="处理文档")
+        for chunks, embeddings in iter_embedded_batches(
+            documents, embedding_model, tracker, batch_size,
+            max_pending_bytes=max_bytes // 4,
+            skip_chunk_ids=skip_chunk_ids
+        ):
+            writer.put(chunks, embeddings)
+    finally:
+        writer.close()
+        # 向量库已变化（包括中断时已写入的部分），使各进程的检索结果缓存失效
+        bump_index_version()
+    vector_store.flush()
     
-    # 5. 批量添加到向量数据库
-    if all_chunks:
-        logger.info(f"\n开始添加到向量数据库，共 {len(all_chunks)} 个块...")
-        
-        # 分批添加（避免内存问题）
-        batch_size = 100
-        for i in tqdm(range(0, len(all_chunks), batch_size), desc="添加到向量数据库"):
-            batch_chunks = all_chunks[i:i+batch_size]
-            batch_embeddings = all_embeddings[i:i+batch_size]
-            batch_ids = all_ids[i:i+batch_size]
-            
-            try:
-                vector_store.add_documents(
-                    batch_chunks,
-                    batch_embeddings,
-                    batch_ids
-                )
-            except Exception as e:
-                logger.error(f"添加批次 {i//batch_size + 1} 失败: {e}")
-        
-        logger.info("✅ 所有文档块已添加到向量数据库")
-    else:
-        logger.warning("没有文档块需要添加")
+    # 正常跑完才标记完成；中断时日志保持未完成状态，可用 --resume 继续
+    journal.finish()
+    
+    # 清理向量库中已不存在的块的多向量（按内容寻址，保留的块直接复用）
+    if embedding_model.multi_vector_store is not None:
+        embedding_model.multi_vector_store.prune(
+            document for page in vector_store.iter_chunks() for document in page['documents']
+        )
     
-    # 6. 显示统计信息
+    logger.info(
+        f"✅ 共写入 {writer.written} 个文档块，{writer.write_calls} 次写入"
+        f"（失败批次: {writer.failed_batches}，写入缓冲峰值 {writer.peak_buffered_bytes / 1024 / 1024:.1f} MB）"
+    )
+    if vector_store.defers_writes:
+        logger.info(f"向量库落盘 {writer.checkpoints} 次")
+    logger.info(f"索引清单已更新: {len(tracker.completed)} 篇文档")
+    if tracker.failed:
+        logger.warning(f"处理失败的文档（未记录到清单）: {sorted(tracker.failed)}")
+    
+    # 5. 显示统计信息
+    _log_summary(vector_store, embedding_model)
+
+def build_index_pipelined(
+    reset: bool = False,
+    workers: int = BUILD_WORKERS,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+    use_cache: bool = EMBEDDING_CACHE_ENABLED,
+    max_memory_mb: float = BUILD_MAX_MEMORY_MB,
+    write_batch_mb: float = WRITE_BATCH_MB,
+    resume: bool = False
+):
+    """
+    流水线方式构建向量索引（多进程加载/分块，参数同 build_index）
+    """
+    build_index(
+        reset=reset,
+        use_cache=use_cache,
+        workers=workers,
+        batch_size=batch_size,
+        max_memory_mb=max_memory_mb,
+        write_batch_mb=write_batch_mb,
+        resume=resume
+    )
+
+def _log_summary(vector_store: VectorStore, embedding_model: EmbeddingModel):
+    """显示索引统计信息"""
     info = vector_store.get_collection_info()
     logger.info("\n" + "=" * 60)
     logger.info("索引构建完成！")
@@ -145,6 +576,15 @@ def build_index(reset: bool = False):
     logger.info(f"集合名称: {info['collection_name']}")
     logger.info(f"文档块数量: {info['document_count']}")
     logger.info(f"数据库路径: {info['db_path']}")
+    cache_stats = embedding_model.get_cache_stats()
+    if cache_stats:
+        logger.info(
+            f"Embedding缓存: 命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']} "
+            f"(命中率 {cache_stats['hit_rate']:.1%}，{cache_stats['entries']} 条，{cache_stats['size_mb']} MB)"
+        )
+    if embedding_model.multi_vector_store is not None:
+        m3_stats = embedding_model.multi_vector_store.get_stats()
+        logger.info(f"BGE-M3多向量: {m3_stats['entries']} 条，{m3_stats['size_mb']} MB")
     logger.info("=" * 60)
 
 def main():
@@ -157,13 +597,60 @@ def main():
         action="store_true",
         help="重置现有索引（删除所有数据）"
     )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="从上次中断的构建继续（跳过已提交的文档和批次，忽略 --reset）"
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="流水线模式：多进程加载/分块（进程数见 --workers）"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=BUILD_WORKERS,
+        help="流水线模式下加载/分块的进程数"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=EMBEDDING_BATCH_SIZE,
+        help="每个Embedding批次的块数"
+    )
+    parser.add_argument(
+        "--max-memory-mb",
+        type=float,
+        default=BUILD_MAX_MEMORY_MB,
+        help="各阶段缓冲区（待向量化的块+待写入的向量）的内存上限（MB）"
+    )
+    parser.add_argument(
+        "--write-batch-mb",
+        type=float,
+        default=WRITE_BATCH_MB,
+        help="每次写入向量数据库的批次大小（MB）"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="不使用Embedding磁盘缓存（所有块重新向量化）"
+    )
     
     args = parser.parse_args()
     
     try:
-        build_index(reset=args.reset)
+        build_index(
+            reset=args.reset,
+            use_cache=not args.no_cache,
+            workers=args.workers if args.pipeline else 0,
+            batch_size=args.batch_size,
+            max_memory_mb=args.max_memory_mb,
+            write_batch_mb=args.write_batch_mb,
+            resume=args.resume
+        )
     except KeyboardInterrupt:
-        logger.info("\n用户中断操作")
+        logger.info("\n用户中断操作，已提交的部分可用 --resume 继续")
     except Exception as e:
         logger.error(f"构建索引失败: {e}", exc_info=True)
         sys.exit(1)
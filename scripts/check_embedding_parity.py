@@ -0,0 +1,162 @@
+"""
+Embedding后端一致性检查
+用同一批知识库分块和查询分别跑 PyTorch 与 ONNX 后端，比较向量余弦相似度
+和近邻检索结果的重合度，确认可以切换到 EMBEDDING_BACKEND=onnx
+
+用法：
+    python scripts/check_embedding_parity.py                   # 默认取300个块
+    python scripts/check_embedding_parity.py --fp32            # 检查未量化的ONNX模型
+    python scripts/check_embedding_parity.py --min-cosine 0.99
+"""
+
+import sys
+import time
+import logging
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# 处理 rag-system 目录的导入（目录名包含连字符，不能直接导入）
+import importlib.util
+rag_system_path = project_root / "rag-system"
+rag_system_init = rag_system_path / "__init__.py"
+if rag_system_init.exists():
+    spec = importlib.util.spec_from_file_location("rag_system", rag_system_init)
+    rag_system_module = importlib.util.module_from_spec(spec)
+    sys.modules["rag_system"] = rag_system_module
+    spec.loader.exec_module(rag_system_module)
+    # 导入子模块
+    for module_file in ["config", "embedding_cache", "lru_cache", "onnx_backend", "micro_batcher", "embedding_server", "m3_vectors", "embedding", "pattern_matcher", "index_catalog", "document_loader"]:
+        module_path = rag_system_path / f"{module_file}.py"
+        if module_path.exists():
+            spec = importlib.util.spec_from_file_location(f"rag_system.{module_file}", module_path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[f"rag_system.{module_file}"] = module
+            spec.loader.exec_module(module)
+
+from rag_system.config import EMBEDDING_MODEL, DOC_MAPPING
+from rag_system.embedding import EmbeddingModel
+from rag_system.document_loader import DocumentLoader
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def load_samples(limit: int) -> Tuple[List[str], List[str]]:
+    """
+    加载样本：正文等分块作为文档，query_pattern块作为查询
+    
+    Returns:
+        (文档文本列表, 查询文本列表)
+    """
+    loader = DocumentLoader()
+    docs, queries = [], []
+    for doc_id in DOC_MAPPING:
+        try:
+            chunks = loader.chunk_document(loader.load_document(doc_id))
+        except Exception as e:
+            logger.warning(f"跳过文档 {doc_id}: {e}")
+            continue
+        for chunk in chunks:
+            target = queries if chunk['chunk_type'] == 'query_pattern' else docs
+            target.append(chunk['content'])
+        if len(docs) >= limit:
+            break
+    return docs[:limit], queries[:max(limit // 3, 1)]
+
+def encode_all(model: EmbeddingModel, docs: List[str], queries: List[str]) -> Tuple[np.ndarray, np.ndarray, float]:
+    """向量化文档和查询，返回 (文档向量, 查询向量, 耗时)"""
+    started = time.perf_counter()
+    doc_vectors = np.array(model.encode(docs, show_progress_bar=False))
+    query_vectors = np.array([model.encode_query(query) for query in queries])
+    return doc_vectors, query_vectors, time.perf_counter() - started
+
+def row_cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """逐行余弦相似度"""
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+def topk_overlap(
+    ref_docs: np.ndarray, ref_queries: np.ndarray,
+    new_docs: np.ndarray, new_queries: np.ndarray,
+    k: int
+) -> float:
+    """两个后端各自检索的top-k结果的平均重合率"""
+    k = min(k, len(ref_docs))
+    ref_top = np.argsort(-(ref_queries @ ref_docs.T), axis=1)[:, :k]
+    new_top = np.argsort(-(new_queries @ new_docs.T), axis=1)[:, :k]
+    return float(np.mean([len(set(r) & set(n)) / k for r, n in zip(ref_top, new_top)]))
+
+def check_parity(limit: int = 300, quantized: bool = True, min_cosine: float = 0.98, k: int = 10) -> bool:
+    """
+    比较PyTorch与ONNX后端
+    
+    Args:
+        limit: 参与比较的文档块数量
+        quantized: 是否检查int8量化版本
+        min_cosine: 合格阈值（所有向量的最小余弦相似度）
+        k: 近邻检索重合度的k
+    
+    Returns:
+        是否合格
+    """
+    docs, queries = load_samples(limit)
+    logger.info(f"样本: {len(docs)} 个文档块，{len(queries)} 条查询")
+    
+    reference = EmbeddingModel(EMBEDDING_MODEL, "cpu", cache=None, backend="torch")
+    ref_docs, ref_queries, ref_time = encode_all(reference, docs, queries)
+    del reference
+    
+    candidate = EmbeddingModel(EMBEDDING_MODEL, "cpu", cache=None, backend="onnx", onnx_quantized=quantized)
+    new_docs, new_queries, new_time = encode_all(candidate, docs, queries)
+    
+    doc_cos = row_cosine(ref_docs, new_docs)
+    query_cos = row_cosine(ref_queries, new_queries)
+    overlap = topk_overlap(ref_docs, ref_queries, new_docs, new_queries, k)
+    worst = float(min(doc_cos.min(), query_cos.min()))
+    passed = worst >= min_cosine
+    
+    label = "ONNX int8" if quantized else "ONNX fp32"
+    logger.info("=" * 60)
+    logger.info(f"文档余弦: 平均 {doc_cos.mean():.5f}，P1 {np.percentile(doc_cos, 1):.5f}，最小 {doc_cos.min():.5f}")
+    logger.info(f"查询余弦: 平均 {query_cos.mean():.5f}，P1 {np.percentile(query_cos, 1):.5f}，最小 {query_cos.min():.5f}")
+    logger.info(f"top-{k} 检索重合率: {overlap:.1%}")
+    logger.info(f"耗时: PyTorch {ref_time:.2f}s，{label} {new_time:.2f}s（{ref_time / new_time:.2f}x）")
+    logger.info(f"{'✅ 通过' if passed else '❌ 未通过'}（最小余弦 {worst:.5f}，阈值 {min_cosine}）")
+    logger.info("=" * 60)
+    return passed
+
+def main():
+    """主函数"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="比较PyTorch与ONNX Embedding后端的向量一致性")
+    parser.add_argument("--limit", type=int, default=300, help="参与比较的文档块数量")
+    parser.add_argument("--fp32", action="store_true", help="检查未量化的ONNX模型")
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="合格阈值（最小余弦相似度）")
+    parser.add_argument("--top-k", type=int, default=10, help="近邻检索重合度的k")
+    
+    args = parser.parse_args()
+    
+    try:
+        passed = check_parity(
+            limit=args.limit,
+            quantized=not args.fp32,
+            min_cosine=args.min_cosine,
+            k=args.top_k
+        )
+    except Exception as e:
+        logger.error(f"一致性检查失败: {e}", exc_info=True)
+        sys.exit(1)
+    
+    sys.exit(0 if passed else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+检索排序回归检查
+用 test_query.py 的 TEST_QUERIES 分别跑只用向量检索和向量+BM25混合检索，
+确认混合检索没有把向量检索排第一的文档挤出前几名，也没有让关联文档/摘要条目排到真实命中之前；
+可保存一次结果作为基准，修改检索逻辑后再与基准比较
+
+用法：
+    python scripts/check_retrieval_rankings.py                          # 混合检索 vs 只用向量检索
+    python scripts/check_retrieval_rankings.py --save rankings.json     # 保存混合检索的排序作为基准
+    python scripts/check_retrieval_rankings.py --baseline rankings.json # 与基准比较
+"""
+
+import sys
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# test_query.py 负责导入 rag-system 的各子模块
+sys.path.insert(0, str(Path(__file__).parent))
+from test_query import TEST_QUERIES
+
+from rag_system.config import (
+    INDEX_DIR, VECTOR_DB_DIR, VECTOR_DB_TYPE, COLLECTION_NAME,
+    EMBEDDING_MODEL, EMBEDDING_DEVICE
+)
+from rag_system.embedding import create_embedding_model
+from rag_system.vector_store import VectorStore
+from rag_system.retriever import HybridRetriever
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def rank_queries(retriever: HybridRetriever, queries: List[str], top_k: int) -> Dict[str, List[Dict]]:
+    """每个查询的前 top_k 个结果：[{'doc_id', 'score', 'kind'}]，kind 为 chunk / summary / related"""
+    rankings = {}
+    for query, results in zip(queries, retriever.retrieve_many(queries, top_k=top_k)):
+        rankings[query] = [
+            {
+                'doc_id': result['doc_id'],
+                'score': round(result['score'], 6),
+                'kind': 'related' if result.get('is_related') else ('chunk' if result['chunks'] else 'summary')
+            }
+            for result in results
+        ]
+    return rankings
+
+def first_hit_position(ranking: List[Dict]) -> Optional[int]:
+    """第一个真实命中块（非关联文档/摘要）的名次"""
+    return next((i for i, item in enumerate(ranking) if item['kind'] == 'chunk'), None)
+
+def compare(
+    reference: Dict[str, List[Dict]],
+    candidate: Dict[str, List[Dict]],
+    top1_within: int,
+    min_overlap: float
+) -> List[str]:
+    """
+    比较两组排序
+
+    Args:
+        reference: 参照排序（只用向量检索或保存的基准）
+        candidate: 待检查的排序
+        top1_within: 参照排序的第一名在待检查排序中允许的最低名次
+        min_overlap: 前k名文档的最低重合比例
+
+    Returns:
+        回归的描述（为空表示通过）
+    """
+    problems = []
+    for query, expected in reference.items():
+        actual = candidate.get(query, [])
+        expected_ids = [item['doc_id'] for item in expected]
+        actual_ids = [item['doc_id'] for item in actual]
+        overlap = len(set(expected_ids) & set(actual_ids)) / max(len(expected_ids), 1)
+
+        if expected_ids and expected_ids[0] not in actual_ids[:top1_within]:
+            problems.append(f"{query}: 参照第一名 {expected_ids[0]} 不在前 {top1_within} 名 {actual_ids}")
+        if overlap < min_overlap:
+            problems.append(f"{query}: 前{len(expected_ids)}名重合 {overlap:.0%} < {min_overlap:.0%}")
+        expected_hit, actual_hit = first_hit_position(expected), first_hit_position(actual)
+        if expected_hit is not None and (actual_hit is None or actual_hit > expected_hit):
+            problems.append(
+                f"{query}: 关联文档/摘要条目排到了真实命中之前（第一个命中块名次 {expected_hit + 1} → "
+                f"{actual_hit + 1 if actual_hit is not None else '无'}）"
+            )
+        logger.info(f"{query}: {' '.join(expected_ids)}  →  {' '.join(actual_ids)}（重合 {overlap:.0%}）")
+    return problems
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="检索排序回归检查（TEST_QUERIES）")
+    parser.add_argument("--top-k", type=int, default=5, help="每个查询比较的结果数")
+    parser.add_argument("--top1-within", type=int, default=3, help="参照第一名在混合检索中允许的最低名次")
+    parser.add_argument("--min-overlap", type=float, default=0.4, help="前k名文档的最低重合比例（BM25本来就会换掉一部分结果）")
+    parser.add_argument("--save", type=Path, default=None, help="把混合检索的排序保存为基准文件")
+    parser.add_argument("--baseline", type=Path, default=None, help="与保存的基准比较（代替只用向量检索的参照）")
+    args = parser.parse_args()
+
+    embedding_model = create_embedding_model(EMBEDDING_MODEL, EMBEDDING_DEVICE)
+    read_only = VECTOR_DB_TYPE == "numpy"
+    hybrid = HybridRetriever(VectorStore(VECTOR_DB_DIR, COLLECTION_NAME, read_only=read_only), embedding_model, INDEX_DIR)
+    candidate = rank_queries(hybrid, TEST_QUERIES, args.top_k)
+
+    if args.save is not None:
+        args.save.write_text(json.dumps(candidate, ensure_ascii=False, indent=2), encoding='utf-8')
+        logger.info(f"已保存 {len(candidate)} 个查询的排序: {args.save}")
+        return
+
+    if args.baseline is not None:
+        reference = json.loads(args.baseline.read_text(encoding='utf-8'))
+        logger.info(f"参照: 基准文件 {args.baseline}")
+    else:
+        dense_only = HybridRetriever(
+            VectorStore(VECTOR_DB_DIR, COLLECTION_NAME, sparse_index=False, read_only=read_only),
+            embedding_model, INDEX_DIR
+        )
+        reference = rank_queries(dense_only, TEST_QUERIES, args.top_k)
+        logger.info("参照: 只用向量检索")
+
+    problems = compare(reference, candidate, args.top1_within, args.min_overlap)
+    logger.info("=" * 60)
+    if problems:
+        for problem in problems:
+            logger.error(problem)
+        logger.error(f"❌ {len(problems)} 处排序回归")
+        sys.exit(1)
+    logger.info(f"✅ {len(reference)} 个查询的排序没有回归")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Embedding常驻服务
+加载一次Embedding模型后常驻内存，通过本机HTTP端口为其他脚本提供向量化，
+并把多个客户端的并发请求合并成批次推理。
+
+服务运行期间，test_query.py、build_index.py、update_index.py 等脚本会自动以客户端模式连接
+（EMBEDDING_SERVER_URL=auto），不再各自加载约2GB的模型。
+
+用法：
+    python scripts/embedding_server.py                 # 监听 127.0.0.1:8765
+    python scripts/embedding_server.py --port 9000     # 其他端口（客户端需设置 EMBEDDING_SERVER_PORT=9000）
+"""
+
+import sys
+import logging
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# 处理 rag-system 目录的导入（目录名包含连字符，不能直接导入）
+import importlib.util
+rag_system_path = project_root / "rag-system"
+rag_system_init = rag_system_path / "__init__.py"
+if rag_system_init.exists():
+    spec = importlib.util.spec_from_file_location("rag_system", rag_system_init)
+    rag_system_module = importlib.util.module_from_spec(spec)
+    sys.modules["rag_system"] = rag_system_module
+    spec.loader.exec_module(rag_system_module)
+    # 导入子模块
+    for module_file in ["config", "embedding_cache", "lru_cache", "onnx_backend", "micro_batcher", "embedding_server", "m3_vectors", "embedding"]:
+        module_path = rag_system_path / f"{module_file}.py"
+        if module_path.exists():
+            spec = importlib.util.spec_from_file_location(f"rag_system.{module_file}", module_path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[f"rag_system.{module_file}"] = module
+            spec.loader.exec_module(module)
+
+from rag_system.config import (
+    EMBEDDING_MODEL, EMBEDDING_DEVICE, EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_SERVER_HOST, EMBEDDING_SERVER_PORT,
+    EMBEDDING_SERVER_BATCH_WAIT_MS, EMBEDDING_SERVER_MAX_BATCH
+)
+from rag_system.embedding import create_embedding_model
+from rag_system.embedding_server import EmbeddingServer
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def main():
+    """主函数"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="启动Embedding常驻服务")
+    parser.add_argument(
+        "--host",
+        default=EMBEDDING_SERVER_HOST,
+        help="监听地址（默认只监听本机）"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=EMBEDDING_SERVER_PORT,
+        help="监听端口"
+    )
+    parser.add_argument(
+        "--batch-wait-ms",
+        type=float,
+        default=EMBEDDING_SERVER_BATCH_WAIT_MS,
+        help="合批等待时间（毫秒）"
+    )
+    parser.add_argument(
+        "--max-batch",
+        type=int,
+        default=EMBEDDING_SERVER_MAX_BATCH,
+        help="每批最多文本数"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="不使用Embedding磁盘缓存"
+    )
+    
+    args = parser.parse_args()
+    
+    try:
+        # 服务本身必须加载本地模型
+        embedding_model = create_embedding_model(
+            EMBEDDING_MODEL,
+            EMBEDDING_DEVICE,
+            use_cache=EMBEDDING_CACHE_ENABLED and not args.no_cache,
+            use_server=False
+        )
+        server = EmbeddingServer(
+            embedding_model,
+            host=args.host,
+            port=args.port,
+            max_wait_ms=args.batch_wait_ms,
+            max_batch=args.max_batch
+        )
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("\nEmbedding服务已停止")
+    except Exception as e:
+        logger.error(f"Embedding服务启动失败: {e}", exc_info=True)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+导出ONNX Embedding模型
+把配置的 EMBEDDING_MODEL 导出为ONNX图，并生成动态int8量化版本，
+供 EMBEDDING_BACKEND=onnx 使用（切换前先运行 check_embedding_parity.py 核对向量一致性）
+
+用法：
+    python scripts/export_onnx_model.py                 # 导出到 ONNX_MODEL_DIR
+    python scripts/export_onnx_model.py --no-quantize   # 只导出fp32版本
+"""
+
+import sys
+import logging
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# 处理 rag-system 目录的导入（目录名包含连字符，不能直接导入）
+import importlib.util
+rag_system_path = project_root / "rag-system"
+rag_system_init = rag_system_path / "__init__.py"
+if rag_system_init.exists():
+    spec = importlib.util.spec_from_file_location("rag_system", rag_system_init)
+    rag_system_module = importlib.util.module_from_spec(spec)
+    sys.modules["rag_system"] = rag_system_module
+    spec.loader.exec_module(rag_system_module)
+    # 导入子模块
+    for module_file in ["config", "onnx_backend"]:
+        module_path = rag_system_path / f"{module_file}.py"
+        if module_path.exists():
+            spec = importlib.util.spec_from_file_location(f"rag_system.{module_file}", module_path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[f"rag_system.{module_file}"] = module
+            spec.loader.exec_module(module)
+
+from rag_system.config import EMBEDDING_MODEL, ONNX_MODEL_DIR
+from rag_system.onnx_backend import export_onnx_model
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def main():
+    """主函数"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="导出ONNX Embedding模型")
+    parser.add_argument(
+        "--model",
+        default=EMBEDDING_MODEL,
+        help="SentenceTransformer模型名称或路径"
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=ONNX_MODEL_DIR,
+        help="输出目录（默认为 ONNX_MODEL_DIR）"
+    )
+    parser.add_argument(
+        "--no-quantize",
+        action="store_true",
+        help="不生成int8量化版本"
+    )
+    parser.add_argument(
+        "--opset",
+        type=int,
+        default=14,
+        help="ONNX opset版本"
+    )
+    
+    args = parser.parse_args()
+    
+    try:
+        output_dir = export_onnx_model(
+            args.model,
+            args.output_dir,
+            quantize=not args.no_quantize,
+            opset=args.opset
+        )
+        logger.info(f"✅ 已导出到 {output_dir}")
+        logger.info("下一步: python scripts/check_embedding_parity.py 核对向量一致性后，设置 EMBEDDING_BACKEND=onnx")
+    except Exception as e:
+        logger.error(f"导出失败: {e}", exc_info=True)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
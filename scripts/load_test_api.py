@@ -0,0 +1,217 @@
+"""
+查询服务压测
+以不同并发数向 api/app.py 发送检索或问答请求，输出吞吐与延迟分位数
+
+用法：
+    python -m api.app                                              # 先启动服务
+    python scripts/load_test_api.py                                # 并发 1,4,16,64，每档200个请求
+    python scripts/load_test_api.py --endpoint answer --use-llm --concurrency 8 --requests 50
+    python scripts/load_test_api.py --queries-file queries.txt     # 使用真实问题（每行一个）
+
+测量未命中缓存时的检索性能，需要在启动服务时设置 RESULT_CACHE_ENABLED=false。
+"""
+
+import sys
+import json
+import time
+import threading
+import urllib.request
+import urllib.error
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# 处理 rag-system 目录的导入（目录名包含连字符，不能直接导入）
+import importlib.util
+rag_system_path = project_root / "rag-system"
+rag_system_init = rag_system_path / "__init__.py"
+if rag_system_init.exists():
+    spec = importlib.util.spec_from_file_location("rag_system", rag_system_init)
+    rag_system_module = importlib.util.module_from_spec(spec)
+    sys.modules["rag_system"] = rag_system_module
+    spec.loader.exec_module(rag_system_module)
+    # 导入子模块
+    for module_file in ["config"]:
+        module_path = rag_system_path / f"{module_file}.py"
+        if module_path.exists():
+            spec = importlib.util.spec_from_file_location(f"rag_system.{module_file}", module_path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[f"rag_system.{module_file}"] = module
+            spec.loader.exec_module(module)
+
+from rag_system.config import API_HOST, API_PORT, TOP_K
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 默认压测问题
+DEFAULT_QUERIES = [
+    "AI用多了会变傻吗",
+    "如何进行产品创新",
+    "客户嫌贵怎么沟通",
+    "如何建立长期思维",
+    "什么是正BUFF效应",
+    "如何避免AI依赖",
+    "第一性原理怎么用",
+    "马斯克五步工作法",
+    "最小可行启动点是什么",
+    "什么是阳谋战略",
+]
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """已排序列表的分位数（最近秩）"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def send_request(url: str, payload: Dict, timeout: float) -> int:
+    """发送一个POST请求，返回HTTP状态码（连接失败为0）"""
+    data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, OSError):
+        return 0
+
+def run_level(
+    url: str,
+    payloads: List[Dict],
+    concurrency: int,
+    n_requests: int,
+    timeout: float
+) -> Dict:
+    """
+    以固定并发数发送 n_requests 个请求
+
+    Returns:
+        {'concurrency', 'requests', 'throughput', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms', 'status'}
+    """
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    lock = threading.Lock()
+
+    def worker(i: int):
+        start = time.perf_counter()
+        status = send_request(url, payloads[i % len(payloads)], timeout)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with lock:
+            statuses[status] += 1
+            if status == 200:
+                latencies.append(elapsed_ms)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(n_requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': n_requests,
+        'throughput': round(statuses[200] / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p90_ms': round(percentile(latencies, 90), 1),
+        'p99_ms': round(percentile(latencies, 99), 1),
+        'max_ms': round(latencies[-1], 1) if latencies else 0.0,
+        'status': dict(statuses)
+    }
+
+def fetch_stats(base_url: str) -> Optional[Dict]:
+    """读取服务端统计"""
+    try:
+        with urllib.request.urlopen(f"{base_url}/stats", timeout=5) as response:
+            return json.loads(response.read().decode('utf-8'))
+    except (urllib.error.URLError, OSError, ValueError):
+        return None
+
+def run_load_test(
+    base_url: str,
+    endpoint: str,
+    concurrency_levels: List[int],
+    n_requests: int,
+    queries: List[str],
+    top_k: int = TOP_K,
+    use_llm: bool = False,
+    timeout: float = 120.0
+):
+    """按各并发档位依次压测并输出结果"""
+    url = f"{base_url}/{endpoint}"
+    if endpoint == "answer":
+        payloads = [{'query': q, 'top_k': top_k, 'use_llm': use_llm} for q in queries]
+    else:
+        payloads = [{'query': q, 'top_k': top_k} for q in queries]
+
+    # 预热（每个问题一次，排除模型首次推理的开销）
+    for payload in payloads:
+        send_request(url, payload, timeout)
+
+    logger.info(f"压测 {url}（{len(queries)} 个问题，每档 {n_requests} 个请求）")
+    logger.info(f"{'并发':>6} {'吞吐(req/s)':>12} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}  状态码")
+    for concurrency in concurrency_levels:
+        result = run_level(url, payloads, concurrency, n_requests, timeout)
+        logger.info(
+            f"{result['concurrency']:>6} {result['throughput']:>12.2f} {result['p50_ms']:>7.1f}ms "
+            f"{result['p90_ms']:>7.1f}ms {result['p99_ms']:>7.1f}ms {result['max_ms']:>7.1f}ms  {result['status']}"
+        )
+
+    stats = fetch_stats(base_url)
+    if stats:
+        logger.info(f"服务端统计: {json.dumps(stats['requests'], ensure_ascii=False)}")
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="查询服务压测")
+    parser.add_argument("--url", default=f"http://{API_HOST}:{API_PORT}", help="服务地址")
+    parser.add_argument("--endpoint", choices=["retrieve", "answer"], default="retrieve", help="压测的接口")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="并发数（逗号分隔，依次压测）")
+    parser.add_argument("--requests", type=int, default=200, help="每档请求数")
+    parser.add_argument("--queries-file", type=Path, default=None, help="问题文件（每行一个）")
+    parser.add_argument("--top-k", type=int, default=TOP_K, help="返回结果数量")
+    parser.add_argument("--use-llm", action="store_true", help="answer接口调用LLM生成回答")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求超时（秒）")
+
+    args = parser.parse_args()
+
+    try:
+        concurrency_levels = [int(c) for c in args.concurrency.split(',') if c.strip()]
+    except ValueError:
+        parser.error("--concurrency 必须是逗号分隔的整数")
+    if not concurrency_levels or min(concurrency_levels) <= 0 or args.requests <= 0:
+        parser.error("并发数和请求数必须大于0")
+
+    queries = DEFAULT_QUERIES
+    if args.queries_file is not None:
+        queries = [line.strip() for line in args.queries_file.read_text(encoding='utf-8').splitlines() if line.strip()]
+        if not queries:
+            parser.error(f"问题文件为空: {args.queries_file}")
+
+    run_load_test(
+        base_url=args.url.rstrip('/'),
+        endpoint=args.endpoint,
+        concurrency_levels=concurrency_levels,
+        n_requests=args.requests,
+        queries=queries,
+        top_k=args.top_k,
+        use_llm=args.use_llm,
+        timeout=args.timeout
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+本地模拟LLM服务
+按固定的首字延迟和逐段间隔返回回答，用于在没有真实模型时测试流式输出（RAGChain.query_stream、/answer/stream）
+
+支持的接口：
+    POST /v1/chat/completions   OpenAI兼容（stream=true 时按SSE逐段返回）
+    POST /api/generate          Ollama（stream 默认开启，按行返回JSON）
+
+用法：
+    python scripts/mock_llm_server.py --port 8090 --first-token-ms 300 --token-delay-ms 30
+    OPENAI_API_KEY=mock OPENAI_BASE_URL=http://127.0.0.1:8090/v1 python scripts/test_query.py --mode rag --use-llm --stream --query "AI用多了会变傻吗"
+    LLM_PROVIDER=ollama OLLAMA_BASE_URL=http://127.0.0.1:8090 python scripts/test_query.py --mode rag --use-llm --stream --query "..."
+"""
+
+import json
+import time
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def build_answer(prompt: str, n_tokens: int) -> List[str]:
+    """根据提示词中的用户问题生成固定格式的回答，并切成 n_tokens 段"""
+    question = prompt
+    marker = "用户问题："
+    if marker in prompt:
+        question = prompt.split(marker, 1)[1].split("\n", 1)[0].strip()
+    text = f"（模拟回答）关于「{question}」，知识库中的相关内容如下。" + "这是一段用于测试流式输出的文字。" * 4
+    size = max(1, -(-len(text) // max(1, n_tokens)))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """模拟OpenAI/Ollama接口的请求处理"""
+
+    first_token_delay = 0.2
+    token_delay = 0.02
+    n_tokens = 40
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length).decode('utf-8') or "{}")
+
+    def _send_json(self, payload: Dict, status: int = 200):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, content_type: str, lines: List[bytes]):
+        """按延迟逐行写出（HTTP/1.0，连接关闭即结束）"""
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        time.sleep(self.first_token_delay)
+        try:
+            for i, line in enumerate(lines):
+                if i:
+                    time.sleep(self.token_delay)
+                self.wfile.write(line)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info("客户端提前断开")
+
+    def do_POST(self):
+        try:
+            body = self._read_json()
+        except ValueError:
+            self._send_json({'error': 'invalid json'}, status=400)
+            return
+
+        if self.path.rstrip('/').endswith('/chat/completions'):
+            self._chat_completions(body)
+        elif self.path.rstrip('/') == '/api/generate':
+            self._ollama_generate(body)
+        else:
+            self._send_json({'error': f'unknown path {self.path}'}, status=404)
+
+    def _chat_completions(self, body: Dict):
+        model = body.get('model', 'mock')
+        prompt = "\n".join(str(m.get('content', '')) for m in body.get('messages', []))
+        tokens = build_answer(prompt, self.n_tokens)
+        created = int(time.time())
+
+        if not body.get('stream'):
+            time.sleep(self.first_token_delay + self.token_delay * (len(tokens) - 1))
+            self._send_json({
+                'id': 'chatcmpl-mock',
+                'object': 'chat.completion',
+                'created': created,
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': "".join(tokens)},
+                    'finish_reason': 'stop'
+                }]
+            })
+            return
+
+        def chunk(delta: Dict, finish_reason=None) -> bytes:
+            payload = {
+                'id': 'chatcmpl-mock',
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode('utf-8')
+
+        lines = [chunk({'role': 'assistant', 'content': tokens[0]})]
+        lines += [chunk({'content': token}) for token in tokens[1:]]
+        lines += [chunk({}, finish_reason='stop'), b"data: [DONE]\n\n"]
+        self._stream('text/event-stream', lines)
+
+    def _ollama_generate(self, body: Dict):
+        model = body.get('model', 'mock')
+        tokens = build_answer(str(body.get('prompt', '')), self.n_tokens)
+        created_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+        if body.get('stream') is False:
+            time.sleep(self.first_token_delay + self.token_delay * (len(tokens) - 1))
+            self._send_json({'model': model, 'created_at': created_at, 'response': "".join(tokens), 'done': True})
+            return
+
+        lines = [
+            (json.dumps({'model': model, 'created_at': created_at, 'response': token, 'done': False},
+                        ensure_ascii=False) + "\n").encode('utf-8')
+            for token in tokens
+        ]
+        lines.append((json.dumps({'model': model, 'created_at': created_at, 'response': '', 'done': True}) + "\n").encode('utf-8'))
+        self._stream('application/x-ndjson', lines)
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地模拟LLM服务（OpenAI兼容 / Ollama，支持流式输出）")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8090, help="监听端口")
+    parser.add_argument("--first-token-ms", type=float, default=200.0, help="首段延迟（毫秒）")
+    parser.add_argument("--token-delay-ms", type=float, default=20.0, help="后续每段的间隔（毫秒）")
+    parser.add_argument("--tokens", type=int, default=40, help="回答分成的段数")
+    args = parser.parse_args()
+
+    MockLLMHandler.first_token_delay = args.first_token_ms / 1000
+    MockLLMHandler.token_delay = args.token_delay_ms / 1000
+    MockLLMHandler.n_tokens = max(1, args.tokens)
+
+    server = ThreadingHTTPServer((args.host, args.port), MockLLMHandler)
+    logger.info(f"模拟LLM服务已启动: http://{args.host}:{args.port}（OpenAI base_url 使用 http://{args.host}:{args.port}/v1）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("服务已停止")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
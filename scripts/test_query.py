@@ -4,9 +4,10 @@
 """
 
 import sys
+import time
 import logging
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 # 添加项目根目录到路径
 project_root = Path(__file__).parent.parent
@@ -22,7 +23,7 @@ if rag_system_init.exists():
     sys.modules["rag_system"] = rag_system_module
     spec.loader.exec_module(rag_system_module)
     # 导入子模块
-    for module_file in ["config", "embedding", "vector_store", "retriever", "rag_chain"]:
+    for module_file in ["config", "embedding_cache", "lru_cache", "onnx_backend", "micro_batcher", "embedding_server", "m3_vectors", "embedding", "bm25_index", "numpy_store", "vector_store", "pattern_matcher", "index_catalog", "reranker", "result_cache", "semantic_cache", "retriever", "rag_chain"]:
         module_path = rag_system_path / f"{module_file}.py"
         if module_path.exists():
             spec = importlib.util.spec_from_file_location(f"rag_system.{module_file}", module_path)
@@ -31,12 +32,15 @@ if rag_system_init.exists():
             spec.loader.exec_module(module)
 
 from rag_system.config import (
-    INDEX_DIR, VECTOR_DB_DIR, COLLECTION_NAME,
+    INDEX_DIR, VECTOR_DB_DIR, VECTOR_DB_TYPE, COLLECTION_NAME,
     EMBEDDING_MODEL, EMBEDDING_DEVICE, TOP_K
 )
-from rag_system.embedding import EmbeddingModel
+from rag_system.embedding import create_embedding_model
 from rag_system.vector_store import VectorStore
 from rag_system.retriever import HybridRetriever
+from rag_system.reranker import create_reranker
+from rag_system.result_cache import create_result_cache
+from rag_system.semantic_cache import create_semantic_cache
 from rag_system.rag_chain import RAGChain
 
 # 配置日志
@@ -70,6 +74,38 @@ TEST_QUERIES = [
     "如何保持初心",
 ]
 
+# 组件只初始化一次，批量/交互测试的每次查询复用同一个模型
+_retriever: Optional[HybridRetriever] = None
+_rag_chains: Dict[bool, RAGChain] = {}
+_semantic_cache = create_semantic_cache()  # 各RAG链共享（LLM是否启用已计入比较范围）
+
+def get_retriever() -> HybridRetriever:
+    """
+    获取检索器（首次调用时初始化）
+    
+    本机运行着 scripts/embedding_server.py 时以客户端模式连接，不加载本地模型
+    """
+    global _retriever
+    if _retriever is None:
+        embedding_model = create_embedding_model(EMBEDDING_MODEL, EMBEDDING_DEVICE)
+        vector_store = VectorStore(VECTOR_DB_DIR, COLLECTION_NAME, read_only=VECTOR_DB_TYPE == "numpy")
+        _retriever = HybridRetriever(
+            vector_store, embedding_model, INDEX_DIR,
+            reranker=create_reranker(),
+            result_cache=create_result_cache()
+        )
+    return _retriever
+
+def get_rag_chain(use_llm: bool = False) -> RAGChain:
+    """获取RAG链（按是否使用LLM各初始化一次）"""
+    if use_llm not in _rag_chains:
+        retriever = get_retriever()
+        _rag_chains[use_llm] = RAGChain(
+            retriever, llm_provider="openai", use_llm=use_llm,
+            result_cache=retriever.result_cache, semantic_cache=_semantic_cache
+        )
+    return _rag_chains[use_llm]
+
 def test_retrieval(query: str, top_k: int = TOP_K) -> Dict:
     """
     测试检索功能
@@ -81,19 +117,19 @@ def test_retrieval(query: str, top_k: int = TOP_K) -> Dict:
     Returns:
         检索结果
     """
-    logger.info(f"\n{'='*60}")
-    logger.info(f"查询: {query}")
-    logger.info(f"{'='*60}")
-    
-    # 初始化组件
-    embedding_model = EmbeddingModel(EMBEDDING_MODEL, EMBEDDING_DEVICE)
-    vector_store = VectorStore(VECTOR_DB_DIR, COLLECTION_NAME)
-    retriever = HybridRetriever(vector_store, embedding_model, INDEX_DIR)
+    retriever = get_retriever()
     
     # 执行检索
     results = retriever.retrieve(query, top_k=top_k)
     
-    # 显示结果
+    return _log_retrieval(query, results)
+
+def _log_retrieval(query: str, results: List[Dict]) -> Dict:
+    """显示检索结果"""
+    logger.info(f"\n{'='*60}")
+    logger.info(f"查询: {query}")
+    logger.info(f"{'='*60}")
+    
     logger.info(f"\n检索到 {len(results)} 个结果:\n")
     for i, result in enumerate(results, 1):
         doc_id = result['doc_id']
@@ -126,11 +162,7 @@ def test_rag_chain(query: str, top_k: int = TOP_K, use_llm: bool = False) -> Dic
     logger.info(f"RAG查询: {query}")
     logger.info(f"{'='*60}")
     
-    # 初始化组件
-    embedding_model = EmbeddingModel(EMBEDDING_MODEL, EMBEDDING_DEVICE)
-    vector_store = VectorStore(VECTOR_DB_DIR, COLLECTION_NAME)
-    retriever = HybridRetriever(vector_store, embedding_model, INDEX_DIR)
-    rag_chain = RAGChain(retriever, llm_provider="openai", use_llm=use_llm)
+    rag_chain = get_rag_chain(use_llm)
     
     # 执行RAG查询
     result = rag_chain.query(query, top_k=top_k, use_llm=use_llm)
@@ -155,6 +187,52 @@ def test_rag_chain(query: str, top_k: int = TOP_K, use_llm: bool = False) -> Dic
     
     return result
 
+def test_rag_chain_stream(query: str, top_k: int = TOP_K, use_llm: bool = False) -> Dict:
+    """
+    测试流式RAG链：检索结果先输出，回答逐段打印
+    
+    Args:
+        query: 查询文本
+        top_k: 返回结果数量
+        use_llm: 是否使用LLM生成回答
+        
+    Returns:
+        RAG结果
+    """
+    logger.info(f"\n{'='*60}")
+    logger.info(f"RAG流式查询: {query}")
+    logger.info(f"{'='*60}")
+    
+    rag_chain = get_rag_chain(use_llm)
+    
+    start = time.perf_counter()
+    first_token_ms = None
+    result = None
+    for event in rag_chain.query_stream(query, top_k=top_k, use_llm=use_llm):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if event['type'] == 'retrieval':
+            logger.info(f"检索完成（{elapsed_ms:.0f} ms），来源文档:")
+            for i, source in enumerate(event['sources'], 1):
+                logger.info(f"  [{i}] {source['doc_id']} - {source['title']}")
+            if use_llm and rag_chain.llm:
+                logger.info("\n生成的回答:")
+        elif event['type'] == 'token':
+            if first_token_ms is None:
+                first_token_ms = elapsed_ms
+            sys.stdout.write(event['text'])
+            sys.stdout.flush()
+        elif event['type'] == 'done':
+            result = event['result']
+    total_ms = (time.perf_counter() - start) * 1000
+    
+    if first_token_ms is not None:
+        sys.stdout.write("\n")
+        logger.info(f"首段回答 {first_token_ms:.0f} ms，完成 {total_ms:.0f} ms")
+    else:
+        logger.info(f"完成 {total_ms:.0f} ms（未生成回答）")
+    
+    return result
+
 def run_batch_tests(queries: List[str] = None, mode: str = "retrieval"):
     """
     批量运行测试
@@ -172,17 +250,27 @@ def run_batch_tests(queries: List[str] = None, mode: str = "retrieval"):
     logger.info("=" * 60)
     
     results = []
-    for i, query in enumerate(queries, 1):
-        logger.info(f"\n[{i}/{len(queries)}]")
+    if mode == "retrieval":
+        # 所有查询一次批量向量化、一次多向量检索
         try:
-            if mode == "retrieval":
-                result = test_retrieval(query)
-            else:
-                result = test_rag_chain(query, use_llm=False)
-            results.append(result)
+            batch_results = get_retriever().retrieve_many(queries)
         except Exception as e:
-            logger.error(f"测试查询失败: {query} - {e}")
-            results.append({'query': query, 'error': str(e)})
+            logger.error(f"批量检索失败: {e}")
+            batch_results = [e] * len(queries)
+        for i, (query, query_results) in enumerate(zip(queries, batch_results), 1):
+            logger.info(f"\n[{i}/{len(queries)}]")
+            if isinstance(query_results, Exception):
+                results.append({'query': query, 'error': str(query_results)})
+            else:
+                results.append(_log_retrieval(query, query_results))
+    else:
+        for i, query in enumerate(queries, 1):
+            logger.info(f"\n[{i}/{len(queries)}]")
+            try:
+                results.append(test_rag_chain(query, use_llm=False))
+            except Exception as e:
+                logger.error(f"测试查询失败: {query} - {e}")
+                results.append({'query': query, 'error': str(e)})
     
     # 统计信息
     logger.info("\n" + "=" * 60)
@@ -191,6 +279,25 @@ def run_batch_tests(queries: List[str] = None, mode: str = "retrieval"):
     successful = sum(1 for r in results if 'error' not in r)
     logger.info(f"成功: {successful}/{len(results)}")
     logger.info(f"失败: {len(results) - successful}/{len(results)}")
+    rerank_stats = get_retriever().get_rerank_stats()
+    if rerank_stats:
+        logger.info(
+            f"交叉编码器重排序: {rerank_stats['requests']} 次，平均耗时 {rerank_stats['avg_ms']:.1f} ms"
+            f"（打分 {rerank_stats['scored']}，缓存命中 {rerank_stats['cached']}，跳过 {rerank_stats['skipped']}）"
+        )
+    cache_stats = get_retriever().get_result_cache_stats()
+    if cache_stats:
+        logger.info(
+            f"结果缓存: 内存命中 {cache_stats['memory_hits']}，磁盘命中 {cache_stats['disk_hits']}，"
+            f"未命中 {cache_stats['misses']}（索引版本 {cache_stats['index_version']}）"
+        )
+    for chain in _rag_chains.values():
+        chain_stats = chain.get_cache_stats()
+        if chain_stats['semantic_cache']:
+            logger.info(
+                f"问答缓存（LLM={'启用' if chain.use_llm else '关闭'}）: 精确命中 {chain_stats['exact_hits']}，"
+                f"语义命中 {chain_stats['semantic_hits']}，未命中 {chain_stats['misses']}"
+            )
     
     return results
 
@@ -226,8 +333,14 @@ def main():
         action="store_true",
         help="使用LLM生成回答（仅rag模式）"
     )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="流式输出回答（仅rag模式）"
+    )
     
     args = parser.parse_args()
+    run_rag = test_rag_chain_stream if args.stream else test_rag_chain
     
     try:
         if args.batch:
@@ -238,7 +351,7 @@ def main():
             if args.mode == "retrieval":
                 test_retrieval(args.query, top_k=args.top_k)
             else:
-                test_rag_chain(args.query, top_k=args.top_k, use_llm=args.use_llm)
+                run_rag(args.query, top_k=args.top_k, use_llm=args.use_llm)
         else:
             # 交互式测试
             logger.info("RAG系统测试工具")
@@ -255,7 +368,7 @@ def main():
                     if args.mode == "retrieval":
                         test_retrieval(query, top_k=args.top_k)
                     else:
-                        test_rag_chain(query, top_k=args.top_k, use_llm=args.use_llm)
+                        run_rag(query, top_k=args.top_k, use_llm=args.use_llm)
                 except Exception as e:
                     logger.error(f"查询失败: {e}")
     
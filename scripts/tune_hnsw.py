@@ -0,0 +1,264 @@
+"""
+HNSW参数调优
+用向量库中的真实向量扫描 M / construction_ef / search_ef 的组合，以精确检索结果为基准
+测量每组参数的召回率与查询延迟，选出满足目标召回率且延迟最低的一组
+
+用法：
+    python scripts/tune_hnsw.py                               # 默认网格，目标召回率0.95
+    python scripts/tune_hnsw.py --target-recall 0.98 --k 20
+    python scripts/tune_hnsw.py --queries-file queries.txt    # 用真实问题（每行一个）代替抽样的块向量
+    python scripts/tune_hnsw.py --apply                       # 记录结果，下次 build_index.py --reset 时生效
+"""
+
+import sys
+import json
+import time
+import uuid
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# 处理 rag-system 目录的导入（目录名包含连字符，不能直接导入）
+import importlib.util
+rag_system_path = project_root / "rag-system"
+rag_system_init = rag_system_path / "__init__.py"
+if rag_system_init.exists():
+    spec = importlib.util.spec_from_file_location("rag_system", rag_system_init)
+    rag_system_module = importlib.util.module_from_spec(spec)
+    sys.modules["rag_system"] = rag_system_module
+    spec.loader.exec_module(rag_system_module)
+    # 导入子模块
+    for module_file in ["config", "embedding_cache", "lru_cache", "onnx_backend", "micro_batcher", "embedding_server", "m3_vectors", "embedding", "bm25_index", "numpy_store", "vector_store"]:
+        module_path = rag_system_path / f"{module_file}.py"
+        if module_path.exists():
+            spec = importlib.util.spec_from_file_location(f"rag_system.{module_file}", module_path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[f"rag_system.{module_file}"] = module
+            spec.loader.exec_module(module)
+
+from rag_system.config import VECTOR_DB_DIR, VECTOR_DB_TYPE, COLLECTION_NAME, TOP_K, EMBEDDING_MODEL, EMBEDDING_DEVICE
+from rag_system.vector_store import VectorStore, HNSW_PARAMS_FILE, resolve_hnsw_params, hnsw_metadata
+from rag_system.numpy_store import _top_k
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def load_vectors(page_size: int = 1000) -> np.ndarray:
+    """分页读取向量库中的全部向量（按行归一化）"""
+    store = VectorStore(VECTOR_DB_DIR, COLLECTION_NAME, sparse_index=False, backend="chroma", read_only=False)
+    pages = []
+    offset = 0
+    while True:
+        page = store.collection.get(include=['embeddings'], limit=page_size, offset=offset)
+        if not page['ids']:
+            break
+        pages.append(np.asarray(page['embeddings'], dtype=np.float32))
+        offset += len(page['ids'])
+    if not pages:
+        return np.zeros((0, 0), dtype=np.float32)
+    vectors = np.concatenate(pages)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def load_queries(
+    vectors: np.ndarray,
+    n_queries: int,
+    queries_file: Optional[Path],
+    seed: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    准备查询向量和参与建图的向量
+
+    Args:
+        vectors: 库中的全部向量
+        n_queries: 抽样的查询数量（未指定queries_file时）
+        queries_file: 问题文件（每行一个），用Embedding模型向量化
+        seed: 抽样随机种子
+
+    Returns:
+        (查询向量矩阵, 建图用的向量矩阵)；抽样的块不参与建图，否则每条查询都能命中自身，召回率虚高
+    """
+    if queries_file is not None:
+        from rag_system.embedding import create_embedding_model
+
+        queries = [line.strip() for line in queries_file.read_text(encoding='utf-8').splitlines() if line.strip()]
+        model = create_embedding_model(EMBEDDING_MODEL, EMBEDDING_DEVICE)
+        return np.asarray(model.encode_queries(queries), dtype=np.float32), vectors
+
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vectors), size=min(n_queries, len(vectors) - 1), replace=False)
+    held_out = np.zeros(len(vectors), dtype=bool)
+    held_out[rows] = True
+    return vectors[held_out], vectors[~held_out]
+
+def measure(
+    client,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    truth: List[set],
+    params: Dict[str, int],
+    k: int,
+    batch_size: int = 1000
+) -> Dict:
+    """
+    用一组HNSW参数建立临时集合，测量构建耗时、召回率和单条查询延迟
+
+    Returns:
+        {**params, 'recall', 'p50_ms', 'p99_ms', 'build_s'}
+    """
+    name = f"hnsw_tune_{uuid.uuid4().hex[:8]}"
+    collection = client.create_collection(name=name, metadata=hnsw_metadata(params))
+    try:
+        ids = [str(i) for i in range(len(vectors))]
+        start = time.perf_counter()
+        for i in range(0, len(vectors), batch_size):
+            collection.add(ids=ids[i:i + batch_size], embeddings=vectors[i:i + batch_size].tolist())
+        build_s = time.perf_counter() - start
+
+        latencies = []
+        hits = 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            result = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(expected.intersection(int(i) for i in result['ids'][0]))
+    finally:
+        client.delete_collection(name=name)
+
+    return {
+        **params,
+        'recall': round(hits / max(sum(len(expected) for expected in truth), 1), 4),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'build_s': round(build_s, 2)
+    }
+
+def choose(results: List[Dict], target_recall: float) -> Dict:
+    """选出达到目标召回率且p50延迟最低的参数；都达不到时选召回率最高的"""
+    qualified = [r for r in results if r['recall'] >= target_recall]
+    if qualified:
+        return min(qualified, key=lambda r: (r['p50_ms'], r['M'], r['construction_ef'], r['search_ef']))
+    logger.warning(f"没有参数组合达到目标召回率 {target_recall}，选择召回率最高的一组")
+    return max(results, key=lambda r: (r['recall'], -r['p50_ms']))
+
+def run_sweep(
+    m_values: List[int],
+    construction_efs: List[int],
+    search_efs: List[int],
+    k: int,
+    target_recall: float,
+    n_queries: int,
+    queries_file: Optional[Path] = None,
+    seed: int = 0,
+    apply: bool = False
+):
+    """扫描参数网格并输出结果"""
+    import chromadb
+
+    all_vectors = load_vectors()
+    if len(all_vectors) < 2:
+        logger.error("向量库中的块太少，请先运行 build_index.py")
+        return
+    queries, vectors = load_queries(all_vectors, n_queries, queries_file, seed)
+    k = min(k, len(vectors))
+
+    # 精确检索作为基准
+    truth_rows, _ = _top_k(vectors, queries, k)
+    truth = [set(rows) for rows in truth_rows]
+
+    logger.info(f"块数: {len(all_vectors)}（建图 {len(vectors)}）  维度: {vectors.shape[1]}  查询数: {len(queries)}  k: {k}")
+    current = resolve_hnsw_params(VECTOR_DB_DIR)
+    logger.info(f"当前参数: {current}")
+
+    client = chromadb.EphemeralClient()
+    results = []
+    for m in m_values:
+        for construction_ef in construction_efs:
+            for search_ef in search_efs:
+                params = {'M': m, 'construction_ef': construction_ef, 'search_ef': search_ef}
+                result = measure(client, vectors, queries, truth, params, k)
+                results.append(result)
+                logger.info(
+                    f"M={m:<3} construction_ef={construction_ef:<4} search_ef={search_ef:<4} "
+                    f"recall@{k}={result['recall']:.4f}  p50={result['p50_ms']:.3f}ms  "
+                    f"p99={result['p99_ms']:.3f}ms  构建={result['build_s']:.2f}s"
+                )
+
+    chosen = choose(results, target_recall)
+    logger.info("=" * 60)
+    logger.info(
+        f"推荐参数: M={chosen['M']} construction_ef={chosen['construction_ef']} search_ef={chosen['search_ef']} "
+        f"(recall@{k}={chosen['recall']:.4f}, p50={chosen['p50_ms']:.3f}ms)"
+    )
+
+    if apply:
+        params_file = VECTOR_DB_DIR / HNSW_PARAMS_FILE
+        record = {
+            'chosen': {key: chosen[key] for key in ('M', 'construction_ef', 'search_ef')},
+            'metrics': {key: chosen[key] for key in ('recall', 'p50_ms', 'p99_ms', 'build_s')},
+            'k': k,
+            'target_recall': target_recall,
+            'collection': COLLECTION_NAME,
+            'chunk_count': len(all_vectors),
+            'query_count': len(queries),
+            'tuned_at': datetime.now().isoformat(timespec='seconds'),
+            'sweep': results
+        }
+        tmp_path = params_file.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(params_file)
+        logger.info(f"已写入 {params_file}，运行 python scripts/build_index.py --reset 后生效")
+
+def main():
+    """主函数"""
+    import argparse
+
+    def int_list(value: str) -> List[int]:
+        return [int(v) for v in value.split(',') if v.strip()]
+
+    parser = argparse.ArgumentParser(description="HNSW参数召回率/延迟扫描")
+    parser.add_argument("--m", type=int_list, default=[8, 16, 32], help="M 取值（逗号分隔）")
+    parser.add_argument("--construction-ef", type=int_list, default=[64, 100, 200], help="construction_ef 取值（逗号分隔）")
+    parser.add_argument("--search-ef", type=int_list, default=[10, 32, 64, 128], help="search_ef 取值（逗号分隔）")
+    parser.add_argument("--k", type=int, default=TOP_K * 3, help="计算召回率的结果数（默认与检索召回数一致）")
+    parser.add_argument("--target-recall", type=float, default=0.95, help="目标召回率")
+    parser.add_argument("--queries", type=int, default=200, help="从库中抽样作为查询的块数")
+    parser.add_argument("--queries-file", type=Path, default=None, help="问题文件（每行一个），指定后不再抽样")
+    parser.add_argument("--seed", type=int, default=0, help="抽样随机种子")
+    parser.add_argument("--apply", action="store_true", help=f"将推荐参数写入 {HNSW_PARAMS_FILE}")
+
+    args = parser.parse_args()
+
+    if not 0 < args.target_recall <= 1:
+        parser.error("--target-recall 必须在 (0, 1] 范围内")
+    if args.k <= 0:
+        parser.error("--k 必须大于0")
+    if VECTOR_DB_TYPE != "chroma":
+        parser.error(f"HNSW参数只对Chroma后端有效，当前 VECTOR_DB_TYPE={VECTOR_DB_TYPE}（NumPy后端本身就是精确检索）")
+
+    run_sweep(
+        m_values=args.m,
+        construction_efs=args.construction_ef,
+        search_efs=args.search_ef,
+        k=args.k,
+        target_recall=args.target_recall,
+        n_queries=args.queries,
+        queries_file=args.queries_file,
+        seed=args.seed,
+        apply=args.apply
+    )
+
+if __name__ == "__main__":
+    main()
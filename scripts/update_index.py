@@ -1,12 +1,17 @@
 """
 更新索引脚本
-用于增量更新单个或部分文档的索引
+用于增量更新单个或部分文档的索引：
+按文件哈希清单找出变化的文档，按块对比后只删除/写入/跳过需要变动的块
+
+用法：
+    python scripts/update_index.py DOC-D001 DOC-S010   # 更新指定文档
+    python scripts/update_index.py --changed           # 自动更新所有修改过的文档
 """
 
 import sys
 import logging
 from pathlib import Path
-from typing import List
+from typing import List, Dict
 
 # 添加项目根目录到路径
 project_root = Path(__file__).parent.parent
@@ -22,7 +27,7 @@ if rag_system_init.exists():
     sys.modules["rag_system"] = rag_system_module
     spec.loader.exec_module(rag_system_module)
     # 导入子模块
-    for module_file in ["config", "embedding", "document_loader", "vector_store"]:
+    for module_file in ["config", "embedding_cache", "lru_cache", "onnx_backend", "micro_batcher", "embedding_server", "m3_vectors", "embedding", "pattern_matcher", "index_catalog", "document_loader", "bm25_index", "numpy_store", "vector_store", "result_cache", "indexer"]:
         module_path = rag_system_path / f"{module_file}.py"
         if module_path.exists():
             spec = importlib.util.spec_from_file_location(f"rag_system.{module_file}", module_path)
@@ -32,11 +37,12 @@ if rag_system_init.exists():
 
 from rag_system.config import (
     INDEX_DIR, VECTOR_DB_DIR, COLLECTION_NAME,
-    EMBEDDING_MODEL, EMBEDDING_DEVICE, DOC_MAPPING
+    EMBEDDING_MODEL, EMBEDDING_DEVICE, EMBEDDING_CACHE_ENABLED, DOC_MAPPING
 )
-from rag_system.embedding import EmbeddingModel
+from rag_system.embedding import create_embedding_model
 from rag_system.document_loader import DocumentLoader
 from rag_system.vector_store import VectorStore
+from rag_system.indexer import IncrementalIndexer
 
 # 配置日志
 logging.basicConfig(
@@ -45,79 +51,86 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def update_document(doc_id: str, delete_old: bool = True):
+def update_documents(
+    doc_ids: List[str],
+    delete_old: bool = True,
+    use_cache: bool = EMBEDDING_CACHE_ENABLED,
+    force: bool = True
+):
     """
-    更新单个文档的索引
+    批量更新文档索引（按块对比，只删除/写入/跳过需要变动的块）
     
     Args:
-        doc_id: 文档ID
-        delete_old: 是否删除旧的文档块
+        doc_ids: 文档ID列表
+        delete_old: 是否删除已不存在的旧文档块
+        use_cache: 是否使用Embedding磁盘缓存
+        force: 即使文件哈希未变化也重新对比（明确指定的文档默认总是对比，False时跳过哈希未变的文档）
     """
-    logger.info(f"更新文档索引: {doc_id}")
-    
-    # 初始化组件
-    embedding_model = EmbeddingModel(EMBEDDING_MODEL, EMBEDDING_DEVICE)
-    vector_store = VectorStore(VECTOR_DB_DIR, COLLECTION_NAME)
-    document_loader = DocumentLoader()
-    
-    # 删除旧的文档块（如果需要）
-    if delete_old:
-        # 注意：Chroma不直接支持按metadata删除，需要先查询再删除
-        # 这里简化处理，实际可能需要更复杂的逻辑
-        logger.info(f"删除文档 {doc_id} 的旧索引...")
-        # TODO: 实现删除逻辑
-    
-    # 加载文档
-    try:
-        doc = document_loader.load_document(doc_id)
-    except Exception as e:
-        logger.error(f"加载文档失败: {e}")
-        return False
-    
-    # 分块
-    chunks = document_loader.chunk_document(doc)
-    logger.info(f"文档分块完成，共 {len(chunks)} 个块")
+    logger.info(f"批量更新 {len(doc_ids)} 个文档的索引")
     
-    # 向量化
-    chunk_texts = [chunk['content'] for chunk in chunks]
-    embeddings = embedding_model.encode_batch(
-        chunk_texts,
-        batch_size=32,
-        show_progress_bar=True
-    )
+    # 初始化组件（所有文档共用一次模型加载）
+    indexer = _create_indexer(use_cache)
     
-    # 生成ID
-    chunk_ids = [
-        f"{doc_id}_{chunk['chunk_type']}_{chunk.get('chunk_index', chunk.get('pattern_index', chunk.get('example_index', 0)))}"
-        for chunk in chunks
+    results = [
+        indexer.sync_document(doc_id, force=force, delete_stale=delete_old)
+        for doc_id in doc_ids
     ]
     
-    # 添加到向量数据库
-    try:
-        vector_store.add_documents(chunks, embeddings, chunk_ids)
-        logger.info(f"✅ 文档 {doc_id} 索引更新成功")
-        return True
-    except Exception as e:
-        logger.error(f"❌ 文档 {doc_id} 索引更新失败: {e}")
-        return False
+    _log_results(results, indexer)
+    return sum(1 for r in results if r['status'] != 'failed')
 
-def update_documents(doc_ids: List[str], delete_old: bool = True):
+def update_document(
+    doc_id: str,
+    delete_old: bool = True,
+    use_cache: bool = EMBEDDING_CACHE_ENABLED,
+    force: bool = True
+) -> bool:
     """
-    批量更新文档索引
+    更新单个文档的索引
     
     Args:
-        doc_ids: 文档ID列表
-        delete_old: 是否删除旧的文档块
+        doc_id: 文档ID
+        delete_old: 是否删除已不存在的旧文档块
+        use_cache: 是否使用Embedding磁盘缓存
+        force: 即使文件哈希未变化也重新对比（默认开启）
     """
-    logger.info(f"批量更新 {len(doc_ids)} 个文档的索引")
+    return update_documents([doc_id], delete_old, use_cache, force) == 1
+
+def update_changed(use_cache: bool = EMBEDDING_CACHE_ENABLED):
+    """
+    自动找出自上次索引后修改过的文档（Markdown或YAML索引）并增量更新
     
-    success_count = 0
-    for doc_id in doc_ids:
-        if update_document(doc_id, delete_old):
-            success_count += 1
+    Args:
+        use_cache: 是否使用Embedding磁盘缓存
+    """
+    indexer = _create_indexer(use_cache)
+    results = indexer.sync_changed()
+    _log_results(results, indexer)
+    return sum(1 for r in results if r['status'] != 'failed')
+
+def _create_indexer(use_cache: bool) -> IncrementalIndexer:
+    """初始化增量索引器"""
+    embedding_model = create_embedding_model(EMBEDDING_MODEL, EMBEDDING_DEVICE, use_cache=use_cache)
+    vector_store = VectorStore(VECTOR_DB_DIR, COLLECTION_NAME)
+    return IncrementalIndexer(embedding_model, vector_store, DocumentLoader())
+
+def _log_results(results: List[Dict], indexer: IncrementalIndexer):
+    """显示更新统计"""
+    failed = [r['doc_id'] for r in results if r['status'] == 'failed']
+    totals = {
+        key: sum(r[key] for r in results)
+        for key in ['added', 'updated', 'deleted', 'skipped']
+    }
+    logger.info(
+        f"更新完成: {len(results) - len(failed)}/{len(results)} 成功 "
+        f"(新增 {totals['added']}，更新 {totals['updated']}，删除 {totals['deleted']}，跳过 {totals['skipped']} 个块)"
+    )
+    if failed:
+        logger.warning(f"更新失败的文档: {failed}")
     
-    logger.info(f"更新完成: {success_count}/{len(doc_ids)} 成功")
-    return success_count
+    cache_stats = indexer.embedding_model.get_cache_stats()
+    if cache_stats:
+        logger.info(f"Embedding缓存: 命中 {cache_stats['hits']} / 未命中 {cache_stats['misses']}")
 
 def main():
     """主函数"""
@@ -126,17 +139,35 @@ def main():
     parser = argparse.ArgumentParser(description="更新RAG知识库索引")
     parser.add_argument(
         "doc_ids",
-        nargs="+",
-        help="要更新的文档ID列表（如 DOC-D001 DOC-S010）"
+        nargs="*",
+        help="要更新的文档ID列表（如 DOC-D001 DOC-S010），即使文件未变化也会重新对比所有块"
+    )
+    parser.add_argument(
+        "--changed",
+        action="store_true",
+        help="自动检测自上次索引后修改过的文档并更新"
     )
     parser.add_argument(
         "--no-delete",
         action="store_true",
-        help="不删除旧的文档块（可能导致重复）"
+        help="不删除已不存在的旧文档块（可能导致残留）"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="不使用Embedding磁盘缓存"
+    )
+    parser.add_argument(
+        "--rebuild-bm25",
+        action="store_true",
+        help="从向量库重建BM25关键词索引（检索进程不再自行重建）"
     )
     
     args = parser.parse_args()
     
+    if not args.doc_ids and not args.changed and not args.rebuild_bm25:
+        parser.error("请指定文档ID，或使用 --changed 自动检测修改过的文档")
+    
     # 验证文档ID
     invalid_ids = [doc_id for doc_id in args.doc_ids if doc_id not in DOC_MAPPING]
     if invalid_ids:
@@ -145,7 +176,16 @@ def main():
         sys.exit(1)
     
     try:
-        update_documents(args.doc_ids, delete_old=not args.no_delete)
+        if args.rebuild_bm25:
+            VectorStore(VECTOR_DB_DIR, COLLECTION_NAME).rebuild_sparse_index()
+        if args.changed:
+            update_changed(use_cache=not args.no_cache)
+        if args.doc_ids:
+            update_documents(
+                args.doc_ids,
+                delete_old=not args.no_delete,
+                use_cache=not args.no_cache
+            )
     except KeyboardInterrupt:
         logger.info("\n用户中断操作")
     except Exception as e:
@@ -0,0 +1,328 @@
+"""
+索引监听脚本
+常驻运行，监听 01-dao/、02-shu/、rag-index/indexes/ 等目录下的文档和YAML索引变化，
+去抖合并后映射回 DOC_MAPPING 中的文档ID，在后台用常驻的Embedding模型增量更新索引
+
+用法：
+    python scripts/watch_index.py                 # 启动监听（启动时先同步一次离线期间的修改）
+    python scripts/watch_index.py --debounce 5    # 保存后静默5秒再更新
+"""
+
+import os
+import sys
+import time
+import queue
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# 处理 rag-system 目录的导入（目录名包含连字符，不能直接导入）
+import importlib.util
+rag_system_path = project_root / "rag-system"
+rag_system_init = rag_system_path / "__init__.py"
+if rag_system_init.exists():
+    spec = importlib.util.spec_from_file_location("rag_system", rag_system_init)
+    rag_system_module = importlib.util.module_from_spec(spec)
+    sys.modules["rag_system"] = rag_system_module
+    spec.loader.exec_module(rag_system_module)
+    # 导入子模块
+    for module_file in ["config", "embedding_cache", "lru_cache", "onnx_backend", "micro_batcher", "embedding_server", "m3_vectors", "embedding", "pattern_matcher", "index_catalog", "document_loader", "bm25_index", "numpy_store", "vector_store", "result_cache", "indexer"]:
+        module_path = rag_system_path / f"{module_file}.py"
+        if module_path.exists():
+            spec = importlib.util.spec_from_file_location(f"rag_system.{module_file}", module_path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[f"rag_system.{module_file}"] = module
+            spec.loader.exec_module(module)
+
+from rag_system.config import (
+    DOCS_DIR, INDEX_DIR, VECTOR_DB_DIR, COLLECTION_NAME,
+    EMBEDDING_MODEL, EMBEDDING_DEVICE, EMBEDDING_CACHE_ENABLED,
+    WATCH_INTERVAL, WATCH_DEBOUNCE, DOC_MAPPING, get_doc_file_path
+)
+from rag_system.embedding import create_embedding_model
+from rag_system.document_loader import DocumentLoader
+from rag_system.vector_store import VectorStore
+from rag_system.indexer import IncrementalIndexer
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 监听的目录（此外还会单独监听 DOC_MAPPING 中位于这些目录之外的文档）
+WATCH_ROOTS = [
+    DOCS_DIR / "01-dao",
+    DOCS_DIR / "02-shu",
+    INDEX_DIR,
+]
+WATCH_SUFFIXES = {".md", ".yaml"}
+
+# 文件快照：{路径: (mtime_ns, size)}
+Snapshot = Dict[Path, Tuple[int, int]]
+
+class DocPathMapper:
+    """把文件路径映射回 DOC_MAPPING 中的文档ID"""
+    
+    def __init__(self):
+        self.path_to_doc: Dict[Path, str] = {}
+        self.name_to_doc: Dict[str, str] = {}
+        self.refresh()
+    
+    def refresh(self):
+        """重新解析所有文档的实际路径（文档被移动或新建后调用）"""
+        self.path_to_doc = {}
+        for doc_id, filename in DOC_MAPPING.items():
+            # DOC_MAPPING 中可能是相对路径，只用文件名兜底匹配新出现的文件
+            self.name_to_doc.setdefault(Path(filename).name, doc_id)
+            try:
+                self.path_to_doc[get_doc_file_path(doc_id).resolve()] = doc_id
+            except FileNotFoundError:
+                logger.debug(f"文档 {doc_id} 暂未找到对应文件")
+    
+    def doc_paths(self) -> List[Path]:
+        """所有已解析的文档路径"""
+        return list(self.path_to_doc.keys())
+    
+    def lookup(self, path: Path) -> Optional[str]:
+        """
+        路径 → 文档ID
+        
+        Args:
+            path: 变化的文件路径
+        
+        Returns:
+            文档ID，不属于知识库的文件返回None
+        """
+        if path.suffix == ".yaml":
+            return path.stem if path.stem in DOC_MAPPING else None
+        
+        doc_id = self.path_to_doc.get(path.resolve())
+        if doc_id:
+            return doc_id
+        return self.name_to_doc.get(path.name)
+
+def take_snapshot(extra_paths: List[Path]) -> Snapshot:
+    """
+    扫描监听目录，记录文件的修改时间和大小
+    
+    Args:
+        extra_paths: 监听目录之外需要单独监听的文件
+    
+    Returns:
+        文件快照
+    """
+    snapshot: Snapshot = {}
+    for root in WATCH_ROOTS:
+        if not root.exists():
+            continue
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                if path.suffix not in WATCH_SUFFIXES:
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                snapshot[path.resolve()] = (stat.st_mtime_ns, stat.st_size)
+    
+    for path in extra_paths:
+        if path in snapshot:
+            continue
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+    
+    return snapshot
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> List[Path]:
+    """对比两次快照，返回新增、修改和删除的文件"""
+    changed = [path for path, sig in new.items() if old.get(path) != sig]
+    removed = [path for path in old if path not in new]
+    return changed + removed
+
+class Debouncer:
+    """
+    去抖合并：同一文档在静默 debounce 秒后才触发一次更新，
+    持续保存时最多等待 max_wait 秒
+    """
+    
+    def __init__(self, debounce: float, max_wait: float):
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.first_seen: Dict[str, float] = {}
+        self.last_seen: Dict[str, float] = {}
+    
+    def touch(self, doc_id: str, now: float):
+        """记录一次变化事件"""
+        self.first_seen.setdefault(doc_id, now)
+        self.last_seen[doc_id] = now
+    
+    def pop_ready(self, now: float) -> List[str]:
+        """取出已静默足够久（或等待超过上限）的文档"""
+        ready = [
+            doc_id for doc_id, last in self.last_seen.items()
+            if now - last >= self.debounce or now - self.first_seen[doc_id] >= self.max_wait
+        ]
+        for doc_id in ready:
+            del self.first_seen[doc_id]
+            del self.last_seen[doc_id]
+        return ready
+
+class ReindexWorker(threading.Thread):
+    """后台更新线程：持有常驻的Embedding模型，依次处理待更新的文档"""
+    
+    def __init__(self, indexer: IncrementalIndexer):
+        super().__init__(name="reindex-worker", daemon=True)
+        self.indexer = indexer
+        self.queue: "queue.Queue[Optional[List[str]]]" = queue.Queue()
+    
+    def submit(self, doc_ids: List[str]):
+        """提交一批待更新的文档"""
+        self.queue.put(doc_ids)
+    
+    def stop(self):
+        """处理完已提交的文档后退出"""
+        self.queue.put(None)
+        self.join()
+    
+    def run(self):
+        while True:
+            doc_ids = self.queue.get()
+            if doc_ids is None:
+                break
+            started = time.time()
+            for doc_id in doc_ids:
+                try:
+                    self._reindex(doc_id)
+                except Exception as e:
+                    logger.error(f"❌ 更新文档 {doc_id} 失败: {e}", exc_info=True)
+            logger.info(f"已处理 {len(doc_ids)} 个文档的变化，耗时 {time.time() - started:.1f}s")
+    
+    def _reindex(self, doc_id: str):
+        state = self.indexer.manifest.current_state(doc_id)
+        if state['doc_hash'] is None and state['index_hash'] is None:
+            # 文档和索引文件都已删除：从索引中移除
+            self.indexer.remove_document(doc_id)
+            return
+        # 文件哈希未变化（如只是touch）时会直接跳过
+        self.indexer.sync_document(doc_id)
+
+def watch(
+    interval: float = WATCH_INTERVAL,
+    debounce: float = WATCH_DEBOUNCE,
+    initial_sync: bool = True,
+    use_cache: bool = EMBEDDING_CACHE_ENABLED
+):
+    """
+    监听文件变化并自动增量更新索引
+    
+    Args:
+        interval: 轮询间隔（秒）
+        debounce: 去抖时间（秒），文件静默这么久后才更新
+        initial_sync: 启动时是否先同步离线期间修改过的文档
+        use_cache: 是否使用Embedding磁盘缓存
+    """
+    logger.info("=" * 60)
+    logger.info("启动索引监听（按 Ctrl+C 退出）")
+    logger.info("=" * 60)
+    
+    # 模型只加载一次，常驻内存
+    embedding_model = create_embedding_model(EMBEDDING_MODEL, EMBEDDING_DEVICE, use_cache=use_cache)
+    vector_store = VectorStore(VECTOR_DB_DIR, COLLECTION_NAME)
+    indexer = IncrementalIndexer(embedding_model, vector_store, DocumentLoader())
+    
+    if initial_sync:
+        logger.info("同步离线期间修改过的文档...")
+        indexer.sync_changed()
+    
+    worker = ReindexWorker(indexer)
+    worker.start()
+    
+    mapper = DocPathMapper()
+    debouncer = Debouncer(debounce, max_wait=max(debounce * 10, 30.0))
+    snapshot = take_snapshot(mapper.doc_paths())
+    logger.info(f"正在监听 {len(snapshot)} 个文件（轮询间隔 {interval}s，去抖 {debounce}s）")
+    
+    try:
+        while True:
+            time.sleep(interval)
+            now = time.time()
+            
+            new_snapshot = take_snapshot(mapper.doc_paths())
+            changed_paths = diff_snapshots(snapshot, new_snapshot)
+            
+            # 有新的Markdown文件出现时重新解析文档路径
+            if any(
+                path.suffix == ".md" and path not in snapshot and path not in mapper.path_to_doc
+                for path in changed_paths
+            ):
+                mapper.refresh()
+            snapshot = new_snapshot
+            
+            for path in changed_paths:
+                doc_id = mapper.lookup(path)
+                if doc_id:
+                    logger.info(f"检测到变化: {path.name} → {doc_id}")
+                    debouncer.touch(doc_id, now)
+            
+            ready = debouncer.pop_ready(now)
+            if ready:
+                worker.submit(ready)
+    except KeyboardInterrupt:
+        logger.info("\n停止监听，等待正在进行的更新完成...")
+    finally:
+        worker.stop()
+
+def main():
+    """主函数"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="监听文档变化并自动增量更新RAG索引")
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=WATCH_INTERVAL,
+        help="轮询间隔（秒）"
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=WATCH_DEBOUNCE,
+        help="去抖时间（秒），文件静默这么久后才触发更新"
+    )
+    parser.add_argument(
+        "--no-initial-sync",
+        action="store_true",
+        help="启动时不同步离线期间修改过的文档"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="不使用Embedding磁盘缓存"
+    )
+    
+    args = parser.parse_args()
+    
+    try:
+        watch(
+            interval=args.interval,
+            debounce=args.debounce,
+            initial_sync=not args.no_initial_sync,
+            use_cache=not args.no_cache
+        )
+    except Exception as e:
+        logger.error(f"索引监听失败: {e}", exc_info=True)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()